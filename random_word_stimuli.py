@@ -6,10 +6,36 @@ These words are grouped by same word ending (last two letters), and word-endings
 Then a random word from each word-ending group is selected to create a list of stimuli.
 This list of stimuli is then printed to the console.
 
+The words are looked up in a word index that is saved next to the word file ({filename}.index). It holds all unique 
+words grouped by length, and for every ending length by word ending, so any combination of the settings below can be 
+answered without reading the word file again. The index is rebuilt automatically when the word file changes.
+The settings can also be given on the command line, see --help.
+
+generate_stimulus_lists can be imported to create many independent stimulus lists at once (e.g. one per participant),
+with a seed for reproducibility and optionally without reusing words across lists. On the command line, --lists N 
+with --output FILE saves these lists as a .csv or .json file instead of printing a single list.
+
+filter_words applies several constraints in one pass over the word file: a range of word lengths, any number of 
+excluded strings (compiled into a single matcher), an optional set of allowed characters, and the word-ending groups 
+for several ending lengths at once. The word index is built with it, and the index selects words with the same 
+constraints (see compile_filter), which can be given on the command line: --max-length for a range of word lengths, 
+several --ending-length values, --exclude and --allowed. --benchmark-filter compares it with the original filter loop.
+
+--words FILE uses another word file, and --timings FILE saves the time spent reading the word file, grouping word
+endings, looking up the index and sampling, with counts of the words read and kept, as JSON (see stroop_timing.py).
+
 Created on Nov 14, 2019 ; Last modified on Nov 26, 2019
 Written by Emma Raat
 """
+import os
+import re
+import json
+import time
 import random
+import hashlib
+import argparse
+import numpy as np
+from stroop_timing import timings
 
 ### Settings ###
 filename = 'words.txt'
@@ -18,46 +44,392 @@ wordending_length = 2 #Note: This value cannot be bigger than  word_length
 word_minimum = 30 #Minimum amount of words for a word_ending to be selected as stimulus
 excluded_characters = ["'"] #Note: Only strings can be added in this list!
 # Any words containing one or more of the strings in this list will be excluded, eg adding 'od' will exclude odor, odds etcera.
+max_word_length = None #Select the words of word_length up to this length (integer), None selects only word_length
+allowed_characters = None #Only select words made of these characters, eg 'abcdefghijklmnopqrstuvwxyz'. None allows all
+index_version = 1 #Increase this when the layout of the word index changes, to force a rebuild
+
+### Filter engine ###
+def compile_excluded(excluded):
+    """
+    Compiles a list of excluded strings into one regular expression that finds any of them in a word.
+    The strings are first put in a trie, so strings that share a prefix share the same branch of the expression and
+    each position of a word is only checked once per prefix, instead of once per excluded string.
+    Returns None when there is nothing to exclude.
+    """
+    trie = {}
+    for string in excluded:
+        if string == '':
+            continue
+        node = trie
+        for character in string:
+            node = node.setdefault(character, {})
+        node[''] = True #end of an excluded string
+    if not trie:
+        return None
+    
+    def pattern(node):
+        if '' in node:
+            #An excluded string ends here, so any longer string with this prefix is excluded anyway
+            return ''
+        leaves = sorted(re.escape(ch) for ch, child in node.items() if '' in child)
+        branches = sorted(re.escape(ch) + pattern(child) for ch, child in node.items() if '' not in child)
+        alternatives = branches + (['[{}]'.format(''.join(leaves)) if len(leaves) > 1 else leaves[0]] if leaves else [])
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return '(?:{})'.format('|'.join(alternatives))
+    return re.compile(pattern(trie))
+
+def compile_filter(excluded=excluded_characters, allowed=None):
+    """
+    Returns a function that tells whether a lowercase word is kept: when it contains none of the excluded strings (see
+    compile_excluded) and, if allowed is given, only characters from allowed (so an empty allowed keeps no word).
+    Returns None when every word is kept.
+    """
+    excluded_matcher = compile_excluded(excluded)
+    allowed_matcher = None
+    if allowed is not None:
+        allowed = ''.join(sorted(set(allowed.lower())))
+        allowed_matcher = re.compile('[{}]*'.format(re.escape(allowed)) if allowed else '')
+    if allowed_matcher is None:
+        return None if excluded_matcher is None else lambda word: excluded_matcher.search(word) is None
+    if excluded_matcher is None:
+        return lambda word: allowed_matcher.fullmatch(word) is not None
+    return lambda word: excluded_matcher.search(word) is None and allowed_matcher.fullmatch(word) is not None
+
+def filter_words(filename=filename, lengths=(word_length,), ending_lengths=(wordending_length,), excluded=excluded_characters,
+                 allowed=None):
+    """
+    Reads the word file once, and keeps the unique lowercase words whose length is in lengths (e.g. range(4, 9), or None
+    for all lengths) that contain none of the excluded strings and, if allowed is given, only characters from allowed.
+    In the same pass, the kept words are grouped by word ending for every ending length in ending_lengths.
+    Returns (words, groups): words maps each length to its sorted words, and groups maps (length, ending length) to a
+    dictionary of word ending -> sorted words. Ending lengths longer than a word length are skipped for that length.
+    """
+    ending_lengths = sorted(set(ending_lengths))
+    keep = compile_filter(excluded, allowed)
+    
+    words = {} if lengths is None else {length: set() for length in lengths}
+    groups = {} if lengths is None else {(length, ending_length): {} for length in lengths for ending_length in ending_lengths if ending_length <= length}
+    with timings.stage('filter_words'), open(filename, 'r') as f:
+        n_read = 0
+        for word in f:
+            n_read += 1
+            word = word.strip().lower()
+            length = len(word)
+            if length == 0 or word in words.get(length, ()) or (lengths is not None and length not in words):
+                continue
+            if keep is not None and not keep(word):
+                continue
+            words.setdefault(length, set()).add(word)
+            for ending_length in ending_lengths:
+                if ending_length > length:
+                    break
+                groups.setdefault((length, ending_length), {}).setdefault(word[-ending_length:], []).append(word)
+        timings.count('words_read', n_read)
+        timings.count('bytes_read', f.tell())
+    
+    with timings.stage('group_endings'):
+        for grouping in groups.values():
+            for group in grouping.values():
+                group.sort()
+    return {length: sorted(length_words) for length, length_words in words.items()}, groups
+
+def filter_words_loop(filename=filename, length=word_length, ending_length=wordending_length, excluded=excluded_characters):
+    """
+    The original filter loop of this script (one length, one ending length, any() over the excluded strings per word),
+    kept as the reference for benchmark_filter.
+    """
+    with open(filename, 'r') as f:
+        words = f.readlines()
+    word_list = []
+    for word in words:
+        word = word.strip().lower()
+        if not any(exclude in word for exclude in excluded):
+            if len(word) == length:
+                word_list.append(word)
+    wordending_dict = {}
+    for word in set(word_list):
+        wordending_dict.setdefault(word[-ending_length:], []).append(word)
+    return wordending_dict
+
+def benchmark_filter(n_excluded=200, lengths=range(4, 9), ending_lengths=(1, 2, 3), repeats=3, seed=0):
+    """
+    Times filter_words against the original loop with n_excluded random excluded strings of 2-3 letters.
+    The loop handles one (length, ending length) pair per pass, so it is run once per pair that filter_words builds.
+    Prints and returns the best time of each, in seconds.
+    """
+    rng = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    excluded = ["'"] + [''.join(rng.choice(letters) for _ in range(rng.choice([2, 3]))) for _ in range(n_excluded)]
+    pairs = [(length, ending_length) for length in lengths for ending_length in ending_lengths if ending_length <= length]
+    
+    best_times = {}
+    for name, run in [('loop', lambda: [filter_words_loop(filename, length, ending_length, excluded) for length, ending_length in pairs]),
+                      ('engine', lambda: filter_words(filename, lengths, ending_lengths, excluded))]:
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        best_times[name] = best
+    
+    #Both must find the same word-ending groups
+    loop_groups = {pair: filter_words_loop(filename, pair[0], pair[1], excluded) for pair in pairs}
+    engine_groups = filter_words(filename, lengths, ending_lengths, excluded)[1]
+    assert all(sorted(map(sorted, loop_groups[pair].values())) == sorted(engine_groups[pair].values()) for pair in pairs)
+    
+    print('{} excluded strings, {} (length, ending length) groupings'.format(len(excluded), len(pairs)))
+    print('Original loop: {:.3f} s\nFilter engine: {:.3f} s ({:.1f}x faster)'.format(best_times['loop'], best_times['engine'],
+                                                                                 best_times['loop']/best_times['engine']))
+    return best_times
+
+### Word index ###
+class WordIndex:
+    """
+    On-disk index of a word file, saved in the directory {filename}.index.
+    For every word length, the index holds the unique lowercase words of that length sorted by their reversed spelling, 
+    so all words with the same ending are next to each other for every ending length. For each ending length, the
+    index also holds the (ending, start, stop) range of each word-ending group in that sorted list.
+    meta.json records the size, modification time and hash of the word file, and one length_{n}.json file per word
+    length holds its words and groups. Files are only read when they are first needed.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.directory = '{}.index'.format(filename)
+        self.meta = None
+        self.lengths = {} #word length -> loaded length_{n}.json content
+    
+    def source_signature(self):
+        #Size and modification time of the word file, used to notice when it has changed
+        stat = os.stat(self.filename)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+    
+    def source_hash(self):
+        with open(self.filename, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    
+    def load(self):
+        """
+        Loads the index metadata, and rebuilds the index first if it is missing, outdated, or the word file has changed.
+        """
+        if self.meta is not None:
+            return
+        try:
+            with timings.stage('index_load'), open(os.path.join(self.directory, 'meta.json'), 'r') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+        signature = self.source_signature()
+        if meta is None or meta['version'] != index_version:
+            self.build()
+        elif meta['source']['size'] != signature['size'] or meta['source']['mtime'] != signature['mtime']:
+            if meta['source']['hash'] == self.source_hash():
+                #Only the modification time changed, the index is still valid
+                meta['source'].update(signature)
+                self.write_json('meta.json', meta)
+                self.meta = meta
+            else:
+                self.build()
+        else:
+            self.meta = meta
+    
+    def write_json(self, name, content):
+        #Write to a temporary file first, so an interrupted write never leaves a broken index behind
+        path = os.path.join(self.directory, name)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(content, f)
+        os.replace(path + '.tmp', path)
+    
+    def build(self):
+        """
+        Reads all unique words of the word file with filter_words and writes the complete index.
+        """
+        by_length = filter_words(self.filename, lengths=None, ending_lengths=(), excluded=())[0]
+        
+        os.makedirs(self.directory, exist_ok=True)
+        for length, length_words in by_length.items():
+            with timings.stage('group_endings'):
+                length_words.sort(key=lambda word: word[::-1])
+                groups = {}
+                for ending_length in range(1, length+1):
+                    ranges = []
+                    for start, word in enumerate(length_words):
+                        ending = word[-ending_length:]
+                        if ranges and ranges[-1][0] == ending:
+                            ranges[-1][2] = start + 1
+                        else:
+                            ranges.append([ending, start, start + 1])
+                    groups[ending_length] = ranges
+            with timings.stage('write_index'):
+                self.write_json('length_{}.json'.format(length), {'words': length_words, 'groups': groups})
+        
+        self.meta = {'version': index_version, 'source': dict(self.source_signature(), hash=self.source_hash()),
+                     'lengths': {str(length): len(length_words) for length, length_words in by_length.items()}}
+        self.write_json('meta.json', self.meta)
+        self.lengths = {}
+    
+    def length_entry(self, length):
+        #Words and word-ending groups of one word length, loaded on first use
+        self.load()
+        if str(length) not in self.meta['lengths']:
+            return {'words': [], 'groups': {}}
+        if length not in self.lengths:
+            with timings.stage('index_load'), open(os.path.join(self.directory, 'length_{}.json'.format(length)), 'r') as f:
+                self.lengths[length] = json.load(f)
+        return self.lengths[length]
+    
+    def words(self, length, excluded=(), allowed=None):
+        """
+        Returns all unique words of the given length that are kept by compile_filter(excluded, allowed).
+        """
+        keep = compile_filter(excluded, allowed)
+        words = self.length_entry(length)['words']
+        with timings.stage('exclude_words'):
+            words = words if keep is None else [word for word in words if keep(word)]
+        timings.count('words_kept', len(words))
+        return words
+    
+    def groups(self, length, ending_length, minimum=1, excluded=(), allowed=None):
+        """
+        Returns a dictionary of word ending -> words of the given length with that ending, for all word endings of
+        ending_length letters with at least minimum words that are kept by compile_filter(excluded, allowed).
+        """
+        if not 0 < ending_length <= length:
+            raise ValueError('The word ending length must be between 1 and the word length ({})'.format(length))
+        entry = self.length_entry(length)
+        keep = compile_filter(excluded, allowed)
+        groups = {}
+        with timings.stage('select_groups'):
+            for ending, start, stop in entry['groups'].get(str(ending_length), []):
+                #A group can only lose words through the filter, so smaller groups can be skipped without filtering
+                if stop - start < minimum:
+                    continue
+                group = entry['words'][start:stop]
+                if keep is not None:
+                    group = [word for word in group if keep(word)]
+                if len(group) >= minimum:
+                    groups[ending] = group
+        timings.count('groups_kept', len(groups))
+        return groups
+
+### Batch stimulus lists ###
+def generate_stimulus_lists(n_lists, length=word_length, ending_length=wordending_length, minimum=word_minimum,
+                            excluded=excluded_characters, seed=None, replace=True, index=None, allowed=None):
+    """
+    Creates n_lists stimulus lists, each with one random word per word-ending group (see WordIndex.groups).
+    Sampling is done for all lists and groups at once on the concatenated group words, using a numpy random generator
+    seeded with seed. With replace=False, no word is used in more than one list, which requires every group to have 
+    at least n_lists words.
+    Returns (endings, lists), where lists is an array of words with one row per list and one column per ending.
+    """
+    if index is None:
+        index = WordIndex(filename)
+    groups = index.groups(length, ending_length, minimum, excluded, allowed)
+    timings.count('lists', n_lists)
+    with timings.stage('sample'):
+        endings = list(groups.keys())
+        words = np.array([word for ending in endings for word in groups[ending]], dtype='U{}'.format(max(length, 1)))
+        sizes = np.array([len(groups[ending]) for ending in endings], dtype=np.int64)
+        offsets = np.cumsum(sizes) - sizes
+        rng = np.random.default_rng(seed)
+    
+        if not endings:
+            #No word ending has enough words, so every list is empty
+            return endings, np.empty((n_lists, 0), dtype=words.dtype)
+        if replace:
+            #Independent uniform choice within each group: offset of the group plus a random position below its size
+            picks = offsets + (rng.random((n_lists, len(endings)))*sizes).astype(np.int64)
+        else:
+            if len(sizes) and n_lists > sizes.min():
+                raise ValueError('Sampling without replacement needs at least {} words per word ending, the smallest group has {}'.format(n_lists, sizes.min()))
+            #Shuffle the words within each group by sorting on random keys, then give the j-th shuffled word of every group to list j
+            group = np.repeat(np.arange(len(endings)), sizes)
+            shuffled = np.lexsort((rng.random(len(words)), group))
+            picks = shuffled[offsets + np.arange(n_lists)[:, None]]
+        return endings, words[picks]
+
+def save_stimulus_lists(output, endings, lists):
+    """
+    Saves stimulus lists to a .json file (a list of word lists) or a .csv file (one row per list, one column per ending).
+    """
+    with timings.stage('output'):
+        if output.endswith('.json'):
+            with open(output, 'w') as f:
+                json.dump({'endings': endings, 'lists': lists.tolist()}, f)
+        else:
+            with open(output, 'w') as f:
+                f.write('list,{}\n'.format(','.join(endings)))
+                for n, stimuli in enumerate(lists):
+                    f.write('{},{}\n'.format(n+1, ','.join(stimuli)))
 
-#Opening the file and extracting all the lines to a list of words
-f = open(filename, 'r') 
-words = f.readlines()
-
-#Creating a list of all four letter words converted to lowercase, excluding all words containing apostrophes
-word_list = []
-for word in words:
-    word = word.strip().lower() 
-    if not any(exclude in word for exclude in excluded_characters):
-        if len(word) == word_length:
-            word_list.append(word)
-
-#Removing duplicate words
-word_list_unique = list(set(word_list)) 
-print('The file contains {} unique {}-letter words \n'.format(len(word_list_unique), word_length))
-
-#Creating a dictionary of unique word-endings with all words with that ending
-wordending_dict = {}
-for word in word_list_unique:
-    ending = word[-wordending_length:]
-    if ending in wordending_dict.keys():
-        wordending_dict[ending].append(word)
-    else:
-        wordending_dict[ending] = [word]
-
-#Selecting only the word-endings with equal or more than the minimum amount of words set, in this case 30.
-#For each word ending with enough words, the word ending and the amount of words will be printed
-wordending_dict_stimuli = {}
-print('The following unique word-endings with at least {} words are present in the file'.format(word_minimum))
-print('Word ending: Amount')
-for ending in wordending_dict.keys():
-    if len(wordending_dict[ending]) >= word_minimum:
-        print('{}: {:3d}'.format(ending, len(wordending_dict[ending])))
-        wordending_dict_stimuli[ending] = wordending_dict[ending]
-
-#Selecting and printing a random word for each word ending
-stimuli= []
-print('\n{} random words selected\nStimuli:'.format(len(wordending_dict_stimuli.keys())))
-for ending in wordending_dict_stimuli.keys():
-    randomword = random.choice(wordending_dict_stimuli[ending])
-    print(randomword)
-    stimuli.append(randomword)
\ No newline at end of file
+if __name__ == '__main__':
+    #Command line options override the settings above
+    parser = argparse.ArgumentParser(description='Select a random word from each word-ending group as stimuli')
+    parser.add_argument('--length', type=int, default=word_length, help='length of the selected words (default: {})'.format(word_length))
+    parser.add_argument('--max-length', type=int, default=max_word_length, help='also select the words of --length up to this length (default: {})'.format(max_word_length))
+    parser.add_argument('--ending-length', type=int, nargs='+', default=[wordending_length], help='length(s) of the word endings (default: {})'.format(wordending_length))
+    parser.add_argument('--minimum', type=int, default=word_minimum, help='minimum amount of words per word ending (default: {})'.format(word_minimum))
+    parser.add_argument('--exclude', nargs='*', default=excluded_characters, metavar='STRING', help='exclude the words containing any of these strings (default: {})'.format(excluded_characters))
+    parser.add_argument('--allowed', default=allowed_characters, metavar='CHARACTERS', help='only select the words made of these characters (default: all characters)')
+    parser.add_argument('--lists', type=int, help='number of stimulus lists to save to --output instead of printing one list')
+    parser.add_argument('--output', default='stimulus_lists.csv', help='.csv or .json file for --lists (default: stimulus_lists.csv)')
+    parser.add_argument('--seed', type=int, help='seed of the random word selection')
+    parser.add_argument('--no-replacement', action='store_true', help='do not use a word in more than one of the --lists')
+    parser.add_argument('--benchmark-filter', type=int, metavar='N', help='time the filter engine against the original loop with N excluded strings')
+    parser.add_argument('--words', default=filename, help='word file, one word per line (default: {})'.format(filename))
+    parser.add_argument('--timings', metavar='FILE', help='save the per-stage timings and counters as JSON to FILE (- prints them)')
+    args = parser.parse_args()
+    
+    if args.benchmark_filter is not None:
+        benchmark_filter(args.benchmark_filter)
+        raise SystemExit
+    word_length, max_word_length, word_minimum = args.length, args.max_length, args.minimum
+    excluded_characters, allowed_characters = args.exclude, args.allowed
+    filename = args.words
+    lengths = range(word_length, (word_length if max_word_length is None else max_word_length) + 1)
+    ending_lengths = sorted(set(args.ending_length))
+    if len(lengths) == 0 or word_length < 1:
+        parser.error('--max-length must be at least --length, and --length at least 1')
+    if ending_lengths[0] < 1 or ending_lengths[0] > lengths[-1]:
+        parser.error('--ending-length must be between 1 and the word length')
+    
+    if args.lists:
+        if len(lengths) > 1 or len(ending_lengths) > 1:
+            parser.error('--lists needs a single word length and word ending length')
+        endings, lists = generate_stimulus_lists(args.lists, word_length, ending_lengths[0], word_minimum, excluded_characters,
+                                                 seed=args.seed, replace=not args.no_replacement, allowed=allowed_characters)
+        save_stimulus_lists(args.output, endings, lists)
+        print('{} stimulus lists of {} words saved to {}'.format(len(lists), len(endings), args.output))
+        if args.timings:
+            timings.write(args.timings, 'random_word_stimuli')
+        raise SystemExit
+    
+    index = WordIndex(filename)
+    random.seed(args.seed)
+    for word_length in lengths:
+        #Looking up all unique words of word_length in the word index, excluding all words containing excluded characters
+        word_list_unique = index.words(word_length, excluded_characters, allowed_characters)
+        print('The file contains {} unique {}-letter words \n'.format(len(word_list_unique), word_length))
+        
+        for wordending_length in ending_lengths:
+            if wordending_length > word_length:
+                continue
+            if len(ending_lengths) > 1:
+                print('### {}-letter word endings ###'.format(wordending_length))
+            #Selecting only the word-endings with equal or more than the minimum amount of words set, in this case 30.
+            #For each word ending with enough words, the word ending and the amount of words will be printed
+            wordending_dict_stimuli = index.groups(word_length, wordending_length, word_minimum, excluded_characters, allowed_characters)
+            print('The following unique word-endings with at least {} words are present in the file'.format(word_minimum))
+            print('Word ending: Amount')
+            for ending in wordending_dict_stimuli.keys():
+                print('{}: {:3d}'.format(ending, len(wordending_dict_stimuli[ending])))
+            
+            #Selecting and printing a random word for each word ending
+            stimuli= []
+            print('\n{} random words selected\nStimuli:'.format(len(wordending_dict_stimuli.keys())))
+            for ending in wordending_dict_stimuli.keys():
+                randomword = random.choice(wordending_dict_stimuli[ending])
+                print(randomword)
+                stimuli.append(randomword)
+    if args.timings:
+        timings.write(args.timings, 'random_word_stimuli')
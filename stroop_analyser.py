@@ -8,164 +8,1111 @@ It also generates a graphical representation of the distribution of reaction tim
 trial conditions.
 
 It saves the table data as a .csv file and the figure as a .png file, as well as outputting them to the console.
+
+Subject files can be analysed in a pool of worker processes (--workers N, or the n_workers setting below), 
+in which case the table is still written in the original file order. Use --serial to analyse them in a single process.
+Per-subject results are cached in cache_filename, so later runs only parse subject files that are new or have changed.
+Use --no-cache to analyse every file again.
+
+Large concatenated trial logs with a participant column can be summarised in constant memory with --stream FILE, 
+which reads the log in chunks and keeps only a running count, mean and variance per participant and condition.
+
+For data spread over several machines, each machine runs the analyser with --emit-partial FILE, which writes a small
+partial aggregate (per-subject counts, sums, sums of squares, correct counts and fixed-grid histograms) instead of the 
+table and figure. --merge FILE [FILE ...] then combines any number of partials into the same table and figure.
+
+The figure is drawn from histograms of the subject means on fixed grids (rt_grid and percent_grid), which are saved next to
+the table as strooptask_histograms_*.json. Histograms on the same grid can be summed, so --plot-summary FILE [FILE ...]
+renders one figure from any number of saved histograms, tables or partial aggregates without re-reading subject means.
+--table-only writes only the table and histograms and never imports matplotlib, which makes batch runs start much faster.
+--benchmark-startup compares the run time and peak memory of a full and a table-only run.
+
+Next to mean ± STD, the table has robust statistics per subject and condition (median and rt_percentiles of the RTs, 
+and the mean RT after trimming outliers with trim_method), and the Stroop interference effect (incongruent - congruent).
+The rows CILower and CIUpper below the group mean give bootstrap confidence intervals of the group means, from
+n_bootstrap resamples of the subjects (--bootstrap N). These are computed for all subjects at once, see stroop_stats.py.
+Robust statistics need all trials of a subject, so they are NaN in --stream mode and for subjects split over partials.
+
+During data collection, --watch keeps running and updates the table, histograms and figure every time a subject file is
+finished (see stroop_watch.py: inotify on Linux, otherwise polling; files of sessions that are still running are ignored).
+Only the new file is parsed, and the group means and histograms are updated from running sums, so an update does not get
+slower as subjects are added. The outputs are rewritten atomically, so they can be opened at any time. The bootstrap
+confidence intervals need all subjects, so they are added when the watch is stopped with Ctrl+C.
+
+With --binary, the binary trial files written by stroop_task (.strb, see stroop_trialformat.py) are analysed instead 
+of the .csv files. Their fixed-width records are read as arrays, so no text has to be parsed.
+
+--timings FILE saves the time spent in each stage (finding and reading the subject files, parsing, computing the
+statistics, writing the table, bootstrapping, rendering the figure) with counts of the files, rows and bytes parsed, as
+JSON (see stroop_timing.py). --directory DIR analyses the subject files in DIR instead of the directory below.
+
+With --db [FILE], the subjects are read from a SQLite trial store made with stroop_store.py instead of the data directory.
+The per-subject counts, sums and sums of squares are aggregated in SQL, and --date-from, --date-to, --participant and
+--colour-pair restrict the analysis to a cut of the trials, which uses the indexes of the store instead of a directory scan.
 """
 
+import os
+import sys
 import glob
+import argparse
+import hashlib
+import json
+from itertools import islice
 import numpy as np
-import matplotlib.pyplot as plt
 import datetime 
 from math import floor, ceil
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import stroop_trialformat
+import stroop_stats
+import stroop_watch
+import stroop_store
+from stroop_timing import timings
 
 #### Plot Settings ####
 xtickstep_rt = 0.1 #plot a tick every xtickstep_rt seconds for the reaction time plot: default 0.1, change this value for bigger/smaller steps
 xtickstep_percent = 5 #plot a tick every xtickstep_percent % for the correct responses plot: default 5, change this value for bigger/smaller steps
 colors = ['#377eb8', '#ff7f00'] #Colors for Congruent and Incongruent condition
 
-#Extracting .csv files from specified directory
-directory = 'C:\\Stroop\\data'
-filename = '*.csv'
-filepath = "{}\\{}".format(directory, filename)
-
-subject_files = glob.glob(filepath)
-n_subjects = len(subject_files)
-
-#Preparing file to save reaction time data
-analysis_date = datetime.datetime.now().strftime('%H%M_%d%m%Y')
-table_filename = 'strooptask_summary_{}.csv'.format(analysis_date) 
-table = open(table_filename, 'w')
-table.write('ParticipantID,RTCongruent,STDCongruent,%Congruent,RTIncongruent,STDIncongruent,%Incongruent\n')
-
-#Print table headers with specific spacing to match the printed outputs
-print('{:^61s}'.format('### REACTION TIMES TABLE ###'))
-print('{:<11s}{:^25s}\t{:^25s}'.format('Participant', 'Congruent', 'Incongruent'))
-print('{:<11s}{:^16}{:>9}\t{:^16}{:>9}'.format('', 'Mean RT ± STD', '%correct', 'Mean RT ± STD', '%correct'))
-
-#### ANALYSING SUBJECT DATA #####
-#Loops through the data files per subject and extracts all reaction times, which are split up depending on whether
-#the trial was congruent or incongruent
-#It also calculates the percentages of correct responses for both trial types.
-#Then, the mean and standard deviation of the subjects reaction time and % correct are printed and saved to the table summary file 
-# Mean Reaction time and % correct are also saved in variables for plotting the figure below
-
-meanrts_congruent = []
-meanrts_incongruent = []
-meanpercent_congruent = []
-meanpercent_incongruent = []
-
-for n, file in enumerate(subject_files):
-    #Reset variables to collect all reaction times for this subject
-    congruent_rts = []
-    incongruent_rts = []
-    con_correct = 0
-    incon_correct = 0
-    f = open(file, 'r') 
+#### Processing Settings ####
+n_workers = 1 #Number of worker processes used to analyse the subject files: 1 analyses them serially, None uses all CPU cores
+chunk_size = 200 #Number of subject files each worker parses in one batch
+cache_filename = 'strooptask_cache.json' #Per-subject summaries of earlier runs, set to None to disable the cache
+cache_version = 3 #Increase this when the content of SubjectSummary changes, to invalidate old caches
+partial_version = 1 #Version of the partial aggregate files written by --emit-partial
+
+#### Histogram Settings ####
+#Fixed grids (start, stop, binwidth) for the histograms of subject mean RT and % correct that are plotted in the figure and
+#stored in the histogram files and partial aggregates.
+#Values outside the grid are counted in the first or last bin, so histograms of separate runs on the same grid can be summed.
+rt_grid = (0, 3, 0.02)
+percent_grid = (0, 101, 1)
+histogram_version = 1 #Version of the histogram files saved next to the table
+
+#### Robust Statistics Settings ####
+rt_percentiles = (25, 75) #Lower and upper percentile of the RTs reported per subject and condition
+trim_method = 'mad' #Outlier trimming per subject and condition: 'mad' (median absolute deviation) or 'sd' (standard deviation)
+trim_threshold = 3 #RTs further than this many MADs/STDs from the median/mean are left out of the trimmed mean
+n_bootstrap = 10000 #Number of bootstrap resamples for the confidence intervals of the group means, 0 disables them
+bootstrap_confidence = 95 #Confidence level (%) of the bootstrap confidence intervals
+bootstrap_seed = 1 #Seed of the bootstrap resampling, so every run on the same subjects gives the same table. None draws new resamples every run
+
+#### Trial data settings ####
+#Columns of the stroop_task output files that are needed for the analysis, and the codes used for each condition
+condition_column = 3
+rt_column = 5
+correct_column = 6
+conditions = ['congruent', 'incongruent'] #condition code is the position in this list, any other condition is coded -1
+participant_column_name = 'participant' #Header of the participant column in concatenated trial logs (--stream)
+stream_chunk_lines = 100000 #Number of lines of a concatenated trial log that are parsed and aggregated at a time
+
+#### Watch Settings ####
+watch_interval = 2 #Seconds between directory listings when --watch has to poll (no inotify)
+watch_settle = 30 #When polling, a subject file is finished when it has not changed for this many seconds. stroop_task only gives
+                  #its data files their own name when the session ends (see stroop_logger.py), this is for files copied into the directory
+
+#### LOADING TRIAL DATA ####
+def parse_trial_lines(lines, columns=(condition_column, rt_column, correct_column), participant_column=None):
+    """
+    Parses data lines (without header) of stroop_task output straight into typed columns.
+    Returns a dictionary with 'condition' (int8 code, see conditions), 'rt' (float64) and 'correct' (bool) arrays.
+    columns gives the positions of the condition, rt and correct columns. If participant_column is given, 
+    the dictionary also has a 'participant' array of strings.
+    """
+    dtype = [('condition', 'U16'), ('rt', 'f8'), ('correct', 'U8')]
+    usecols = tuple(columns)
+    if participant_column is not None:
+        dtype.append(('participant', 'U64'))
+        usecols += (participant_column,)
+    if len(lines) == 0:
+        data = np.empty(0, dtype=dtype)
+    else:
+        data = np.loadtxt(lines, delimiter=',', ndmin=1, usecols=usecols, dtype=dtype)
+    condition = np.full(len(data), -1, dtype=np.int8)
+    for code, name in enumerate(conditions):
+        condition[data['condition'] == name] = code
+    trials = {'condition': condition, 'rt': data['rt'], 'correct': data['correct'] == 'True'}
+    if participant_column is not None:
+        trials['participant'] = data['participant']
+    return trials
+
+def load_trial_batch(files):
+    """
+    Reads a batch of stroop_task data files into one set of typed columns with a single parse.
+    The trials of file n are found at offsets[n]:offsets[n+1] of each column.
+    """
+    lines = []
+    offsets = np.zeros(len(files)+1, dtype=np.int64)
+    with timings.stage('read_files'):
+        for n, file in enumerate(files):
+            with open(file, 'r') as f:
+                f.readline() #skip header
+                lines += [line for line in f.read().splitlines() if line]
+                timings.count('bytes_parsed', os.fstat(f.fileno()).st_size)
+            offsets[n+1] = len(lines)
+    with timings.stage('parse'):
+        batch = parse_trial_lines(lines)
+    batch['offsets'] = offsets
+    timings.count('files', len(files))
+    timings.count('rows', len(lines))
+    return batch
+
+def load_binary_batch(files):
+    """
+    Same as load_trial_batch, for binary trial files (see stroop_trialformat.py), which are read as arrays of records instead of parsed.
+    """
+    #Condition codes of the binary format translated to the codes of the conditions setting
+    lookup = np.array([conditions.index(name) if name in conditions else -1 for name in stroop_trialformat.conditions], dtype=np.int8)
+    with timings.stage('read_files'):
+        records, offsets = stroop_trialformat.read_trial_batch(files)
+    timings.count('files', len(files))
+    timings.count('rows', len(records))
+    timings.count('bytes_parsed', records.nbytes)
+    return {'condition': lookup[records['condition']], 'rt': np.asarray(records['rt'], dtype=np.float64),
+            'correct': np.asarray(records['correct'], dtype=bool), 'offsets': offsets}
+
+#Summary of one subject: mean RT, STD of RT and % correct per condition, followed by the trial and correct counts,
+#the count, sum and sum of squares of the (non-NaN) reaction times per condition, and the robust RT statistics per
+#condition (see stroop_stats.subject_rt_stats), which are NaN when they cannot be computed from the counts and sums
+robust_fields = ['median', 'lower', 'upper', 'trimmed_mean', 'n_trimmed']
+SubjectSummary = namedtuple('SubjectSummary', ['con_mean', 'con_std', 'con_percentage',
+                                               'incon_mean', 'incon_std', 'incon_percentage',
+                                               'con_trials', 'con_correct', 'incon_trials', 'incon_correct',
+                                               'con_count', 'con_sum', 'con_sumsq', 'incon_count', 'incon_sum', 'incon_sumsq'] + 
+                                              [prefix+'_'+field for prefix in ['con', 'incon'] for field in robust_fields],
+                            defaults=[float('nan')]*2*len(robust_fields))
+
+def summarise_subjects(subject, n_subjects, condition, rt, correct):
+    """
+    Calculates mean RT, STD of RT and % correct for the congruent and incongruent trials of every subject in a batch
+    at once, from the trial columns and the number (0..n_subjects-1) of the subject of each trial.
+    The trial, correct and RT counts of all subjects and conditions are taken with single np.bincount calls over
+    subject*len(conditions) + condition, and the sums of the reaction times with stroop_stats.group_sums, so the means
+    and STDs are exactly those of np.nanmean and np.nanstd per subject and condition (the STD is taken around the mean
+    in a second pass). NaN reaction times are left out of the mean and STD, but still count as trials.
+    Returns one SubjectSummary per subject, without the robust RT statistics.
+    """
+    n_groups = n_subjects*len(conditions)
+    known = condition >= 0
+    group = (subject*len(conditions) + condition)[known]
+    x = rt[known]
+    trials = np.bincount(group, minlength=n_groups)
+    n_correct = np.bincount(group, weights=correct[known], minlength=n_groups).astype(np.int64)
+    count = np.bincount(group[~np.isnan(x)], minlength=n_groups)
+    total = stroop_stats.group_sums(x, group, n_groups)
+    sumsq = stroop_stats.group_sums(x**2, group, n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total/count
+        std = np.sqrt(stroop_stats.group_sums((x - mean[group])**2, group, n_groups)/count)
+        percentage = 100*n_correct/trials
+    #One column per SubjectSummary field, with one value per subject
+    columns = []
+    for fields in [(mean, std, percentage), (trials, n_correct), (count, total, sumsq)]:
+        for code in range(len(conditions)):
+            columns += [field.reshape(n_subjects, len(conditions))[:, code].tolist() for field in fields]
+    return [SubjectSummary(*values) for values in zip(*columns)]
+
+#### ANALYSING SUBJECT FILES ####
+def analyse_files(files):
+    """
+    Parses a batch of subject files and returns one summary tuple per file (see summarise_subjects), in the same order.
+    The robust RT statistics are computed for the whole batch at once with stroop_stats.subject_rt_stats.
+    Binary trial files (stroop_trialformat.extension) are read as arrays of records instead of parsed.
+    """
+    if files and all(file.endswith(stroop_trialformat.extension) for file in files):
+        batch = load_binary_batch(files)
+    else:
+        batch = load_trial_batch(files)
+    #Position of the file of each trial in files
+    subject = np.repeat(np.arange(len(files)), np.diff(batch['offsets']))
+    with timings.stage('robust_statistics'):
+        robust = []
+        for code in range(len(conditions)):
+            mask = batch['condition'] == code
+            stats = stroop_stats.subject_rt_stats(batch['rt'][mask], subject[mask], len(files), rt_percentiles, trim_method, trim_threshold)
+            robust.append(np.column_stack([stats[field] for field in robust_fields]))
+        robust = np.hstack(robust)
+    with timings.stage('statistics'):
+        summaries = summarise_subjects(subject, len(files), batch['condition'], batch['rt'], batch['correct'])
+        robust_names = SubjectSummary._fields[-robust.shape[1]:]
+        summaries = [summary._replace(**dict(zip(robust_names, values))) for summary, values in zip(summaries, robust.tolist())]
+    return summaries
+
+def analyse_files_timed(files):
+    #analyse_files in a worker process, also returning the timings of the worker, which the main process adds to its own
+    timings.reset()
+    return analyse_files(files), timings.report()
+
+def analyse_subjects(files, workers=1):
+    """
+    Analyses all subject files, either serially (workers=1) or in a pool of worker processes.
+    Files are handed out in chunks of chunk_size, and the summaries are returned in the order of files.
+    """
+    if workers is None:
+        workers = os.cpu_count()
+    #Use smaller chunks when there are too few files to keep every worker busy
+    size = max(1, min(chunk_size, ceil(len(files)/workers)))
+    chunks = [files[i:i+size] for i in range(0, len(files), size)]
+    if workers == 1 or len(chunks) <= 1:
+        results = map(analyse_files, chunks)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            timed_results = list(pool.map(analyse_files_timed, chunks))
+        for chunk_summaries, report in timed_results:
+            timings.merge(report)
+        results = [chunk_summaries for chunk_summaries, report in timed_results]
+    return [summary for chunk_summaries in results for summary in chunk_summaries]
+
+#### STREAMING CONCATENATED TRIAL LOGS ####
+class RunningStats:
+    """
+    Running count, mean and variance of RTs, plus trial and correct counts, per (participant, condition) group.
+    Each chunk of trials is reduced per group with two passes over the chunk, and then combined with the totals 
+    of the earlier chunks using the pairwise update of Chan et al., which stays numerically stable for millions of trials.
+    NaN reaction times are left out of the count, mean and variance (like np.nanmean/np.nanstd), but still count as trials.
+    """
+    def __init__(self):
+        self.participants = [] #participant ids in order of first appearance
+        self.index = {} #participant id -> row in the arrays below
+        shape = (0, len(conditions))
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.trials = np.zeros(shape, dtype=np.int64)
+        self.correct = np.zeros(shape, dtype=np.int64)
+    
+    def _rows(self, participant):
+        #Map participant ids to rows, adding rows for participants that were not seen before
+        ids, inverse = np.unique(participant, return_inverse=True)
+        new = [pid for pid in ids.tolist() if pid not in self.index]
+        if new:
+            for pid in new:
+                self.index[pid] = len(self.participants)
+                self.participants.append(pid)
+            extra = np.zeros((len(new), len(conditions)))
+            self.count = np.vstack([self.count, extra.astype(np.int64)])
+            self.mean = np.vstack([self.mean, extra])
+            self.m2 = np.vstack([self.m2, extra])
+            self.trials = np.vstack([self.trials, extra.astype(np.int64)])
+            self.correct = np.vstack([self.correct, extra.astype(np.int64)])
+        rows = np.array([self.index[pid] for pid in ids.tolist()], dtype=np.int64)
+        return rows[inverse.ravel()]
     
-    header = f.readline()
-    #Collect all reaction times & %correct for this subject, split up in congruent and incongruent trials
-    for line in f.readlines():
-        data = line.strip().split(',')
+    def update(self, participant, condition, rt, correct):
+        """
+        Adds a chunk of trials, given as equally long arrays of participant ids, condition codes, rts and correctness.
+        """
+        rows = self._rows(participant)
+        known = condition >= 0
+        n_groups = self.count.size
+        group = (rows*len(conditions) + condition)[known]
+        self.trials += np.bincount(group, minlength=n_groups).reshape(self.trials.shape)
+        self.correct += np.bincount(group, weights=correct[known], minlength=n_groups).astype(np.int64).reshape(self.correct.shape)
         
-        if data[3] == 'congruent':
-            congruent_rts.append(float(data[5]))
-            if data[6] == 'True':
-                con_correct += 1
+        valid = ~np.isnan(rt[known])
+        group = group[valid]
+        x = rt[known][valid]
+        count_b = np.bincount(group, minlength=n_groups)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_b = np.bincount(group, weights=x, minlength=n_groups)/count_b
+        m2_b = np.bincount(group, weights=(x - mean_b[group])**2, minlength=n_groups)
         
-        elif data[3] == 'incongruent':
-            incongruent_rts.append(float(data[5]))
-            if data[6] == 'True':
-                incon_correct += 1
-                
-    f.close() #close data file
+        count_a = self.count.ravel()
+        mean_a = self.mean.ravel()
+        m2_a = self.m2.ravel()
+        count = count_a + count_b
+        seen = count_b > 0
+        delta = mean_b[seen] - mean_a[seen]
+        mean_a[seen] += delta*count_b[seen]/count[seen]
+        m2_a[seen] += m2_b[seen] + delta**2*count_a[seen]*count_b[seen]/count[seen]
+        self.count = count.reshape(self.count.shape)
+        self.mean = mean_a.reshape(self.mean.shape)
+        self.m2 = m2_a.reshape(self.m2.shape)
     
-    #Calculate mean, std, % correct
-    con_mean =np.nanmean(congruent_rts)
-    con_std =np.nanstd(congruent_rts)
-    con_percentage = 100*con_correct/len(congruent_rts)
-
-    incon_mean = np.nanmean(incongruent_rts)
-    incon_std = np.nanstd(incongruent_rts)
-    incon_percentage = 100*incon_correct/len(incongruent_rts)
+    def summaries(self):
+        """
+        Returns one SubjectSummary per participant, in order of first appearance.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(self.count > 0, self.mean, np.nan)
+            std = np.sqrt(self.m2/self.count)
+            percentage = 100*self.correct/self.trials
+        total = self.mean*self.count
+        sumsq = self.m2 + self.count*self.mean**2
+        summaries = []
+        for n in range(len(self.participants)):
+            stats = []
+            counts = []
+            sums = []
+            for code in range(len(conditions)):
+                stats += [float(mean[n, code]), float(std[n, code]), float(percentage[n, code])]
+                counts += [int(self.trials[n, code]), int(self.correct[n, code])]
+                sums += [int(self.count[n, code]), float(total[n, code]), float(sumsq[n, code])]
+            summaries.append(SubjectSummary(*stats, *counts, *sums))
+        return summaries
+
+def stream_trial_log(file, chunk_lines=stream_chunk_lines, stats=None):
+    """
+    Aggregates a concatenated trial log (stroop_task columns plus a participant column) in chunks of chunk_lines lines,
+    so memory use does not depend on the size of the log. Columns are found by their header names.
+    Returns the RunningStats, pass stats to keep adding to the totals of earlier logs.
+    """
+    if stats is None:
+        stats = RunningStats()
+    with open(file, 'r') as f:
+        header = f.readline().strip().split(',')
+        columns = [header.index(name) for name in ['condition', 'rt', 'correct']]
+        participant = header.index(participant_column_name)
+        while True:
+            with timings.stage('read_files'):
+                lines = [line for line in islice(f, chunk_lines) if line.strip()]
+            if not lines:
+                break
+            timings.count('rows', len(lines))
+            timings.count('bytes_parsed', sum(len(line) for line in lines))
+            with timings.stage('parse'):
+                trials = parse_trial_lines(lines, columns, participant)
+            with timings.stage('statistics'):
+                stats.update(trials['participant'], trials['condition'], trials['rt'], trials['correct'])
+    timings.count('files')
+    return stats
+
+#### CACHING SUBJECT SUMMARIES ####
+def file_hash(file):
+    """
+    Returns the SHA-1 hex digest of the content of a file.
+    """
+    with open(file, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def robust_settings():
+    #Settings the cached robust statistics depend on
+    return [list(rt_percentiles), trim_method, trim_threshold]
+
+def load_cache(cache_file):
+    """
+    Reads the cache entries of an earlier run: a dictionary of file path -> entry with size, mtime, hash and summary.
+    A missing, unreadable or outdated cache gives an empty dictionary.
+    """
+    try:
+        with open(cache_file, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get('version') != cache_version or cache.get('conditions') != conditions or cache.get('robust') != robust_settings():
+        return {}
+    return cache['files']
+
+def save_cache(cache_file, entries):
+    """
+    Writes the cache entries to cache_file. The cache is written to a temporary file first and then moved into place,
+    so an interrupted run never leaves a broken cache behind.
+    """
+    temp_file = '{}.tmp'.format(cache_file)
+    with open(temp_file, 'w') as f:
+        json.dump({'version': cache_version, 'conditions': conditions, 'robust': robust_settings(), 'files': entries}, f)
+    os.replace(temp_file, cache_file)
+
+def analyse_subjects_cached(files, workers=1, cache_file=cache_filename):
+    """
+    Same as analyse_subjects, but reuses the summaries stored in cache_file for files that have not changed.
+    A file is unchanged when its size and modification time match the cache entry, or otherwise when its content hash does.
+    Only new and changed files are parsed, and entries of files that no longer exist are dropped from the cache.
+    """
+    entries = {}
+    summaries = [None]*len(files)
+    changed = []
+    updated = False
+    with timings.stage('cache'):
+        cache = load_cache(cache_file)
+        for n, file in enumerate(files):
+            stat = os.stat(file)
+            entry = cache.get(file)
+            if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+                summaries[n] = SubjectSummary(*entry['summary'])
+                entries[file] = entry
+                continue
+            content_hash = file_hash(file)
+            entries[file] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': content_hash}
+            updated = True
+            if entry is not None and entry['hash'] == content_hash:
+                #Only the modification time changed (e.g. a copied file), the summary is still valid
+                summaries[n] = SubjectSummary(*entry['summary'])
+                entries[file]['summary'] = entry['summary']
+            else:
+                changed.append(n)
+    timings.count('cached_files', len(files) - len(changed))
+    
+    for n, summary in zip(changed, analyse_subjects([files[n] for n in changed], workers)):
+        summaries[n] = summary
+        entries[files[n]]['summary'] = list(summary)
     
-    #Save data for distribution plot
-    meanrts_congruent.append(con_mean)
-    meanrts_incongruent.append(incon_mean)
-    meanpercent_congruent.append(con_percentage)
-    meanpercent_incongruent.append(incon_percentage)
+    if updated or len(entries) != len(cache):
+        with timings.stage('cache'):
+            save_cache(cache_file, entries)
+    return summaries
+
+#### PARTIAL AGGREGATES ####
+def grid_edges(grid):
+    """
+    Returns the bin edges of a fixed histogram grid given as (start, stop, binwidth).
+    """
+    start, stop, binwidth = grid
+    return start + binwidth*np.arange(round((stop - start)/binwidth) + 1)
+
+def grid_histogram(values, grid):
+    """
+    Counts values on a fixed histogram grid. Values outside the grid are counted in the first or last bin and NaN values are ignored.
+    """
+    edges = grid_edges(grid)
+    values = np.asarray(values, dtype=np.float64)
+    values = np.clip(values[~np.isnan(values)], edges[0], edges[-1])
+    return np.histogram(values, bins=edges)[0]
+
+def subject_histograms(summaries):
+    """
+    Histograms of the subject mean RTs and % correct per condition, on rt_grid and percent_grid.
+    Returns {'rt': [congruent counts, incongruent counts], 'percent': [...]} with lists of ints.
+    """
+    histograms = {'rt': [], 'percent': []}
+    with timings.stage('histograms'):
+        for prefix in ['con', 'incon']:
+            histograms['rt'].append(grid_histogram([getattr(s, prefix+'_mean') for s in summaries], rt_grid).tolist())
+            histograms['percent'].append(grid_histogram([getattr(s, prefix+'_percentage') for s in summaries], percent_grid).tolist())
+    return histograms
+
+def add_histograms(histograms, other):
+    """
+    Sums two sets of histograms from subject_histograms on the same grids. histograms may be None.
+    """
+    if histograms is None:
+        return other
+    return {kind: (np.array(histograms[kind]) + np.array(other[kind])).tolist() for kind in histograms}
+
+def write_histograms(histogram_file, histograms, n_subjects):
+    """
+    Saves the histograms of subject means from subject_histograms, with their grids, for plotting them later.
+    """
+    saved = {'version': histogram_version, 'conditions': conditions, 'n_subjects': n_subjects,
+             'rt_grid': list(rt_grid), 'percent_grid': list(percent_grid), 'histograms': histograms}
+    with open(histogram_file, 'w') as f:
+        json.dump(saved, f)
+
+def write_partial(partial_file, subject_ids, summaries, source):
+    """
+    Writes a partial aggregate of one shard of the data: one entry per subject with its SubjectSummary, and the histograms
+    of subject means. source is 'files' when subjects are data files, or 'stream' when they are participant ids.
+    """
+    partial = {'version': partial_version, 'conditions': conditions, 'source': source,
+               'rt_grid': list(rt_grid), 'percent_grid': list(percent_grid),
+               'subjects': [{'subject': subject, 'summary': list(summary)} for subject, summary in zip(subject_ids, summaries)],
+               'histograms': subject_histograms(summaries)}
+    with open(partial_file, 'w') as f:
+        json.dump(partial, f)
+
+def combine_summaries(summaries):
+    """
+    Combines the SubjectSummary of one subject from several shards using the counts, sums and sums of squares.
+    """
+    stats = []
+    counts = []
+    sums = []
+    for prefix in ['con', 'incon']:
+        trials = sum(getattr(s, prefix+'_trials') for s in summaries)
+        n_correct = sum(getattr(s, prefix+'_correct') for s in summaries)
+        count = sum(getattr(s, prefix+'_count') for s in summaries)
+        total = sum(getattr(s, prefix+'_sum') for s in summaries)
+        sumsq = sum(getattr(s, prefix+'_sumsq') for s in summaries)
+        mean = total/count if count else np.nan
+        std = np.sqrt(max(sumsq/count - mean**2, 0)) if count else np.nan
+        stats += [mean, float(std), 100*n_correct/trials if trials else np.nan]
+        counts += [trials, n_correct]
+        sums += [count, total, sumsq]
+    return SubjectSummary(*stats, *counts, *sums)
+
+def merge_partials(partial_files):
+    """
+    Merges partial aggregates written by write_partial, in the order given.
+    Participants of streamed logs found in more than one partial are combined with combine_summaries. Subjects of data
+    files are identified by the file name only, so a file name in more than one partial (a file copied into two shards,
+    or two subjects with the same file name) raises ValueError instead.
+    Returns (subject_ids, summaries, histograms, source), where source is 'files' only if all partials came from data files.
+    """
+    entries = {}
+    first_partial = {} #Partial file each subject was first found in
+    file_subjects = set() #Subjects of data files
+    histograms = None
+    sources = set()
+    for partial_file in partial_files:
+        with open(partial_file, 'r') as f:
+            partial = json.load(f)
+        if partial.get('version') != partial_version or partial['conditions'] != conditions:
+            raise ValueError('{} is not a compatible partial aggregate'.format(partial_file))
+        if partial['rt_grid'] != list(rt_grid) or partial['percent_grid'] != list(percent_grid):
+            raise ValueError('{} uses different histogram grids'.format(partial_file))
+        sources.add(partial['source'])
+        for entry in partial['subjects']:
+            subject = entry['subject']
+            if subject in first_partial and (subject in file_subjects or partial['source'] == 'files'):
+                raise ValueError('Subject file {} is in both {} and {}'.format(subject, first_partial[subject], partial_file))
+            first_partial.setdefault(subject, partial_file)
+            if partial['source'] == 'files':
+                file_subjects.add(subject)
+            entries.setdefault(subject, []).append(SubjectSummary(*entry['summary']))
+        histograms = add_histograms(histograms, partial['histograms'])
+    
+    subject_ids = list(entries)
+    summaries = [parts[0] if len(parts) == 1 else combine_summaries(parts) for parts in entries.values()]
+    if histograms is None or any(len(parts) > 1 for parts in entries.values()):
+        #Subjects split over shards are counted in several shard histograms, so count them again from the merged means
+        histograms = subject_histograms(summaries)
+    source = 'files' if sources == {'files'} else 'stream'
+    return subject_ids, summaries, histograms, source
+
+#### TRIAL STORE ####
+def database_summaries(database, **filters):
+    """
+    Summaries of the sessions in a trial store (see stroop_store.py), using only the trials selected by filters
+    (see stroop_store.trial_filter). Means, STDs and % correct come from the SQL aggregates per session and condition,
+    the robust RT statistics from the selected reaction times (see stroop_stats.subject_rt_stats).
+    Returns (files, summaries), in the order the sessions were ingested, or two empty lists when no session has
+    selected trials.
+    """
+    connection = stroop_store.connect(database, create=False)
+    with timings.stage('query'):
+        subjects = stroop_store.subject_aggregates(connection, **filters)
+    if len(subjects) == 0:
+        connection.close()
+        return [], []
+    summaries = []
+    for session_id, file, participant, session_date, aggregates in subjects:
+        values = dict.fromkeys(SubjectSummary._fields[:6], np.nan)
+        for prefix, name in zip(['con', 'incon'], conditions):
+            trials, n_correct, count, total, sumsq = aggregates.get(name, (0, 0, 0, 0.0, 0.0))
+            values.update({prefix+'_trials': trials, prefix+'_correct': n_correct, prefix+'_count': count, 
+                           prefix+'_sum': total, prefix+'_sumsq': sumsq})
+        summaries.append(combine_summaries([SubjectSummary(**values)]))
+    
+    #Position of each session in subjects, to group the reaction times per subject
+    position = {subject[0]: n for n, subject in enumerate(subjects)}
+    robust = []
+    for name in conditions:
+        with timings.stage('query'):
+            rows = stroop_store.subject_rts(connection, condition=name, **filters)
+        timings.count('rows', len(rows))
+        with timings.stage('robust_statistics'):
+            subject = np.array([position[row[0]] for row in rows], dtype=np.int64)
+            rt = np.array([row[2] for row in rows], dtype=np.float64)
+            stats = stroop_stats.subject_rt_stats(rt, subject, len(subjects), rt_percentiles, trim_method, trim_threshold)
+            robust.append(np.column_stack([stats[field] for field in robust_fields]))
+    connection.close()
+    robust = np.hstack(robust)
+    summaries = [summary._replace(**dict(zip(SubjectSummary._fields[-robust.shape[1]:], robust[n].tolist())))
+                 for n, summary in enumerate(summaries)]
+    return [subject[1] for subject in subjects], summaries
+
+#### ROBUST STATISTICS ####
+def robust_table(summaries):
+    """
+    Returns the names and values (an array of subjects x columns) of the robust statistics and interference effects
+    that are added to the table.
+    """
+    values = np.array(summaries, dtype=np.float64).reshape(len(summaries), len(SubjectSummary._fields))
+    field = {name: values[:, n] for n, name in enumerate(SubjectSummary._fields)}
+    names = []
+    columns = []
+    for prefix, label in [('con', 'Congruent'), ('incon', 'Incongruent')]:
+        names += ['Median'+label, 'P{:g}{}'.format(rt_percentiles[0], label), 'P{:g}{}'.format(rt_percentiles[1], label),
+                  'TrimmedRT'+label, 'NTrimmed'+label]
+        columns += [field[prefix+'_'+name] for name in robust_fields]
+    names += ['InterferenceRT', 'InterferenceMedian', 'InterferenceTrimmedRT']
+    columns += [field['incon_mean'] - field['con_mean'], field['incon_median'] - field['con_median'],
+                field['incon_trimmed_mean'] - field['con_trimmed_mean']]
+    return names, np.column_stack(columns)
+
+def format_robust(values, names, group=False):
+    #Table fields of robust statistics: RTs in 3 decimals, numbers of trimmed trials as integers for a subject and in
+    #2 decimals for the group rows (means and confidence intervals)
+    trimmed_format = ',{:.2f}' if group else ',{:.0f}'
+    return ''.join((trimmed_format if name.startswith('NTrimmed') else ',{:.3f}').format(value) for name, value in zip(names, values))
+
+#### TABLE ROWS ####
+def table_header(robust_names):
+    return 'ParticipantID,RTCongruent,STDCongruent,%Congruent,RTIncongruent,STDIncongruent,%Incongruent{}\n'.format(''.join(','+name for name in robust_names))
+
+def table_row(label, stats, robust, robust_names, group=False):
+    #Table row of a subject or (group=True) the group: stats are mean RT, STD and % correct of congruent and then incongruent trials
+    return '{},{:.3f},{:.3f},{:.2f},{:3f},{:.3f},{:.2f}'.format(label, *stats) + format_robust(robust, robust_names, group) + '\n'
+
+def printed_row(label, stats):
+    #Console row of a subject or the group, see table_row
+    return '{:<11}{:<6.3f} ±  {:<6.3f}, {:<6.2f}%\t{:<6.3f} ±  {:<6.3f}, {:<6.2f}%'.format(label, *stats)
+
+def print_header():
+    #Print table headers with specific spacing to match the printed outputs
+    print('{:^61s}'.format('### REACTION TIMES TABLE ###'))
+    print('{:<11s}{:^25s}\t{:^25s}'.format('Participant', 'Congruent', 'Incongruent'))
+    print('{:<11s}{:^16}{:>9}\t{:^16}{:>9}'.format('', 'Mean RT ± STD', '%correct', 'Mean RT ± STD', '%correct'))
+
+def confidence_rows(group_values, robust_names, n_resamples):
+    """
+    Table rows CILower and CIUpper with the bootstrap confidence intervals of the group means of group_values (subjects x
+    RT and % correct per condition, then the robust columns). The STD columns are left empty, since the Mean row has
+    the STD of the group there. Returns (rows, lower, upper).
+    """
+    with timings.stage('bootstrap'):
+        lower, upper = stroop_stats.bootstrap_mean_ci(group_values, n_resamples, bootstrap_confidence, bootstrap_seed)
+    timings.count('resamples', n_resamples)
+    rows = ''
+    for label, bound in [('CILower', lower), ('CIUpper', upper)]:
+        rows += '{},{:.3f},,{:.2f},{:3f},,{:.2f}'.format(label, *bound[:4]) + format_robust(bound[4:], robust_names, group=True) + '\n'
+    return rows, lower, upper
+
+def replace_file(filename, content):
+    #Write content to filename through a temporary file, so readers never see a half-written file
+    temp_file = '{}.tmp'.format(filename)
+    with open(temp_file, 'w') as f:
+        f.write(content)
+    os.replace(temp_file, filename)
+
+#### WATCH MODE ####
+class LiveSummary:
+    """
+    Table rows, group sums and histograms of the subject files of a --watch run. Adding, replacing or removing one subject
+    only formats its own row and adds or subtracts its values from the group sums and histogram counts, so the cost of
+    an update does not depend on the number of subjects. Subjects keep the number they got when they were first added.
+    """
+    def __init__(self):
+        self.robust_names = robust_table([])[0]
+        self.rows = {} #subject file -> (number, summary, robust values, table row), in order of number
+        self.next_number = 1
+        n_columns = 4 + len(self.robust_names)
+        self.count = np.zeros(n_columns)
+        self.sum = np.zeros(n_columns)
+        self.sumsq = np.zeros(n_columns)
+        self.histograms = {kind: np.array(counts) for kind, counts in subject_histograms([]).items()}
+
+    def group_values(self, summary, robust):
+        #Values of a subject that are averaged in the Mean row: RT and % correct per condition, then the robust columns
+        return np.concatenate([[summary.con_mean, summary.con_percentage, summary.incon_mean, summary.incon_percentage], robust])
+
+    def add(self, summary, robust, sign=1):
+        #Add (sign=1) or subtract (sign=-1) a subject from the group sums and histograms
+        values = self.group_values(summary, robust)
+        valid = ~np.isnan(values)
+        values = np.where(valid, values, 0)
+        self.count += sign*valid
+        self.sum += sign*values
+        self.sumsq += sign*values**2
+        for kind, counts in subject_histograms([summary]).items():
+            self.histograms[kind] += sign*np.array(counts)
+
+    def update(self, file, summary):
+        """
+        Adds the SubjectSummary of a subject file, or replaces it if the file was added before. Returns its number.
+        """
+        if file in self.rows:
+            number, old_summary, old_robust, row = self.rows[file]
+            self.add(old_summary, old_robust, -1)
+        else:
+            number = self.next_number
+            self.next_number += 1
+        robust = robust_table([summary])[1][0]
+        self.rows[file] = (number, summary, robust, table_row(number, summary[:6], robust, self.robust_names))
+        self.add(summary, robust)
+        return number
+
+    def remove(self, file):
+        """
+        Removes a subject file. Returns its number.
+        """
+        number, summary, robust, row = self.rows.pop(file)
+        self.add(summary, robust, -1)
+        return number
+
+    def means(self):
+        """
+        Group means like the Mean row of the table: returns (stats, robust means), see table_row.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(self.count > 0, self.sum/self.count, np.nan)
+            std = np.sqrt(np.maximum(self.sumsq/self.count - mean**2, 0))
+        return [mean[0], std[0], mean[1], mean[2], std[2], mean[3]], mean[4:]
+
+    def write(self, table_filename, histogram_filename, figure_filename=None, n_resamples=0):
+        """
+        Rewrites the table, histograms and (if figure_filename is given) the figure, each through a temporary file.
+        With n_resamples, the table gets the bootstrap confidence intervals, which take time in proportion to the number of subjects.
+        """
+        stats, robust_means = self.means()
+        table = table_header(self.robust_names) + ''.join(row[3] for row in self.rows.values())
+        table += table_row('Mean', stats, robust_means, self.robust_names, group=True)
+        if n_resamples > 0 and self.rows:
+            group_values = np.array([self.group_values(summary, robust) for number, summary, robust, row in self.rows.values()])
+            table += confidence_rows(group_values, self.robust_names, n_resamples)[0]
+        replace_file(table_filename, table)
+        histograms = {kind: counts.tolist() for kind, counts in self.histograms.items()}
+        write_histograms(histogram_filename + '.tmp', histograms, len(self.rows))
+        os.replace(histogram_filename + '.tmp', histogram_filename)
+        if figure_filename is not None and self.rows:
+            root, extension = os.path.splitext(figure_filename)
+            temp_file = '{}.tmp{}'.format(root, extension)
+            fig = plot_group(histograms, len(self.rows), figure_filename=temp_file, show=False)
+            import matplotlib.pyplot as plt
+            plt.close(fig)
+            os.replace(temp_file, figure_filename)
+
+def watch_subjects(live, watcher, table_filename, histogram_filename, figure_filename=None, n_resamples=0):
+    """
+    Adds every subject file that the watcher (see stroop_watch.py) reports as finished to the LiveSummary, removes deleted
+    files, and rewrites the outputs after every change. Runs until it is interrupted with Ctrl+C, and then writes the
+    outputs once more with the bootstrap confidence intervals.
+    """
+    outputs = {os.path.abspath(filename) for filename in [table_filename, histogram_filename, figure_filename] if filename}
+    print('Watching {} for finished subject files ({}), press Ctrl+C to stop'.format(
+        watcher.directory, 'inotify' if isinstance(watcher, stroop_watch.InotifyWatcher) else 'polling'))
+    try:
+        while True:
+            finished, removed = watcher.wait()
+            changed = False
+            for file in removed:
+                if file in live.rows:
+                    print('Subject {} removed ({})'.format(live.remove(file), os.path.basename(file)))
+                    changed = True
+            for file in finished:
+                if os.path.abspath(file) in outputs:
+                    continue
+                try:
+                    summary = analyse_files([file])[0]
+                except Exception as error:
+                    print('Could not analyse {}: {}'.format(os.path.basename(file), error))
+                    continue
+                number = live.update(file, summary)
+                print(printed_row(number, summary[:6]) + '  ({})'.format(os.path.basename(file)))
+                changed = True
+            if changed:
+                live.write(table_filename, histogram_filename, figure_filename)
+                print(printed_row('Mean', live.means()[0]) + '  ({} subjects)'.format(len(live.rows)))
+    except KeyboardInterrupt:
+        live.write(table_filename, histogram_filename, figure_filename, n_resamples)
+        print('Stopped watching, {} subjects saved to {}'.format(len(live.rows), table_filename))
+    finally:
+        watcher.close()
+
+#### PLOTTING ####
+def plot_group(histograms, n_subjects, figure_filename='group.png', show=True):
+    """
+    Plots the histograms from subject_histograms of subject mean RT and % correct for congruent and incongruent trials
+    and saves the figure to figure_filename. The stored counts are drawn directly, so nothing is binned again here.
+    matplotlib is only imported here, so table-only runs never load it. With show=False, the figure is rendered with the
+    non-interactive Agg backend, which also works without a display (e.g. in cron jobs).
+    """
+    import matplotlib
+    if not show:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    ### Formatting for plotting ###
+    #The bins are the fixed grids, the x-axis only shows the range of bins that contain subjects
+    #For x-ticks: round down/up with floor/ceiling to the nearest 0.1 seconds (RT) or 5% (correct) to get range of x-ticks needed
+    #If the plot has too many ticks, increase the step number
+    edges_rt = grid_edges(rt_grid)
+    min_rt, max_rt = occupied_range(histograms['rt'], edges_rt)
+    min_rtx = floor(min_rt*10)/10
+    max_rtx = ceil(max_rt*10)/10
+    xticks_rt = np.arange(min_rtx, max_rtx+xtickstep_rt, xtickstep_rt)
+
+    edges_percent = grid_edges(percent_grid)
+    min_per, max_per = occupied_range(histograms['percent'], edges_percent)
+    min_perx = floor(min_per/5)*5
+    max_perx = ceil(max_per/5)*5
+    xticks_percent = np.arange(min_perx, max_perx+xtickstep_percent, xtickstep_percent)
+
+    ### Plotting figure ###
+    fig, axs = plt.subplots(1, 2, constrained_layout=True)
+    fig.suptitle('Distribution of RT and % correct\n for congruent and incongruent trials (n={})'.format(n_subjects), fontweight='bold')
+
+    #Reaction times subplot, histograms are stored as [congruent, incongruent]
+    con_rt, incon_rt = histograms['rt']
+    axs[0].stairs(incon_rt, edges_rt, fill=True, color = colors[0], alpha = 0.5)
+    axs[0].stairs(con_rt, edges_rt, fill=True, color = colors[1], alpha = 0.3)
+    #Replot the counts to create the solid outlines
+    axs[0].stairs(incon_rt, edges_rt, color=colors[0], lw=1.3)
+    axs[0].stairs(con_rt, edges_rt, color=colors[1], lw=1.3)
+    #Set x ticks and labels
+    axs[0].xaxis.set_ticks(xticks_rt)
+    axs[0].set_xlim(min_rtx, max_rtx)
+    axs[0].set_xlabel('Time (s)')
+    axs[0].set_ylabel('Count')
+    axs[0].set_title('Reaction time')
+
+    #Correct responses subplot
+    con_percent, incon_percent = histograms['percent']
+    axs[1].stairs(incon_percent, edges_percent, fill=True, color = colors[0], alpha = 0.5)
+    axs[1].stairs(con_percent, edges_percent, fill=True, color = colors[1], alpha = 0.3)
+    #create legend on the right outside of subplot
+    axs[1].legend(['Incongruent', 'Congruent'], loc='upper left', bbox_to_anchor= (1.01, 1.01)) 
+
+    #Replot the counts to create the solid outlines
+    axs[1].stairs(incon_percent, edges_percent, color=colors[0], lw=1.3)
+    axs[1].stairs(con_percent, edges_percent, color=colors[1], lw=1.3)
+
+    #Set x ticks and labels
+    axs[1].xaxis.set_ticks(xticks_percent)
+    axs[1].set_xlim(min_perx, max_perx)
+    axs[1].set_xlabel('Percentage (%)')
+    axs[1].set_title('Correct responses')
+
+    #Plot figure in console or separate window depending on internal settings of Spyder
+    if show:
+        fig.show() 
+
+    ### Saving figure ###
+    fig.savefig(figure_filename, dpi=300)
+    return fig
+
+def occupied_range(counts, edges):
+    """
+    Returns the lower edge of the first and the upper edge of the last bin with a count in any of the histograms in counts.
+    """
+    occupied = np.flatnonzero(np.sum(counts, axis=0))
+    if len(occupied) == 0:
+        return edges[0], edges[-1]
+    return edges[occupied[0]], edges[occupied[-1] + 1]
+
+group_rows = ['Mean', 'CILower', 'CIUpper'] #Rows below the subjects in the table
+
+def read_summary(summary_file):
+    """
+    Reads the histograms of subject means for plot_group from a saved histogram file or partial aggregate (.json), or
+    counts them from a table written by this script (strooptask_summary_*.csv, which has rounded values).
+    Returns (histograms, n_subjects).
+    """
+    if summary_file.endswith('.json'):
+        with open(summary_file, 'r') as f:
+            saved = json.load(f)
+        if saved.get('conditions') != conditions or 'histograms' not in saved:
+            raise ValueError('{} is not a compatible histogram file or partial aggregate'.format(summary_file))
+        if saved['rt_grid'] != list(rt_grid) or saved['percent_grid'] != list(percent_grid):
+            raise ValueError('{} uses different histogram grids'.format(summary_file))
+        n_subjects = saved['n_subjects'] if 'n_subjects' in saved else len(saved['subjects'])
+        return saved['histograms'], n_subjects
+    with open(summary_file) as f:
+        header = f.readline().strip().split(',')
+        rows = [line.strip().split(',') for line in f if line.strip() and line.split(',')[0] not in group_rows]
+    means = {column: [float(row[header.index(column)]) for row in rows] for column in ['RTCongruent', 'RTIncongruent', '%Congruent', '%Incongruent']}
+    histograms = {'rt': [grid_histogram(means['RTCongruent'], rt_grid).tolist(), grid_histogram(means['RTIncongruent'], rt_grid).tolist()],
+                  'percent': [grid_histogram(means['%Congruent'], percent_grid).tolist(), grid_histogram(means['%Incongruent'], percent_grid).tolist()]}
+    return histograms, len(rows)
+
+def benchmark_startup(arguments=(), repeats=3):
+    """
+    Runs this script as a separate process with the given command line arguments, with and without --table-only, and
+    prints the best wall time and peak memory (resident set size, only available on Unix) of each.
+    """
+    import subprocess
+    import time
+    results = {}
+    for label, extra in [('table and figure', []), ('table only', ['--table-only'])]:
+        times = []
+        peaks = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            process = subprocess.Popen([sys.executable, os.path.abspath(__file__)] + list(arguments) + extra,
+                                       stdout=subprocess.DEVNULL, env=dict(os.environ, MPLBACKEND='Agg'))
+            if hasattr(os, 'wait4'):
+                usage = os.wait4(process.pid, 0)[2]
+                #ru_maxrss is in kilobytes on Linux and in bytes on macOS
+                peaks.append(usage.ru_maxrss/1024 if sys.platform != 'darwin' else usage.ru_maxrss/1024**2)
+            else:
+                process.wait()
+            times.append(time.perf_counter() - start)
+        results[label] = (min(times), max(peaks) if peaks else None)
+        print('{:<17s}{:8.3f} s   peak memory {}'.format(label, min(times), '{:.1f} MB'.format(max(peaks)) if peaks else 'n/a'))
+    return results
+
+if __name__ == '__main__':
+    #Extracting .csv files from specified directory
+    directory = 'C:\\Stroop\\data'
+    filename = '*.csv'
+
+    #Command line options override the processing settings above
+    parser = argparse.ArgumentParser(description='Summarise stroop_task data files')
+    parser.add_argument('--workers', type=int, default=n_workers, help='number of worker processes (default: {})'.format(n_workers))
+    parser.add_argument('--serial', action='store_true', help='analyse the subject files serially in this process')
+    parser.add_argument('--no-cache', action='store_true', help='ignore and do not update the cache of earlier runs')
+    parser.add_argument('--stream', nargs='+', metavar='FILE', help='summarise concatenated trial logs with a {} column in chunks'.format(participant_column_name))
+    parser.add_argument('--chunk-lines', type=int, default=stream_chunk_lines, help='lines per chunk in --stream mode (default: {})'.format(stream_chunk_lines))
+    parser.add_argument('--binary', action='store_true', help='analyse the binary {} trial files instead of the .csv files'.format(stroop_trialformat.extension))
+    parser.add_argument('--emit-partial', metavar='FILE', help='write a partial aggregate of this shard to FILE instead of the table and figure')
+    parser.add_argument('--merge', nargs='+', metavar='FILE', help='merge partial aggregates written with --emit-partial')
+    parser.add_argument('--table-only', action='store_true', help='write the table without making the figure (matplotlib is not imported)')
+    parser.add_argument('--plot-summary', nargs='+', metavar='FILE', help='only render the figure (headless) from the summed histograms of saved histogram files, tables or partial aggregates')
+    parser.add_argument('--figure', default='group.png', help='file name of the figure (default: group.png)')
+    parser.add_argument('--bootstrap', type=int, default=n_bootstrap, metavar='N', help='bootstrap resamples for the confidence intervals (default: {}, 0 disables them)'.format(n_bootstrap))
+    parser.add_argument('--db', nargs='?', const=stroop_store.database_filename, metavar='FILE', 
+                        help='analyse the sessions in a trial store made with stroop_store.py (default: {})'.format(stroop_store.database_filename))
+    stroop_store.add_filter_arguments(parser)
+    parser.add_argument('--watch', action='store_true', help='keep running and update the outputs whenever a subject file is finished')
+    parser.add_argument('--settle', type=float, default=watch_settle, help='seconds a file must be unchanged to count as finished when --watch polls (default: {})'.format(watch_settle))
+    parser.add_argument('--benchmark-startup', action='store_true', help='compare run time and peak memory with and without --table-only')
+    parser.add_argument('--directory', default=directory, help='directory of the subject files (default: {})'.format(directory))
+    parser.add_argument('--timings', metavar='FILE', help='save the per-stage timings and counters as JSON to FILE (- prints them)')
+    args = parser.parse_args()
+    directory = args.directory
+    filters = stroop_store.filter_arguments(args)
+    if not args.db and any(value is not None for value in filters.values()):
+        parser.error('--date-from, --date-to, --participant and --colour-pair need --db')
+    if args.workers is not None and args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.watch and (args.db or args.stream or args.merge):
+        parser.error('--watch follows the subject files of --directory and can not be combined with --db, --stream or --merge')
+    if args.benchmark_startup:
+        benchmark_startup([argument for argument in sys.argv[1:] if argument != '--benchmark-startup'])
+        raise SystemExit
+    if args.plot_summary:
+        histograms = None
+        n_subjects = 0
+        with timings.stage('read_summary'):
+            for summary_file in args.plot_summary:
+                file_histograms, file_subjects = read_summary(summary_file)
+                histograms = add_histograms(histograms, file_histograms)
+                n_subjects += file_subjects
+        with timings.stage('plot'):
+            plot_group(histograms, n_subjects, figure_filename=args.figure, show=False)
+        print('Figure of {} subjects saved to {}'.format(n_subjects, args.figure))
+        if args.timings:
+            timings.write(args.timings, 'stroop_analyser')
+        raise SystemExit
+    workers = 1 if args.serial else args.workers
+    if args.binary:
+        filename = '*{}'.format(stroop_trialformat.extension)
+    filepath = os.path.join(directory, filename)
+    if args.watch:
+        #Start from the subject files that are already finished, files that are still being written follow later
+        watcher = stroop_watch.open_watcher(directory, filename, args.settle, watch_interval)
+
+    if args.merge:
+        #Combine the partial aggregates of all shards
+        with timings.stage('merge'):
+            subject_ids, summaries, histograms, source = merge_partials(args.merge)
+    elif args.stream:
+        #Aggregate the concatenated logs chunk by chunk, subjects are reported by participant id
+        stats = RunningStats()
+        for log in args.stream:
+            stream_trial_log(log, args.chunk_lines, stats)
+        summaries = stats.summaries()
+        subject_ids = stats.participants
+        source = 'stream'
+        histograms = subject_histograms(summaries)
+    elif args.db:
+        #Query the per-subject aggregates of the selected trials from the trial store
+        subject_ids, summaries = database_summaries(args.db, **filters)
+        source = 'files'
+        histograms = subject_histograms(summaries)
+    else:
+        #Analyse the subject files (in parallel if requested), then report each subject in the original file order
+        with timings.stage('discover'):
+            subject_files = watcher.scan()[0] if args.watch else glob.glob(filepath)
+        if args.no_cache or cache_filename is None:
+            summaries = analyse_subjects(subject_files, workers)
+        else:
+            summaries = analyse_subjects_cached(subject_files, workers, cache_filename)
+        subject_ids = [os.path.basename(file) for file in subject_files]
+        source = 'files'
+        histograms = subject_histograms(summaries)
+    n_subjects = len(summaries)
+    timings.count('subjects', n_subjects)
+    #Subjects from data files are numbered, subjects from concatenated logs are reported by participant id
+    participants = range(1, n_subjects+1) if source == 'files' else subject_ids
+
+    if args.emit_partial:
+        write_partial(args.emit_partial, subject_ids, summaries, source)
+        print('Partial aggregate of {} subjects written to {}'.format(n_subjects, args.emit_partial))
+        if args.timings:
+            timings.write(args.timings, 'stroop_analyser')
+        raise SystemExit
+
+    #Preparing file to save reaction time data
+    analysis_date = datetime.datetime.now().strftime('%H%M_%d%m%Y')
+    table_filename = 'strooptask_summary_{}.csv'.format(analysis_date) 
+    histogram_filename = 'strooptask_histograms_{}.json'.format(analysis_date)
+
+    if args.watch:
+        #Print the table of the finished files, then keep it up to date
+        live = LiveSummary()
+        print_header()
+        for file, summary in zip(subject_files, summaries):
+            print(printed_row(live.update(file, summary), summary[:6]))
+        print(printed_row('Mean', live.means()[0]))
+        figure_filename = None if args.table_only else args.figure
+        live.write(table_filename, histogram_filename, figure_filename)
+        watch_subjects(live, watcher, table_filename, histogram_filename, figure_filename, args.bootstrap)
+        if args.timings:
+            timings.write(args.timings, 'stroop_analyser')
+        raise SystemExit
+
+    table = open(table_filename, 'w')
+    with timings.stage('table'):
+        robust_names, robust_values = robust_table(summaries)
+    table.write(table_header(robust_names))
+    print_header()
+
+    #### ANALYSING SUBJECT DATA #####
+    #Loops through the data files per subject and extracts all reaction times, which are split up depending on whether
+    #the trial was congruent or incongruent
+    #It also calculates the percentages of correct responses for both trial types.
+    #Then, the mean and standard deviation of the subjects reaction time and % correct are printed and saved to the table summary file 
+    # Mean Reaction time and % correct are also saved in variables for the group mean below
+
+    meanrts_congruent = []
+    meanrts_incongruent = []
+    meanpercent_congruent = []
+    meanpercent_incongruent = []
+
+    with timings.stage('table'):
+        for participant, summary, robust in zip(participants, summaries, robust_values):
+            con_mean, con_std, con_percentage, incon_mean, incon_std, incon_percentage = summary[:6]
+            #Save data for the group mean
+            meanrts_congruent.append(con_mean)
+            meanrts_incongruent.append(incon_mean)
+            meanpercent_congruent.append(con_percentage)
+            meanpercent_incongruent.append(incon_percentage)
     
-    #Print data for this subject
-    print('{:<11}{:<6.3f} ±  {:<6.3f}, {:<6.2f}%\t{:<6.3f} ±  {:<6.3f}, {:<6.2f}%'.format(n+1, con_mean, con_std, con_percentage, incon_mean, incon_std, incon_percentage))
+            #Print data for this subject
+            print(printed_row(participant, summary[:6]))
     
-    #Save data for this subject to table file
-    table.write('{},{:.3f},{:.3f},{:.2f},{:3f},{:.3f},{:.2f}\n'.format(n+1, con_mean, con_std, con_percentage, incon_mean, incon_std, incon_percentage))
-
-#Print mean RT and percentage correct for the whole group and write it to the table
-print('{:<11}{:<6.3f} ±  {:<6.3f}, {:<6.2f}%\t{:<6.3f} ±  {:<6.3f}, {:<6.2f}%'.format('Mean', np.nanmean(meanrts_congruent), np.nanstd(meanrts_congruent), np.nanmean(meanpercent_congruent),
-                                                                                      np.nanmean(meanrts_incongruent), np.nanstd(meanrts_incongruent), np.nanmean(meanpercent_incongruent)))
-table.write('{},{:.3f},{:.3f},{:.2f},{:3f},{:.3f},{:.2f}\n'.format('Mean', np.nanmean(meanrts_congruent), np.nanstd(meanrts_congruent), np.nanmean(meanpercent_congruent),
-                                                                   np.nanmean(meanrts_incongruent), np.nanstd(meanrts_incongruent), np.nanmean(meanpercent_incongruent)))
-table.close() #close table file 
-
-### Formatting for plotting ###
-# PREPARE BINWIDTH AND XTICKS FOR REACTION TIME PLOT
-#Extract lowest and highest rt to control the width of the histogram bins and the x-ticks/range of the plot
-#For bins: create a range of values from min to max with a specified binwidth of 0.02 seconds, to ensure the data has the same resolution in each condition
-#For x-ticks: round down/up with floor/ceiling to the nearest 0.1 seconds respectively to get range of x-ticks needed
-min_rt = min([min(meanrts_congruent), min(meanrts_incongruent)])
-max_rt = max([max(meanrts_congruent), max(meanrts_incongruent)])
-binwidth_rt = 0.02 #Bin resolution for reaction times
-bins_rt = np.arange(min_rt, max_rt + binwidth_rt, binwidth_rt)
-
-min_rtx = floor(min_rt*10)/10
-max_rtx = ceil(max_rt*10)/10
-xticks_rt = np.arange(min_rtx, max_rtx+xtickstep_rt, xtickstep_rt)
-
-# PREPARE BINWIDTH AND XTICKS FOR CORRECT RESPONSES PLOT
-#Same as for reaction times plot, but with %correct data
-#Binwidth is 1%
-#X-ticks are rounded down/up to the nearest 5%. If the plot has too many ticks, increase the step number
-min_per = min([min(meanpercent_congruent), min(meanpercent_incongruent)])
-max_per = max([max(meanpercent_congruent), max(meanpercent_incongruent)])
-binwidth_percent = 1
-bins_percent = np.arange(min_per, max_per+binwidth_percent, binwidth_percent)
-
-min_perx = floor(min_per/5)*5
-max_perx = ceil(max_per/5)*5
-xticks_percent = np.arange(min_perx, max_perx+xtickstep_percent, xtickstep_percent)
-
-### Plotting figure ###
-fig, axs = plt.subplots(1, 2, constrained_layout=True)
-fig.suptitle('Distribution of RT and % correct\n for congruent and incongruent trials (n={})'.format(n_subjects), fontweight='bold')
-
-#Reaction times subplot
-axs[0].hist(meanrts_incongruent, bins = bins_rt, color = colors[0], alpha = 0.5)
-axs[0].hist(meanrts_congruent, bins = bins_rt, color = colors[1], alpha = 0.3)
-#Replot the data to create the solid outlines
-axs[0].hist(meanrts_incongruent, bins = bins_rt, facecolor="None", edgecolor=colors[0], lw=1.3)
-axs[0].hist(meanrts_congruent, bins = bins_rt, facecolor="None", edgecolor=colors[1], lw=1.3)
-#Set x ticks and labels
-axs[0].xaxis.set_ticks(xticks_rt)
-axs[0].set_xlabel('Time (s)')
-axs[0].set_ylabel('Count')
-axs[0].set_title('Reaction time')
-
-#Correct responses subplot
-axs[1].hist(meanpercent_incongruent, bins = bins_percent, color = colors[0], alpha = 0.5)
-axs[1].hist(meanpercent_congruent, bins = bins_percent, color = colors[1], alpha = 0.3)
-#create legend on the right outside of subplot
-axs[1].legend(['Incongruent', 'Congruent'], loc='upper left', bbox_to_anchor= (1.01, 1.01)) 
-
-#Replot the data to create the solid outlines
-axs[1].hist(meanpercent_incongruent, bins = bins_percent, facecolor="None", edgecolor=colors[0], lw=1.3)
-axs[1].hist(meanpercent_congruent, bins = bins_percent,facecolor="None", edgecolor=colors[1], lw=1.3)
-
-#Set x ticks and labels
-axs[1].xaxis.set_ticks(xticks_percent)
-axs[1].set_xlabel('Percentage (%)')
-axs[1].set_title('Correct responses')
-
-#Plot figure in console or separate window depending on internal settings of Spyder
-fig.show() 
-
-### Saving figure ###
-fig.savefig('group.png', dpi=300)
+            #Save data for this subject to table file
+            table.write(table_row(participant, summary[:6], robust, robust_names))
+
+    #Print mean RT and percentage correct for the whole group and write it to the table (NaN without subjects)
+    if len(meanrts_congruent) == 0:
+        group_stats = [np.nan]*6
+    else:
+        group_stats = [np.nanmean(meanrts_congruent), np.nanstd(meanrts_congruent), np.nanmean(meanpercent_congruent),
+                       np.nanmean(meanrts_incongruent), np.nanstd(meanrts_incongruent), np.nanmean(meanpercent_incongruent)]
+    print(printed_row('Mean', group_stats))
+    robust_means = stroop_stats.column_means(robust_values)
+    table.write(table_row('Mean', group_stats, robust_means, robust_names, group=True))
+
+    #Bootstrap confidence intervals of the group means
+    if args.bootstrap > 0:
+        group_values = np.column_stack([meanrts_congruent, meanpercent_congruent, meanrts_incongruent, meanpercent_incongruent, robust_values])
+        rows, lower, upper = confidence_rows(group_values, robust_names, args.bootstrap)
+        table.write(rows)
+        #Print the interference effects of the group with their confidence intervals
+        print('{}% bootstrap confidence intervals of the group mean ({} resamples):'.format(bootstrap_confidence, args.bootstrap))
+        for n, name in enumerate(robust_names):
+            if name.startswith('Interference'):
+                print('{:<22s}{:6.3f} s  [{:.3f}, {:.3f}]'.format(name, robust_means[n], lower[4+n], upper[4+n]))
+    table.close() #close table file 
+
+    #Save the histograms of subject means, so the figure can be rendered again or combined with other runs
+    with timings.stage('output'):
+        write_histograms(histogram_filename, histograms, n_subjects)
 
+    if not args.table_only:
+        with timings.stage('plot'):
+            plot_group(histograms, n_subjects, figure_filename=args.figure)
+    if args.timings:
+        timings.write(args.timings, 'stroop_analyser')
@@ -0,0 +1,267 @@
+"""
+Benchmark suite for random_word_stimuli, stroop_task and stroop_analyser
+
+Runs the three scripts with --timings (see stroop_timing.py) on reproducible synthetic data of growing size, and compares
+the time of every stage with a recorded baseline, so regressions show up as soon as they are made:
+    python stroop_benchmark.py --record     # run the benchmarks and save the results as the baseline
+    python stroop_benchmark.py              # run them again and report the stages that became slower
+
+- Subject datasets of 10 up to 100,000 subjects (scales) are generated from benchmark_seed, with the trial design and
+  simulated participants of stroop_task, in data_directory. They are only generated once, later runs reuse them.
+  stroop_analyser summarises each dataset (--table-only, without cache), then renders the figure from its histograms.
+- stroop_task simulates at most task_sessions headless sessions per scale.
+- random_word_stimuli builds the word index and samples 1000 stimulus lists from word lists that are words.txt repeated
+  word_scales times. In every copy the first letters are shifted, so the copies add new words with the same lengths
+  and word endings.
+Every benchmark runs repeats times in a new process and the fastest run counts, for the total and for each stage.
+A stage (or the total) is a regression when it is more than regression_tolerance times slower than in the baseline,
+and at least regression_minimum seconds slower. Baselines depend on the machine, so record one on every machine used.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import datetime
+import subprocess
+import numpy as np
+import stroop_task
+import stroop_sequences
+import stroop_logger
+
+#### Benchmark settings ####
+scales = [10, 100, 1000, 10000, 100000] #Numbers of subjects of the synthetic datasets
+word_scales = [1, 4, 16] #Numbers of copies of words.txt in the scaled word lists
+task_sessions = 1000 #stroop_task simulates at most this many sessions per scale
+benchmark_seed = 2020 #Seed of the synthetic datasets and of the random choices of the benchmarked scripts
+repeats = 3 #Runs per benchmark, the fastest counts
+regression_tolerance = 1.5 #A stage is a regression when it is more than this many times slower than in the baseline
+regression_minimum = 0.05 #...and at least this many seconds slower
+data_directory = 'benchmark_data' #Synthetic datasets, scaled word lists and the working directories of the runs
+baseline_filename = 'benchmark_baseline.json'
+results_filename = 'benchmark_results.json'
+dataset_version = 1 #Increase when the synthetic data change, so existing datasets are generated again
+script_directory = os.path.dirname(os.path.abspath(__file__))
+
+#### SYNTHETIC DATA ####
+def write_subjects(directory, n_subjects, seed=benchmark_seed):
+    """
+    Writes n_subjects synthetic subject files to directory, in the .csv format of stroop_task: the trials of the
+    stroop_task design in a random order, with ex-Gaussian reaction times and accuracy of the simulated participant
+    (simulated_rt and simulated_accuracy of stroop_task). The data depend only on seed and n_subjects.
+    """
+    os.makedirs(directory, exist_ok=True)
+    counts = stroop_sequences.trial_counts(stroop_task.colours, stroop_task.n_congruent, stroop_task.n_incongruent)
+    pairs = [pair for pair, n in counts.items() for _ in range(n)]
+    colourtext = np.array([word for word, drawn in pairs])
+    colourname = np.array([drawn for word, drawn in pairs])
+    incongruent = colourtext != colourname
+    condition = np.where(incongruent, 'incongruent', 'congruent')
+    mu, sigma, tau = [np.where(incongruent, stroop_task.simulated_rt['incongruent'][n], stroop_task.simulated_rt['congruent'][n]) for n in range(3)]
+    accuracy = np.where(incongruent, stroop_task.simulated_accuracy['incongruent'], stroop_task.simulated_accuracy['congruent'])
+    n_colours = len(stroop_task.colours)
+    colour_index = np.array([stroop_task.colours.index(colour) for colour in colourname])
+
+    rng = np.random.default_rng(seed)
+    for participantid in range(1, n_subjects + 1):
+        order = rng.permutation(len(pairs))
+        rt = np.maximum(rng.normal(mu, sigma) + rng.exponential(tau), 0.0)[order]
+        correct = (rng.random(len(pairs)) < accuracy)[order]
+        #A wrong response is one of the other colours
+        response = np.where(correct, colour_index[order], (colour_index[order] + rng.integers(1, n_colours, len(pairs))) % n_colours)
+        lines = ['{:d},{},{},{},{},{:.6f},{}\n'.format(trialnum + 1, colourtext[n], colourname[n], condition[n],
+                                                         stroop_task.colours[response[trialnum]], rt[trialnum], bool(correct[trialnum]))
+                 for trialnum, n in enumerate(order.tolist())]
+        filename = stroop_task.make_filename({'expname': 'Stroop', 'participantid': participantid, 'expdate': '1200_01012020'})
+        with open(os.path.join(directory, filename), 'w') as f:
+            f.write(stroop_logger.csv_header)
+            f.writelines(lines)
+
+def subject_dataset(n_subjects):
+    """
+    Directory of the synthetic dataset of n_subjects subjects, which is generated first if it does not exist yet.
+    """
+    directory = os.path.join(data_directory, 'subjects_{}'.format(n_subjects))
+    description = {'version': dataset_version, 'n_subjects': n_subjects, 'seed': benchmark_seed}
+    marker = os.path.join(directory, 'dataset.json')
+    try:
+        with open(marker, 'r') as f:
+            if json.load(f) == description:
+                return directory
+    except (OSError, ValueError):
+        pass
+    print('Generating {} synthetic subjects in {}'.format(n_subjects, directory))
+    shutil.rmtree(directory, ignore_errors=True)
+    write_subjects(directory, n_subjects)
+    #The marker is written last, so an interrupted generation is started again
+    with open(marker, 'w') as f:
+        json.dump(description, f)
+    return directory
+
+def shift_letter(letter, shift):
+    # Shifts a letter through the alphabet (keeping its case), other characters are not changed
+    if 'a' <= letter <= 'z':
+        return chr((ord(letter) - ord('a') + shift) % 26 + ord('a'))
+    if 'A' <= letter <= 'Z':
+        return chr((ord(letter) - ord('A') + shift) % 26 + ord('A'))
+    return letter
+
+def scaled_word_list(copies, source='words.txt'):
+    """
+    Word file with copies copies of source, generated in data_directory if it does not exist yet. In copy c, the first
+    letter of every word is shifted by c and the second letter by c // 26 places, so word lengths and endings are kept.
+    """
+    filename = os.path.join(data_directory, 'words_x{}.txt'.format(copies))
+    if os.path.exists(filename):
+        return filename
+    os.makedirs(data_directory, exist_ok=True)
+    with open(os.path.join(script_directory, source), 'r') as f:
+        words = f.read().splitlines()
+    with open(filename + '.tmp', 'w') as f:
+        for copy in range(copies):
+            for word in words:
+                if copy and len(word) > 2:
+                    word = shift_letter(word[0], copy) + shift_letter(word[1], copy // 26) + word[2:]
+                elif copy and word:
+                    word = shift_letter(word[0], copy) + word[1:]
+                f.write(word + '\n')
+    os.replace(filename + '.tmp', filename)
+    return filename
+
+#### RUNNING BENCHMARKS ####
+def run_script(script, arguments, workdir, prepare=None):
+    """
+    Runs script (one of the benchmarked scripts) with arguments and --timings in workdir, repeats times.
+    prepare is called before every run (e.g. to remove an index). Returns the wall time, total time, stage times and
+    counters of the fastest runs (per stage).
+    """
+    os.makedirs(workdir, exist_ok=True)
+    timings_file = os.path.join(os.path.abspath(workdir), 'timings.json')
+    environment = dict(os.environ, MPLBACKEND='Agg')
+    best = None
+    for _ in range(repeats):
+        if prepare is not None:
+            prepare()
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(script_directory, script)] + arguments + ['--timings', timings_file],
+                       cwd=workdir, env=environment, stdout=subprocess.DEVNULL, check=True)
+        wall = time.perf_counter() - start
+        with open(timings_file, 'r') as f:
+            report = json.load(f)
+        stages = {name: stage['seconds'] for name, stage in report['stages'].items()}
+        if best is None:
+            best = {'wall_seconds': wall, 'total_seconds': report['total_seconds'], 'stages': stages, 'counters': report['counters']}
+            continue
+        best['wall_seconds'] = min(best['wall_seconds'], wall)
+        best['total_seconds'] = min(best['total_seconds'], report['total_seconds'])
+        for name, seconds in stages.items():
+            best['stages'][name] = min(best['stages'].get(name, seconds), seconds)
+    return best
+
+def run_benchmarks(subject_scales=scales, copies_scales=word_scales, suites=('words', 'task', 'analyser')):
+    """
+    Runs the benchmarks of the selected suites. Returns a dictionary of benchmark name -> result (see run_script).
+    """
+    results = {}
+    runs = os.path.join(data_directory, 'runs')
+    if 'words' in suites:
+        for copies in copies_scales:
+            words = os.path.abspath(scaled_word_list(copies))
+            name = 'random_word_stimuli/words_x{}'.format(copies)
+            print('Running', name)
+            results[name] = run_script('random_word_stimuli.py', ['--words', words, '--lists', '1000', '--seed', str(benchmark_seed)],
+                                       os.path.join(runs, 'words'), lambda: shutil.rmtree(words + '.index', ignore_errors=True))
+    if 'task' in suites:
+        for n_sessions in sorted({min(n, task_sessions) for n in subject_scales}):
+            name = 'stroop_task/sessions_{}'.format(n_sessions)
+            print('Running', name)
+            output = os.path.abspath(os.path.join(runs, 'task', 'data'))
+            results[name] = run_script('stroop_task.py', ['--headless', '--sessions', str(n_sessions), '--seed', str(benchmark_seed),
+                                                          '--output-dir', output],
+                                       os.path.join(runs, 'task'), lambda: shutil.rmtree(output, ignore_errors=True))
+    if 'analyser' in suites:
+        for n_subjects in subject_scales:
+            directory = os.path.abspath(subject_dataset(n_subjects))
+            workdir = os.path.join(runs, 'analyser_{}'.format(n_subjects))
+            shutil.rmtree(workdir, ignore_errors=True)
+            name = 'stroop_analyser/subjects_{}'.format(n_subjects)
+            print('Running', name)
+            results[name] = run_script('stroop_analyser.py', ['--directory', directory, '--no-cache', '--table-only'], workdir)
+            #Render the figure from the histograms of the last run
+            histograms = sorted(entry for entry in os.listdir(workdir) if entry.startswith('strooptask_histograms_'))[-1]
+            name = 'stroop_analyser/figure_{}'.format(n_subjects)
+            print('Running', name)
+            results[name] = run_script('stroop_analyser.py', ['--plot-summary', histograms, '--figure', 'group.png'], workdir)
+    return results
+
+#### BASELINES ####
+def compare(results, baseline):
+    """
+    Compares the results with the baseline results. Returns a list of (benchmark, stage, seconds, baseline seconds) of
+    all regressions, where the stage 'total' is the total time of the script.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        pairs = [('total', result['total_seconds'], baseline[name]['total_seconds'])]
+        pairs += [(stage, seconds, baseline[name]['stages'][stage]) for stage, seconds in result['stages'].items()
+                  if stage in baseline[name]['stages']]
+        for stage, seconds, base in pairs:
+            if seconds > regression_tolerance*base and seconds - base >= regression_minimum:
+                regressions.append((name, stage, seconds, base))
+    return regressions
+
+def print_results(results, baseline=None):
+    # One line per benchmark: total time (and baseline), then the slowest stages
+    for name, result in results.items():
+        line = '{:<36s}{:9.3f} s'.format(name, result['total_seconds'])
+        if baseline and name in baseline:
+            line += ' (baseline {:.3f} s, {:+.0%})'.format(baseline[name]['total_seconds'],
+                                                            result['total_seconds']/baseline[name]['total_seconds'] - 1)
+        stages = sorted(result['stages'].items(), key=lambda stage: -stage[1])[:3]
+        print(line + '   ' + ', '.join('{} {:.3f}'.format(stage, seconds) for stage, seconds in stages))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark random_word_stimuli, stroop_task and stroop_analyser on scaled synthetic data')
+    parser.add_argument('--scales', type=int, nargs='+', default=scales, help='numbers of subjects (default: {})'.format(scales))
+    parser.add_argument('--word-scales', type=int, nargs='+', default=word_scales, help='copies of words.txt (default: {})'.format(word_scales))
+    parser.add_argument('--suites', nargs='+', choices=['words', 'task', 'analyser'], default=['words', 'task', 'analyser'],
+                        help='benchmarks to run (default: all)')
+    parser.add_argument('--repeats', type=int, default=repeats, help='runs per benchmark (default: {})'.format(repeats))
+    parser.add_argument('--record', action='store_true', help='save the results as the new baseline')
+    parser.add_argument('--baseline', default=baseline_filename, help='baseline file (default: {})'.format(baseline_filename))
+    parser.add_argument('--output', default=results_filename, help='file for the results (default: {})'.format(results_filename))
+    args = parser.parse_args()
+    repeats = args.repeats
+
+    results = run_benchmarks(args.scales, args.word_scales, args.suites)
+    report = {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+              'machine': platform.platform(), 'cpus': os.cpu_count(), 'repeats': repeats, 'benchmarks': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+    print()
+    print_results(results, baseline['benchmarks'] if baseline else None)
+    if args.record:
+        #Keep the baseline of benchmarks that were not run this time
+        if baseline:
+            report['benchmarks'] = dict(baseline['benchmarks'], **results)
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=1)
+        print('Baseline saved to {}'.format(args.baseline))
+    elif baseline:
+        regressions = compare(results, baseline['benchmarks'])
+        for name, stage, seconds, base in regressions:
+            print('Regression in {} ({}): {:.3f} s, baseline {:.3f} s'.format(name, stage, seconds, base))
+        if regressions:
+            raise SystemExit(1)
+        print('No regressions against {} ({})'.format(args.baseline, baseline['date']))
+    else:
+        print('No baseline yet, save one with --record')
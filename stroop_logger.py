@@ -0,0 +1,176 @@
+"""
+Background trial logger for stroop_task
+
+The trial loop of stroop_task hands each trial to a TrialLogger, which only puts it on a queue. A background thread
+writes the queued trials to the .csv and/or binary data file, so the timing-critical trial loop never waits on disk I/O.
+The data files are flushed and synced to disk (fsync) whenever flush() is called, which stroop_task does at every block
+break, and when the logger is closed, which also happens automatically when the Python process exits.
+
+While the session runs, its data files are written under a temporary name ending in partial_suffix, and they are only
+renamed to their own name when the logger is closed. So a data file under its own name is always finished, which
+stroop_analyser --watch and stroop_store rely on: they never pick up the files of a running session.
+
+If a session crashed, its data files keep the temporary name. recover_session removes an incomplete last trial from
+such a file and gives it its own name, so the file can be analysed as usual. Run this script with one or more data
+files to recover them:
+    python stroop_logger.py Stroop_P1_1200_01012020.csv.part
+"""
+import os
+import queue
+import atexit
+import argparse
+import threading
+import stroop_trialformat
+
+csv_header = 'trialnum,colourtext,colourname,condition,response,rt,correct\n'
+csv_columns = csv_header.count(',') + 1
+partial_suffix = '.part'  # Added to the names of the data files while they are written
+
+
+class TrialLogger:
+    """
+    Writes trials to a .csv file (csv_filename) and/or a binary trial file (binary_filename, which needs the list of
+    colours for its header) from a background thread. With fsync=False, flushing does not wait for the disk.
+    The files are written as filename + partial_suffix, and renamed to filename when the logger is closed.
+    """
+    def __init__(self, csv_filename=None, binary_filename=None, colours=None, fsync=True):
+        self.fsync = fsync
+        self.csv = None
+        self.binary = None
+        self.filenames = [filename for filename in [csv_filename, binary_filename] if filename is not None]
+        if csv_filename is not None:
+            self.csv = open(csv_filename + partial_suffix, 'w')
+            self.csv.write(csv_header)
+        if binary_filename is not None:
+            self.binary = stroop_trialformat.TrialWriter(binary_filename + partial_suffix, colours)
+        self.queue = queue.Queue()
+        self.error = None
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name='TrialLogger', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def log(self, trialnum, colourtext, colourname, condition, response, rt, correct):
+        """
+        Queues one trial for writing and returns immediately. Raises ValueError once the logger is closed, like writing to
+        a closed file, since the trial would otherwise be lost.
+        """
+        if self.closed:
+            raise ValueError('Trial {} logged after the data files were closed'.format(trialnum))
+        self.queue.put(('trial', (trialnum, colourtext, colourname, condition, response, rt, correct)))
+
+    def flush(self):
+        """
+        Waits until all queued trials are written, then flushes the data files and syncs them to disk.
+        """
+        if self.closed:
+            return
+        done = threading.Event()
+        self.queue.put(('flush', done))
+        done.wait()
+        self.check()
+
+    def close(self):
+        """
+        Writes all queued trials, syncs the data files to disk, closes them and renames them to their own names.
+        Calling close again does nothing.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(('close', None))
+        self.thread.join()
+        atexit.unregister(self.close)
+        for filename in self.filenames:
+            os.replace(filename + partial_suffix, filename)
+        self.check()
+
+    def check(self):
+        # Raise an error of the writer thread in the thread of the experiment
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def run(self):
+        # Writer thread: write queued trials until the logger is closed
+        while True:
+            kind, item = self.queue.get()
+            try:
+                if kind == 'trial':
+                    self.write(*item)
+                else:
+                    self.sync(close=kind == 'close')
+            except Exception as error:
+                self.error = error
+            finally:
+                if kind == 'flush':
+                    item.set()
+            if kind == 'close':
+                return
+
+    def write(self, trialnum, colourtext, colourname, condition, response, rt, correct):
+        if self.csv is not None:
+            self.csv.write('{:d},{},{},{},{},{:.6f},{}\n'.format(trialnum, colourtext, colourname, condition, response, rt,
+                                                                 correct))
+        if self.binary is not None:
+            # rt is rounded to microseconds like in the .csv file, so both files give the same analysis results
+            self.binary.write(trialnum, colourtext, colourname, condition, response, round(rt, 6), correct)
+
+    def sync(self, close=False):
+        for datafile in [self.csv, self.binary and self.binary.f]:
+            if datafile is None or datafile.closed:
+                continue
+            datafile.flush()
+            if self.fsync:
+                os.fsync(datafile.fileno())
+            if close:
+                datafile.close()
+
+
+def truncate_trials(filename, binary):
+    # Removes an incomplete last trial from a .csv or (binary=True) binary data file, see recover_session.
+    # Returns the number of complete trials in the file
+    if binary:
+        with open(filename, 'r+b') as f:
+            # The header size is a uint16, so the first 64 kB hold the whole header
+            if stroop_trialformat.incomplete_header(f.read(1 << 16)):
+                f.truncate(0)
+                return 0
+            f.seek(0)
+            colours, header_size = stroop_trialformat.read_header(f)
+            size = f.seek(0, 2)
+            n_trials = (size - header_size) // stroop_trialformat.record_dtype.itemsize
+            f.truncate(header_size + n_trials * stroop_trialformat.record_dtype.itemsize)
+        return n_trials
+
+    with open(filename, 'r+b') as f:
+        content = f.read()
+        # Keep everything up to the last complete line, and drop that line too if it does not have all columns
+        end = content.rfind(b'\n') + 1
+        laststart = content.rfind(b'\n', 0, max(end - 1, 0)) + 1
+        if laststart > 0 and content[laststart:end].count(b',') + 1 != csv_columns:
+            end = laststart
+        f.truncate(end)
+    return max(content[:end].count(b'\n') - 1, 0)
+
+
+def recover_session(filename):
+    """
+    Removes an incomplete last trial from a .csv or binary data file of a crashed session.
+    A binary file that ends within its header (a session that crashed before its first trials were written) is emptied.
+    A file with a temporary name (ending in partial_suffix) is then renamed to its own name.
+    Returns the number of complete trials in the file.
+    """
+    name = filename[:-len(partial_suffix)] if filename.endswith(partial_suffix) else filename
+    n_trials = truncate_trials(filename, name.endswith(stroop_trialformat.extension))
+    if name != filename:
+        os.replace(filename, name)
+    return n_trials
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Remove incomplete trials from data files of crashed stroop_task sessions')
+    parser.add_argument('files', nargs='+', help='.csv or {} data files, or their temporary {} files'.format(stroop_trialformat.extension, partial_suffix))
+    args = parser.parse_args()
+    for datafile in args.files:
+        print('{}: {} complete trials'.format(datafile, recover_session(datafile)))
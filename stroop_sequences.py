@@ -0,0 +1,249 @@
+"""
+Constrained trial sequences for stroop_task
+
+A trial sequence is a list of (colourtext, colourname) pairs with every pair of the design the given number of times.
+Sequences are built in two steps, without shuffling and rejecting whole sequences:
+1. The order of congruent and incongruent trials is drawn uniformly from all orders that respect the maximum run of
+   incongruent trials, using the number of valid completions of every partial order (dynamic programming). With a
+   block size, every block gets the same proportion of congruent and incongruent trials.
+2. The colours are then placed trial by trial, drawing each pair at random, weighted towards the pairs and colours that
+   are still needed most. Pairs that would repeat the ink colour or word of the previous trial are skipped, and so are
+   pairs after which a colour can no longer be spread out over the remaining trials. Dead ends are therefore rare; they
+   only undo the last few trials, and are remembered so the same dead end is never tried twice.
+
+A bank of seeded sequences can be precomputed and cached in a .json file, and participants are assigned a sequence from
+the bank at the start of their session.
+"""
+import os
+import json
+import zlib
+import random
+
+bank_version = 1
+restart_backtracks = 10  # Start the colour search again after this many undone trials per trial of the sequence
+max_restarts = 100  # Give up (ValueError) when the colour search has been started again this many times
+
+def trial_counts(colours, n_congruent, n_incongruent):
+    """
+    Number of trials of each (colourtext, colourname) pair: n_congruent for matching pairs, n_incongruent for the others.
+    """
+    return {(word, drawn): n_congruent if word == drawn else n_incongruent for drawn in colours for word in colours}
+
+def count_condition_orders(n_congruent, n_incongruent, max_run):
+    """
+    Number of orders of n_congruent congruent and n_incongruent incongruent trials without runs of more than max_run
+    incongruent trials. Returns a table in which orders[c][i][r] counts the orders of c congruent and i incongruent
+    trials that follow a run of r incongruent trials.
+    """
+    orders = [[[0]*(max_run + 1) for i in range(n_incongruent + 1)] for c in range(n_congruent + 1)]
+    for c in range(n_congruent + 1):
+        for i in range(n_incongruent + 1):
+            for r in range(max_run + 1):
+                if c == 0 and i == 0:
+                    orders[c][i][r] = 1
+                    continue
+                if c > 0:
+                    orders[c][i][r] += orders[c-1][i][0]
+                if i > 0 and r < max_run:
+                    orders[c][i][r] += orders[c][i-1][r+1]
+    return orders
+
+def condition_order(n_congruent, n_incongruent, max_run=None, rng=random, run=0):
+    """
+    Draws a random order of congruent (False) and incongruent (True) trials, with equal probability for every order
+    without runs of more than max_run incongruent trials (None for no limit). run is the number of incongruent trials
+    directly before the order, so orders of consecutive blocks can be joined.
+    """
+    if max_run is None:
+        max_run = n_incongruent + run
+    orders = count_condition_orders(n_congruent, n_incongruent, max_run)
+    c, i = n_congruent, n_incongruent
+    if orders[c][i][run] == 0:
+        raise ValueError('No order of {} congruent and {} incongruent trials has at most {} incongruent trials in a row'.format(
+            n_congruent, n_incongruent, max_run))
+    order = []
+    while c or i:
+        # Congruent with probability (completions after a congruent trial) / (all completions)
+        if c > 0 and rng.randrange(orders[c][i][run]) < orders[c-1][i][0]:
+            order.append(False)
+            c -= 1
+            run = 0
+        else:
+            order.append(True)
+            i -= 1
+            run += 1
+    return order
+
+def block_sizes(n_trials, block_size=None):
+    # Sizes of the blocks of a sequence of n_trials trials, the last block may be shorter
+    if not block_size:
+        return [n_trials]
+    return [min(block_size, n_trials - start) for start in range(0, n_trials, block_size)]
+
+def balanced_condition_order(n_congruent, n_incongruent, block_size=None, max_run=None, rng=random):
+    """
+    Same as condition_order, but with the congruent and incongruent trials spread over blocks of block_size trials
+    in proportion to the block size, and the run limit applied across the block boundaries too.
+    """
+    n_trials = n_congruent + n_incongruent
+    order = []
+    start = 0
+    if n_trials == 0:
+        return order
+    for size in block_sizes(n_trials, block_size):
+        congruent = round(n_congruent*(start + size)/n_trials) - round(n_congruent*start/n_trials)
+        run = 0
+        while run < len(order) and order[-1-run]:
+            run += 1
+        order += condition_order(congruent, size - congruent, max_run, rng, min(run, max_run) if max_run is not None else run)
+        start += size
+    return order
+
+def spreadable(left, slots, previous):
+    # Can left trials of one colour still be placed in slots trials without two in a row,
+    # when the colour was (previous=True) or was not used in the trial just before
+    return left <= (slots // 2 if previous else (slots + 1) // 2)
+
+def colour_order(incongruent, counts, avoid_repeats=True, rng=random):
+    """
+    Places the (colourtext, colourname) pairs of counts on the trials of a condition order (see condition_order).
+    With avoid_repeats, no trial has the ink colour or the word of the trial before it.
+    Returns the list of pairs.
+    """
+    left = {pair: n for pair, n in counts.items() if n > 0}
+    if sum(left.values()) != len(incongruent) or sum(n for (word, drawn), n in left.items() if word != drawn) != sum(incongruent):
+        raise ValueError('The trial counts do not match the condition order')
+    colours = sorted({colour for pair in left for colour in pair})
+    inks = {colour: sum(n for (word, drawn), n in left.items() if drawn == colour) for colour in colours}
+    words = {colour: sum(n for (word, drawn), n in left.items() if word == colour) for colour in colours}
+    congruent = {colour: left.get((colour, colour), 0) for colour in colours}
+    # Congruent trials of one colour can not follow each other either: from position p on, they fit in at most
+    # capacity[p] congruent trials (every other trial of each run of congruent trials), or in one less when the
+    # colour was used in the trial before a run that starts at p
+    n_trials = len(incongruent)
+    run = [0]*(n_trials + 1)
+    capacity = [0]*(n_trials + 1)
+    for position in reversed(range(n_trials)):
+        if incongruent[position]:
+            capacity[position] = capacity[position + 1]
+        else:
+            run[position] = run[position + 1] + 1
+            capacity[position] = (run[position] + 1) // 2 + capacity[position + run[position]]
+
+    def candidates(position):
+        # Pairs that can be placed at position, in random order weighted towards pairs of the colours that are still
+        # needed most: the pair with the highest rng.random()**(1/weight) is tried first (weighted sampling without replacement)
+        previous = sequence[position - 1] if position > 0 else (None, None)
+        slots = n_trials - position - 1
+        options = []
+        for pair, n in left.items():
+            word, drawn = pair
+            if n == 0 or (word != drawn) != incongruent[position]:
+                continue
+            if avoid_repeats:
+                if word == previous[0] or drawn == previous[1]:
+                    continue
+                if not all(spreadable(inks[colour] - (colour == drawn), slots, colour == drawn) and
+                           spreadable(words[colour] - (colour == word), slots, colour == word) and
+                           congruent[colour] - (pair == (colour, colour)) <= capacity[position + 1] - 
+                           (colour in pair and run[position + 1] % 2 == 1) for colour in colours):
+                    continue
+            options.append((rng.random()**(1/(n*(inks[drawn] + words[word])**4)), pair))
+        options.sort()
+        return [pair for key, pair in options]
+
+    def place(pair, step):
+        left[pair] -= step
+        inks[pair[1]] -= step
+        words[pair[0]] -= step
+        if pair[0] == pair[1]:
+            congruent[pair[0]] -= step
+
+    def state():
+        # Everything the rest of the sequence depends on: the last trial and the pairs that are left
+        return sequence[-1], tuple(left.values())
+
+    # Depth-first search that undoes the last trials at a dead end. States from which the rest of the sequence can not
+    # be completed are remembered, so they are never tried again. A search that needs many undos has usually gone
+    # wrong early on, so it is started again (keeping the dead states) with a new random order of candidates
+    sequence = []
+    dead = set()
+    for attempt in range(max_restarts + 1):
+        while sequence:
+            place(sequence.pop(), -1)
+        stack = [candidates(0)] if n_trials else []
+        backtracks = 0
+        while len(sequence) < n_trials and backtracks <= restart_backtracks*n_trials:
+            if stack[-1]:
+                pair = stack[-1].pop()
+                place(pair, 1)
+                sequence.append(pair)
+                if state() in dead:
+                    place(sequence.pop(), -1)
+                elif len(sequence) < n_trials:
+                    stack.append(candidates(len(sequence)))
+                continue
+            # Dead end: remember it, undo the last trial and try its next candidate
+            if not sequence:
+                break #Every first trial leads to a dead end
+            stack.pop()
+            backtracks += 1
+            dead.add(state())
+            place(sequence.pop(), -1)
+        if len(sequence) == n_trials:
+            return sequence
+        if not sequence:
+            break
+    raise ValueError('No trial sequence satisfies the colour constraints')
+
+def generate_sequence(colours, n_congruent, n_incongruent, block_size=None, max_incongruent_run=None, avoid_repeats=True, rng=random):
+    """
+    Generates one trial sequence of the design of stroop_task (see trial_counts), as a list of (colourtext, colourname),
+    with at most max_incongruent_run incongruent trials in a row, congruent and incongruent trials balanced over blocks
+    of block_size trials, and with avoid_repeats no repeat of the ink colour or word of the previous trial.
+    """
+    counts = trial_counts(colours, n_congruent, n_incongruent)
+    n_incongruent_trials = sum(n for (word, drawn), n in counts.items() if word != drawn)
+    n_congruent_trials = sum(counts.values()) - n_incongruent_trials
+    order = balanced_condition_order(n_congruent_trials, n_incongruent_trials, block_size, max_incongruent_run, rng)
+    return colour_order(order, counts, avoid_repeats, rng)
+
+def build_bank(n_sequences, seed, **settings):
+    """
+    Generates n_sequences sequences with generate_sequence(**settings). Sequence k is generated from its own seed derived
+    from seed, so it is the same in every bank with the same settings and seed.
+    """
+    return [generate_sequence(rng=random.Random(seed*1000003 + k), **settings) for k in range(n_sequences)]
+
+def load_bank(filename, n_sequences, seed, **settings):
+    """
+    Returns the sequence bank cached in filename, or builds it (see build_bank) and saves it to filename when the file
+    is missing or was made with other settings. The file is written to a temporary file first and then moved into place.
+    """
+    description = {'version': bank_version, 'n_sequences': n_sequences, 'seed': seed,
+                   'settings': {name: list(value) if isinstance(value, (list, tuple)) else value for name, value in settings.items()}}
+    try:
+        with open(filename, 'r') as f:
+            bank = json.load(f)
+        if {name: bank.get(name) for name in description} == description:
+            return [[tuple(pair) for pair in sequence] for sequence in bank['sequences']]
+    except (OSError, ValueError):
+        pass
+    sequences = build_bank(n_sequences, seed, **settings)
+    temp_file = '{}.tmp'.format(filename)
+    with open(temp_file, 'w') as f:
+        json.dump(dict(description, sequences=sequences), f)
+    os.replace(temp_file, filename)
+    return sequences
+
+def assign_sequence(bank, participantid):
+    """
+    Assigns a sequence of the bank to a participant. Numeric participant ids 1, 2, ... get sequences 0, 1, ... in turn,
+    other ids get a sequence chosen by a hash of the id. Returns (sequence number, sequence).
+    """
+    participantid = str(participantid).strip()
+    if participantid.isdigit():
+        number = (int(participantid) - 1) % len(bank)
+    else:
+        number = zlib.crc32(participantid.encode('utf-8')) % len(bank)
+    return number, bank[number]
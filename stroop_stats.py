@@ -0,0 +1,167 @@
+"""
+Vectorized robust statistics and bootstrap for stroop_analyser
+
+The reaction times of a whole batch of subjects are put in one NaN-padded array (one row per subject), so the median,
+percentiles and outlier trimming of every subject are computed with single NumPy calls instead of per-subject loops.
+The group bootstrap draws all resamples of the subjects at once, as counts of how often each subject was drawn,
+and turns them into resampled group means with one matrix product per batch of resamples.
+"""
+import warnings
+import numpy as np
+
+mad_scale = 1.4826 #Scales the median absolute deviation to the STD of normally distributed data
+bootstrap_batch_elements = 1 << 18 #Resample counts drawn at a time by bootstrap_mean_ci, limits its memory use to a few MB
+
+def pad_ragged(values, group, n_groups, fill=np.nan):
+    """
+    Puts values that belong to groups 0..n_groups-1 (given per value in group) into an array with one row per group,
+    in their original order, padded with fill. Returns an array of shape (n_groups, largest group size), with at least
+    one column so that reductions over the rows still give one value per group when there are no values.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    group = np.asarray(group, dtype=np.int64)
+    sizes = np.bincount(group, minlength=n_groups)
+    order = np.argsort(group, kind='stable')
+    sorted_group = group[order]
+    starts = np.cumsum(sizes) - sizes
+    padded = np.full((n_groups, max(sizes.max(), 1) if n_groups else 0), fill, dtype=np.float64)
+    padded[sorted_group, np.arange(len(group)) - starts[sorted_group]] = values[order]
+    return padded
+
+def group_sums(values, group, n_groups):
+    """
+    Sums of the values of every group 0..n_groups-1 (given per value in group), leaving out NaN values: the same values
+    as np.nansum of the values of each group in their original order. Groups of the same size are put in one array and
+    summed along its rows, which NumPy does with the same pairwise summation as for a single group. (np.bincount adds
+    the values one by one, so its sums differ in the last bits, and means shown with 6 decimals then change.)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = np.where(np.isnan(values), 0.0, values)
+    group = np.asarray(group, dtype=np.int64)
+    sizes = np.bincount(group, minlength=n_groups)
+    order = np.argsort(group, kind='stable')
+    starts = np.cumsum(sizes) - sizes
+    sums = np.zeros(n_groups)
+    for size in np.unique(sizes[sizes > 0]).tolist():
+        rows = np.flatnonzero(sizes == size)
+        sums[rows] = values[order[starts[rows, None] + np.arange(size)]].sum(axis=1)
+    return sums
+
+def row_medians(padded):
+    """
+    Medians of the rows of a NaN-padded array, leaving out NaN values: the same values as np.nanmedian(padded, axis=1)
+    (the mean of the two middle values), taken from one sort of all rows. Rows without values give NaN.
+    """
+    ordered = np.sort(padded, axis=1) #NaN values are sorted last
+    n_values = np.count_nonzero(~np.isnan(ordered), axis=1)
+    low = np.take_along_axis(ordered, np.maximum((n_values - 1)//2, 0)[:, None], axis=1)[:, 0]
+    high = np.take_along_axis(ordered, np.minimum(n_values//2, max(padded.shape[1] - 1, 0))[:, None], axis=1)[:, 0]
+    return np.where(n_values > 0, (low + high)/2, np.nan)
+
+def row_percentiles(padded, percentiles):
+    """
+    Percentiles of the rows of a NaN-padded array, leaving out NaN values: the same values as
+    np.nanpercentile(padded, percentiles, axis=1) with its linear interpolation, but taken from one sort of all rows
+    instead of a loop over the rows. Rows without values give NaN. Returns an array of shape (len(percentiles), rows).
+    """
+    ordered = np.sort(padded, axis=1)
+    n_values = np.count_nonzero(~np.isnan(ordered), axis=1)
+    last = np.maximum(n_values - 1, 0)
+    result = []
+    for quantile in np.asarray(percentiles, dtype=np.float64)/100:
+        #Interpolate between the values below and above the (fractional) position of the percentile in each row
+        position = last*quantile
+        below = np.minimum(np.floor(position).astype(np.int64), last)
+        above = np.minimum(below + 1, last)
+        gamma = position - below
+        low = np.take_along_axis(ordered, below[:, None], axis=1)[:, 0]
+        high = np.take_along_axis(ordered, above[:, None], axis=1)[:, 0]
+        difference = high - low
+        with np.errstate(invalid='ignore'):
+            value = np.where(gamma >= 0.5, high - difference*(1 - gamma), low + difference*gamma)
+        result.append(np.where(n_values > 0, value, np.nan))
+    return np.array(result).reshape(len(result), len(padded))
+
+def trim_outliers(padded, method='mad', threshold=3):
+    """
+    Replaces the outliers of every row of a NaN-padded array with NaN. Values further than threshold times the spread
+    from the centre of their row are outliers: the STD around the mean for method='sd', or the scaled median absolute
+    deviation around the median for method='mad', which is not inflated by the outliers themselves.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning) #rows without values
+        if method == 'sd':
+            centre = np.nanmean(padded, axis=1, keepdims=True)
+            spread = np.nanstd(padded, axis=1, keepdims=True)
+        elif method == 'mad':
+            centre = row_medians(padded)[:, None]
+            spread = mad_scale*row_medians(np.abs(padded - centre))[:, None]
+        else:
+            raise ValueError('Unknown trimming method {}, use sd or mad'.format(method))
+    with np.errstate(invalid='ignore'):
+        keep = np.abs(padded - centre) <= threshold*spread
+    return np.where(keep, padded, np.nan)
+
+def subject_rt_stats(rt, group, n_groups, percentiles=(25, 75), method='mad', threshold=3):
+    """
+    Robust RT statistics for every group (subject) at once, from the reaction times rt and their group numbers.
+    Returns a dictionary of arrays with one value per group: 'median', 'lower' and 'upper' (the two percentiles),
+    'trimmed_mean' (mean after trim_outliers) and 'n_trimmed' (number of reaction times removed as outliers).
+    Groups without reaction times get NaN.
+    """
+    padded = pad_ragged(rt, group, n_groups)
+    lower, median, upper = row_percentiles(padded, [percentiles[0], 50, percentiles[1]])
+    trimmed = trim_outliers(padded, method, threshold)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning) #rows without values
+        trimmed_mean = np.nanmean(trimmed, axis=1)
+    n_valid = np.count_nonzero(~np.isnan(padded), axis=1)
+    n_trimmed = np.where(n_valid > 0, n_valid - np.count_nonzero(~np.isnan(trimmed), axis=1), np.nan)
+    return {'median': median, 'lower': lower, 'upper': upper, 'trimmed_mean': trimmed_mean, 'n_trimmed': n_trimmed}
+
+def column_means(values):
+    """
+    Means of the columns of values (subjects x columns), leaving out NaN values. Columns without any values give NaN
+    (without a warning), and so do all columns when there are no subjects.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmean(values, axis=0)
+
+def bootstrap_mean_ci(values, n_resamples=10000, confidence=95, seed=None):
+    """
+    Bootstrap confidence intervals of the group mean of every column of values (subjects x measures), resampling subjects.
+    NaN values are left out of the mean of each resample, like np.nanmean. Resamples are drawn in batches as counts per
+    subject, so each batch of resampled means is one matrix product. The subjects are sorted by their values first, so
+    with a seed the intervals only depend on the subjects, not on their order (e.g. of merged partial aggregates).
+    Returns (lower, upper) arrays with one value per column.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    values = values[np.lexsort(values.T[::-1])] if values.size else values
+    n_subjects = len(values)
+    if n_subjects == 0 or n_resamples < 1:
+        return np.full(values.shape[1], np.nan), np.full(values.shape[1], np.nan)
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    valid = valid.astype(np.float64)
+    rng = np.random.default_rng(seed)
+    batch = max(1, bootstrap_batch_elements // n_subjects)
+    means = []
+    for start in range(0, n_resamples, batch):
+        size = min(batch, n_resamples - start)
+        draws = rng.integers(0, n_subjects, size=(size, n_subjects))
+        draws += n_subjects*np.arange(size)[:, None]
+        counts = np.bincount(draws.ravel(), minlength=size*n_subjects).reshape(size, n_subjects).astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means.append((counts @ filled)/(counts @ valid))
+    means = np.concatenate(means)
+    alpha = (100 - confidence)/2
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning) #columns without values
+        lower, upper = np.nanpercentile(means, [alpha, 100 - alpha], axis=0)
+    return lower, upper
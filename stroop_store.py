@@ -0,0 +1,327 @@
+"""
+SQLite trial store for stroop_task data
+
+Loads the .csv and binary (.strb) data files of stroop_task into one local SQLite database, so questions about the data
+are answered with SQL queries instead of a scan of the whole data directory:
+    python stroop_store.py ingest C:\\Stroop\\data
+    python stroop_store.py query --date-from 2021-01-01 --date-to 2021-06-30 --colour-pair red blue
+stroop_analyser can then read its per-subject summaries from the store with --db (and the same filters).
+
+Every session file becomes one row of the sessions table, with the participant id and session date taken from its name
+(Stroop_P{participantid}_{HHMM_DDMMYYYY}), and its trials become rows of the trials table, which is indexed on
+participant, condition, session date and colour pair. Sessions are identified by their path without extension, so
+files with the same name in different directories are different sessions. Ingestion is idempotent per file: a file
+that is already in the store is skipped when its size and modification time, or otherwise its content hash, are
+unchanged, and a changed file replaces its old trials in the same transaction. A session written in both formats is
+stored only once. Files that are not stroop_task data files (e.g. a .csv table of stroop_analyser in the data directory)
+are skipped and reported.
+"""
+import os
+import re
+import csv
+import time
+import hashlib
+import sqlite3
+import argparse
+import stroop_trialformat
+
+database_filename = 'stroop_trials.sqlite'  # Default file name of the trial store
+store_version = 2
+files_per_transaction = 200  # Ingested files are committed together in transactions of this many files
+data_extensions = ('.csv', stroop_trialformat.extension)  # Extensions of the data files that are ingested
+session_name = re.compile(r'^(?P<expname>.+)_P(?P<participant>.+)_(?P<hour>\d\d)(?P<minute>\d\d)_(?P<day>\d\d)(?P<month>\d\d)(?P<year>\d{4})$')
+
+schema = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    session TEXT NOT NULL UNIQUE,
+    file TEXT NOT NULL,
+    participant TEXT NOT NULL,
+    session_date TEXT,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    n_trials INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS trials (
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    participant TEXT NOT NULL,
+    session_date TEXT,
+    trialnum INTEGER,
+    colourtext TEXT,
+    colourname TEXT,
+    condition TEXT,
+    response TEXT,
+    rt REAL,
+    correct INTEGER
+);
+CREATE INDEX IF NOT EXISTS trials_session ON trials (session_id);
+CREATE INDEX IF NOT EXISTS trials_participant ON trials (participant);
+CREATE INDEX IF NOT EXISTS trials_condition ON trials (condition);
+CREATE INDEX IF NOT EXISTS trials_date ON trials (session_date);
+CREATE INDEX IF NOT EXISTS trials_colours ON trials (colourtext, colourname);
+"""
+
+def connect(database=database_filename, create=True):
+    """
+    Opens the trial store in database, creating its tables and indexes when create is True.
+    Raises FileNotFoundError when the store does not exist and create is False.
+    """
+    if not create and not os.path.exists(database):
+        raise FileNotFoundError('No trial store {}, make one with: python stroop_store.py ingest DIRECTORY'.format(database))
+    connection = sqlite3.connect(database)
+    #Write-ahead logging makes commits cheap, and lets queries run during an ingest
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.execute('PRAGMA synchronous = NORMAL')
+    connection.execute('PRAGMA cache_size = -65536') #64 MB, keeps the index pages in memory during bulk loads
+    if create:
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, store_version):
+            raise ValueError('{} is a trial store of version {}, expected {}'.format(database, version, store_version))
+        connection.executescript(schema)
+        connection.execute('PRAGMA user_version = {:d}'.format(store_version))
+    return connection
+
+def parse_session_name(file):
+    """
+    Returns (session, participant, session_date) for a data file: the full path without extension, the participant id,
+    and the session date as 'YYYY-MM-DD HH:MM'. Files not named like stroop_task output get their name as participant
+    and no date (None).
+    """
+    session = os.path.splitext(os.path.realpath(file))[0]
+    name = os.path.basename(session)
+    match = session_name.match(name)
+    if match is None:
+        return session, name, None
+    return session, match['participant'], '{year}-{month}-{day} {hour}:{minute}'.format(**match.groupdict())
+
+def read_csv_trials(content):
+    # (trialnum, colourtext, colourname, condition, response, rt, correct) of the trials in the content of a .csv file,
+    # with the columns found by their header names. Raises ValueError when the file is not a stroop_task data file
+    lines = content.decode('utf-8').splitlines()
+    rows = csv.reader(line for line in lines if line.strip())
+    header = next(rows, [])
+    names = ['trialnum', 'colourtext', 'colourname', 'condition', 'response', 'rt', 'correct']
+    missing = [name for name in names if name not in header]
+    if missing:
+        raise ValueError('no {} column'.format(', '.join(missing)))
+    columns = [header.index(name) for name in names]
+    trials = []
+    for row in rows:
+        trialnum, colourtext, colourname, condition, response, rt, correct = [row[column] for column in columns]
+        trials.append((int(trialnum), colourtext, colourname, condition, response or None,
+                       float(rt) if rt else None, int(correct == 'True')))
+    return trials
+
+def read_binary_trials(file):
+    # Same as read_csv_trials, for a binary trial file
+    colours, records = stroop_trialformat.read_trials(file)
+    names = colours + [None] #code -1 (no response) picks None
+    return [(trialnum, names[colourtext], names[colourname], stroop_trialformat.conditions[condition], names[response], rt, int(correct))
+            for trialnum, colourtext, colourname, condition, response, rt, correct in records.tolist()]
+
+def ingest_file(connection, file):
+    """
+    Adds the trials of one data file to the store, or replaces them when the file changed since it was ingested.
+    Returns the number of trials added, or None when the file was skipped (unchanged, or its session is already
+    stored from the file in the other format). The changes are not committed, so that a file is never stored half.
+    Raises ValueError (before changing the store) when the file can not be read as a stroop_task data file.
+    """
+    session, participant, session_date = parse_session_name(file)
+    stat = os.stat(file)
+    stored = connection.execute('SELECT id, file, size, mtime, hash FROM sessions WHERE session = ?', (session,)).fetchone()
+    if stored is not None:
+        session_id, stored_file, size, mtime, stored_hash = stored
+        if os.path.basename(file) != stored_file or (size, mtime) == (stat.st_size, stat.st_mtime_ns):
+            return None
+    with open(file, 'rb') as f:
+        content = f.read()
+    content_hash = hashlib.sha1(content).hexdigest()
+    if stored is not None:
+        if stored_hash == content_hash:
+            #Only the modification time changed (e.g. a copied file)
+            connection.execute('UPDATE sessions SET size = ?, mtime = ? WHERE id = ?', (stat.st_size, stat.st_mtime_ns, session_id))
+            return None
+    trials = read_binary_trials(file) if file.endswith(stroop_trialformat.extension) else read_csv_trials(content)
+    if stored is not None:
+        connection.execute('DELETE FROM trials WHERE session_id = ?', (session_id,))
+        connection.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+    session_id = connection.execute(
+        'INSERT INTO sessions (session, file, participant, session_date, size, mtime, hash, n_trials) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        (session, os.path.basename(file), participant, session_date, stat.st_size, stat.st_mtime_ns, content_hash, len(trials))).lastrowid
+    connection.executemany('INSERT INTO trials VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                           [(session_id, participant, session_date) + trial for trial in trials])
+    return len(trials)
+
+def data_files(paths):
+    """
+    The data files in paths (files or directories), sorted by name. Of a session written in both formats, only the
+    binary file is used, since it is read without parsing any text.
+    """
+    files = {}
+    for path in paths:
+        if os.path.isdir(path):
+            candidates = [entry.path for entry in os.scandir(path) if entry.is_file()]
+        else:
+            candidates = [path]
+        for file in candidates:
+            session, extension = os.path.splitext(file)
+            if extension in data_extensions:
+                if files.get(session, '').endswith(stroop_trialformat.extension):
+                    continue
+                files[session] = file
+    return [files[session] for session in sorted(files)]
+
+def ingest(connection, paths):
+    """
+    Ingests all data files in paths (see data_files and ingest_file), committing after every files_per_transaction
+    files. An interrupted ingest keeps the files of the committed transactions, and running it again adds the rest.
+    Files that can not be read as stroop_task data files are left out, without stopping the ingest of the others.
+    Returns (files added, trials added, files skipped, invalid files), where invalid files is a list of (file, error).
+    """
+    added = 0
+    n_trials = 0
+    skipped = 0
+    invalid = []
+    files = data_files(paths)
+    for start in range(0, len(files), files_per_transaction):
+        with connection:
+            for file in files[start:start + files_per_transaction]:
+                try:
+                    result = ingest_file(connection, file)
+                except (ValueError, IndexError) as error:
+                    invalid.append((file, str(error)))
+                    continue
+                if result is None:
+                    skipped += 1
+                else:
+                    added += 1
+                    n_trials += result
+    return added, n_trials, skipped, invalid
+
+#### QUERIES ####
+def trial_filter(date_from=None, date_to=None, participants=None, colour_pair=None, condition=None):
+    """
+    Returns (SQL condition, parameters) that select the trials of sessions between date_from and date_to (inclusive,
+    'YYYY-MM-DD'), of the given participant ids, with the colour pair (colourtext, colourname) and of the condition.
+    Filters that are None are left out. Every filter uses one of the indexes of the trials table.
+    """
+    clauses = ['1']
+    parameters = []
+    if date_from is not None:
+        clauses.append('session_date >= date(?)')
+        parameters.append(date_from)
+    if date_to is not None:
+        clauses.append("session_date < date(?, '+1 day')")
+        parameters.append(date_to)
+    if participants:
+        clauses.append('participant IN ({})'.format(', '.join('?'*len(participants))))
+        parameters += [str(participant) for participant in participants]
+    if colour_pair is not None:
+        clauses.append('colourtext = ? AND colourname = ?')
+        parameters += list(colour_pair)
+    if condition is not None:
+        clauses.append('condition = ?')
+        parameters.append(condition)
+    return ' AND '.join(clauses), parameters
+
+def subject_aggregates(connection, **filters):
+    """
+    Per-session aggregates of the selected trials (see trial_filter), in the order the sessions were ingested.
+    Returns a list of (session id, file, participant, session_date, aggregates), where aggregates maps each condition to
+    (trials, correct trials, count, sum and sum of squares of the non-missing reaction times).
+    """
+    where, parameters = trial_filter(**filters)
+    rows = connection.execute(
+        'SELECT s.id, s.file, s.participant, s.session_date, t.condition, t.trials, t.correct, t.count, t.total, t.sumsq '
+        'FROM (SELECT session_id, condition, COUNT(*) AS trials, SUM(correct) AS correct, COUNT(rt) AS count, '
+        '      TOTAL(rt) AS total, TOTAL(rt*rt) AS sumsq '
+        '      FROM trials WHERE {} GROUP BY session_id, condition) AS t '
+        'JOIN sessions AS s ON s.id = t.session_id ORDER BY s.id'.format(where), parameters)
+    subjects = []
+    for session_id, file, participant, session_date, condition, *aggregates in rows:
+        if not subjects or subjects[-1][0] != session_id:
+            subjects.append((session_id, file, participant, session_date, {}))
+        subjects[-1][4][condition] = tuple(aggregates)
+    return subjects
+
+def subject_rts(connection, **filters):
+    """
+    (session id, condition, rt) of every selected trial with a reaction time, ordered by session.
+    """
+    where, parameters = trial_filter(**filters)
+    return connection.execute(
+        'SELECT session_id, condition, rt FROM trials WHERE {} AND rt IS NOT NULL ORDER BY session_id'.format(where), parameters).fetchall()
+
+def group_aggregates(connection, **filters):
+    """
+    Group aggregates of the selected trials per condition, computed in SQL from the per-session means.
+    Returns a dictionary of condition -> (sessions, mean of the session mean RTs, STD of the session mean RTs,
+    mean % correct), like the Mean row of stroop_analyser.
+    """
+    where, parameters = trial_filter(**filters)
+    rows = connection.execute(
+        'SELECT condition, COUNT(*), AVG(mean_rt), AVG(mean_rt*mean_rt), AVG(percentage) '
+        'FROM (SELECT session_id, condition, AVG(rt) AS mean_rt, 100.0*SUM(correct)/COUNT(*) AS percentage '
+        '      FROM trials WHERE {} GROUP BY session_id, condition) '
+        'GROUP BY condition ORDER BY condition'.format(where), parameters)
+    group = {}
+    for condition, n_sessions, mean, mean_square, percentage in rows:
+        std = max(mean_square - mean**2, 0)**0.5 if mean is not None else None
+        group[condition] = (n_sessions, mean, std, percentage)
+    return group
+
+def add_filter_arguments(parser):
+    """
+    Adds the trial filter options (see trial_filter) to an argparse parser.
+    """
+    parser.add_argument('--date-from', metavar='YYYY-MM-DD', help='only sessions on or after this date')
+    parser.add_argument('--date-to', metavar='YYYY-MM-DD', help='only sessions on or before this date')
+    parser.add_argument('--participant', nargs='+', metavar='ID', help='only these participant ids')
+    parser.add_argument('--colour-pair', nargs=2, metavar=('WORD', 'INK'), help='only trials of this word in this ink colour')
+
+def filter_arguments(args):
+    """
+    The trial filters given with the options of add_filter_arguments, as keyword arguments for the query functions.
+    """
+    return {'date_from': args.date_from, 'date_to': args.date_to, 'participants': args.participant,
+            'colour_pair': tuple(args.colour_pair) if args.colour_pair else None}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load stroop_task data files into a SQLite trial store and query it')
+    parser.add_argument('--db', default=database_filename, help='trial store (default: {})'.format(database_filename))
+    commands = parser.add_subparsers(dest='command', required=True)
+    ingest_parser = commands.add_parser('ingest', help='add new and changed data files, skipping files that are already stored')
+    ingest_parser.add_argument('paths', nargs='+', help='data files, or directories of data files')
+    query_parser = commands.add_parser('query', help='print group aggregates (or per-session aggregates) of the selected trials')
+    add_filter_arguments(query_parser)
+    query_parser.add_argument('--condition', help='only trials of this condition')
+    query_parser.add_argument('--per-subject', action='store_true', help='print the aggregates of every session')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'ingest':
+        connection = connect(args.db)
+        added, n_trials, skipped, invalid = ingest(connection, args.paths)
+        connection.execute('PRAGMA optimize')
+        for file, error in invalid:
+            print('Skipped {}, not a complete stroop_task data file: {}'.format(file, error))
+        print('{} files ({} trials) added or updated, {} unchanged files skipped in {:.2f} s'.format(
+            added, n_trials, skipped, time.perf_counter() - start))
+    else:
+        connection = connect(args.db, create=False)
+        filters = dict(filter_arguments(args), condition=args.condition)
+        if args.per_subject:
+            print('{:<36s}{:<12s}{:<18s}{:<13s}{:>7s}{:>9s}{:>10s}'.format('File', 'Participant', 'Date', 'Condition', 'Trials', 'Correct', 'Mean RT'))
+            for session_id, file, participant, session_date, aggregates in subject_aggregates(connection, **filters):
+                for condition, (trials, n_correct, count, total, sumsq) in sorted(aggregates.items()):
+                    mean = '{:10.3f}'.format(total/count) if count else '{:>10s}'.format('-')
+                    print('{:<36s}{:<12s}{:<18s}{:<13s}{:7d}{:9d}{}'.format(file, participant, session_date or '-', condition, trials, n_correct, mean))
+        print('{:<13s}{:>9s}{:>10s}{:>10s}{:>11s}'.format('Condition', 'Sessions', 'Mean RT', 'STD RT', '% correct'))
+        for condition, (n_sessions, mean, std, percentage) in group_aggregates(connection, **filters).items():
+            if mean is None:
+                print('{:<13s}{:9d}{:>10s}{:>10s}{:11.1f}'.format(condition, n_sessions, '-', '-', percentage))
+            else:
+                print('{:<13s}{:9d}{:10.3f}{:10.3f}{:11.1f}'.format(condition, n_sessions, mean, std, percentage))
+        print('Query took {:.1f} ms'.format(1000*(time.perf_counter() - start)))
+    connection.close()
@@ -17,17 +17,62 @@ and correctness of response are recorded.
 
 The data is saved in a file called Stroop_P{participantid}_{expdate}.csv to ensure no files 
 are overwritten when a participant id is accidentally reused.
+Depending on data_format, the trials are also (or instead) saved as fixed-width binary records in 
+Stroop_P{participantid}_{expdate}.strb, see stroop_trialformat.py.
+
+All text stimuli (fixation cross, one per colour word and ink colour pair, instructions, feedback and break screens) are
+created before the first trial, so each trial only draws a ready stimulus instead of laying out new text right before the
+flip that timestamps the stimulus onset. The time needed to draw each stimulus is reported at the end of the experiment.
+
+Trials are written to the data file(s) by a background thread (see stroop_logger.py), so the trial loop never waits on
+the disk. The data files are flushed and synced to disk at every break and when the experiment ends or is terminated.
+While the session runs they are named Stroop_P{participantid}_{expdate}.csv.part (and .strb.part), and they get their own
+name when the experiment ends or is terminated, so stroop_analyser --watch only sees the files of finished sessions.
+After a crash, run python stroop_logger.py on the .part files to recover them.
+
+With record_timing, the timing of each experimental trial is saved in Stroop_P{participantid}_{expdate}_timing.tsv: 
+the flip timestamps of fixation and stimulus onset, the actual fixation duration, the longest frame interval and the
+number of dropped frames from fixation to stimulus onset, and the delay between the key press and its delivery by
+event.waitKeys. The window only records the interval between two flips, so with record_timing the fixation cross is
+drawn and flipped on every frame of fixationduration instead of waiting with core.wait, and only the intervals
+between these consecutive flips (up to the stimulus flip) are counted.
+A summary of the timing quality is printed at the end of the session. Only timestamps are collected during the trials;
+the file is written when the data files are closed.
+
+The order of the experimental trials follows the trial sequence settings: at most max_incongruent_run incongruent
+trials in a row, no trial with the ink colour or colour word of the trial before it, and the same proportion of
+congruent and incongruent trials in every block. These orders are built directly (see stroop_sequences.py) instead of
+shuffling until a valid order turns up. Participants are assigned one of sequence_bank_size precomputed orders, which are
+cached in sequence_bank_filename; build the bank in advance with: python stroop_task.py --build-sequence-bank
+
+With --headless, no window or dialog is opened (and PsychoPy is not needed): instead, simulated participants respond to
+the same practice and experimental trials with reaction times and accuracy drawn from the simulated_rt and 
+simulated_accuracy settings, and their data files are written in exactly the same format. Many sessions can be 
+simulated at once in parallel, e.g. to test the analyser: python stroop_task.py --headless --sessions 1000
+
+--timings FILE saves the time spent in each stage (building the trial sequences, simulating or running the trials,
+writing the data files) with counts of the sessions, trials and bytes written, as JSON (see stroop_timing.py).
 """
 from math import ceil
-from psychopy import visual, core, gui, event
+from concurrent.futures import ProcessPoolExecutor
+import os
 import random
+import argparse
 import datetime
+import stroop_trialformat
+import stroop_logger
+import stroop_sequences
+from stroop_timing import timings
 
 #### GENERAL SETTINGS #####
 n_breaks = 40  # Frequency of breaks (every n trials)
 n_congruent = 15  # Number of trials matching text and colour
 n_incongruent = 5  # Number of trials mismatching text and colour for each colour per alternative colour
 fixationduration = 0.35  # Fixation cross display duration: 350 ms
+prerender_stimuli = True  # False re-uses one text stimulus that is laid out again for every screen (to compare draw times)
+data_format = 'csv'  # Output format of the trial data: 'csv', 'binary' (see stroop_trialformat.py) or 'both'
+record_timing = False  # Save frame timing and key latency of each trial to a _timing.tsv file next to the data file
+droppedframe_threshold = 1.5  # A frame interval longer than this many frame periods counts as a dropped frame
 screenresolution = [6000, 6000]  # Max pixel size of the full screen window
 # This must be at least equal to the display window resolution, which can be checked under Settings --> Display
 # It is set to very large values so the window will always fill the whole display
@@ -45,41 +90,72 @@ colours = ['red', 'blue', 'green', 'yellow']
 colourvalues = {'red': [1, -1, -1], 'blue': [-1, -1, 1], 'green': [-1, 1, -1], 'yellow': [1, 1, -1]}
 colourkeys = {'f': 'red', 'g': 'blue', 'h': 'green', 'j': 'yellow'}
 
+#### TRIAL SEQUENCE SETTINGS #####
+max_incongruent_run = 3  # Maximum number of incongruent trials in a row, None for no limit
+avoid_colour_repeats = True  # Never repeat the ink colour or the colour word of the previous trial
+balance_blocks = True  # Give every block of n_breaks trials the same proportion of congruent and incongruent trials
+sequence_bank_size = 100  # Number of precomputed trial orders participants are assigned from, 0 makes a new order per session
+sequence_bank_seed = 1  # Seed of the sequence bank: order k of the bank is the same for the same settings and seed
+sequence_bank_filename = 'stroop_sequences.json'  # Cache of the sequence bank, rebuilt when the settings above change
+
+#### SIMULATED PARTICIPANT SETTINGS (--headless) #####
+# Reaction times are drawn from an ex-Gaussian distribution per condition: a normal distribution (mu, sigma) plus an
+# exponential tail (tau), all in seconds. Accuracy is the chance of pressing the key of the ink colour,
+# otherwise one of the other colour keys is pressed.
+simulated_rt = {'congruent': (0.55, 0.08, 0.12), 'incongruent': (0.65, 0.10, 0.16)}  # (mu, sigma, tau)
+simulated_accuracy = {'congruent': 0.97, 'incongruent': 0.90}
+n_workers = None  # Number of processes that simulate sessions in parallel, None uses all CPU cores
+
+
 #### GENERATING STIMULUS LIST #####
 # For each trial this list specifies the word to be written, the colour of the word,
 # whether these match (congruent/incongruent), and the colour code to draw
 # When the word and colour match, this is congruent, so we create trials equal to n_congruent (as set in General settings above)
 # When the word and colour do not match, this is incongruent, so we create trials equal to n_incongruent
-stimuli = []
-for drawn in colours:
-    for word in colours:
-        if drawn == word:
-            for ii in range(n_congruent):
-                stimuli.append({'colourtext': word, 'colourname': drawn, 'condition': 'congruent',
-                                'colourvalue': colourvalues[drawn]})
-        else:
-            for ii in range(n_incongruent):
-                stimuli.append({'colourtext': word, 'colourname': drawn, 'condition': 'incongruent',
-                                'colourvalue': colourvalues[drawn]})
-random.shuffle(stimuli)  # randomize order of list of stimuli
+# The trials are put in a random order that satisfies the trial sequence settings (see stroop_sequences.py)
+def sequence_settings():
+    # Settings of stroop_sequences.generate_sequence for the trial sequence settings above
+    return {'colours': colours, 'n_congruent': n_congruent, 'n_incongruent': n_incongruent,
+            'block_size': n_breaks if balance_blocks else None, 'max_incongruent_run': max_incongruent_run,
+            'avoid_repeats': avoid_colour_repeats}
+
+
+def sequence_stimuli(sequence):
+    # Stimulus list for a trial sequence of (colourtext, colourname) pairs
+    return [{'colourtext': word, 'colourname': drawn, 'condition': 'congruent' if word == drawn else 'incongruent',
+             'colourvalue': colourvalues[drawn]} for word, drawn in sequence]
+
+
+def make_stimuli(rng=random):
+    return sequence_stimuli(stroop_sequences.generate_sequence(rng=rng, **sequence_settings()))
+
+
+def load_sequence_bank():
+    # The precomputed trial sequences, built and cached in sequence_bank_filename on first use
+    return stroop_sequences.load_bank(sequence_bank_filename, sequence_bank_size, sequence_bank_seed, **sequence_settings())
+
 
 # Calculate total trials and number of blocks
-ntrials_total = len(stimuli)
+ntrials_total = n_congruent * len(colours) + n_incongruent * len(colours) * (len(colours) - 1)
 nblocks = ceil(ntrials_total / n_breaks)
 
+
 #### GENERATING PRACTICE LIST #####
 # Practice trials take the first word of the colours list, and generates trials with all different colour values
 # This way, the participant practices all different colour response keys.
-practice = []
-word = colours[0]
-for drawn in colours:
-    if drawn == word:
-        practice.append(
-            {'colourtext': word, 'colourname': drawn, 'condition': 'congruent', 'colourvalue': colourvalues[drawn]})
-    else:
-        practice.append(
-            {'colourtext': word, 'colourname': drawn, 'condition': 'incongruent', 'colourvalue': colourvalues[drawn]})
-random.shuffle(practice)  # randomize order of practice stimuli
+def make_practice(rng=random):
+    practice = []
+    word = colours[0]
+    for drawn in colours:
+        if drawn == word:
+            practice.append(
+                {'colourtext': word, 'colourname': drawn, 'condition': 'congruent', 'colourvalue': colourvalues[drawn]})
+        else:
+            practice.append(
+                {'colourtext': word, 'colourname': drawn, 'condition': 'incongruent', 'colourvalue': colourvalues[drawn]})
+    rng.shuffle(practice)  # randomize order of practice stimuli
+    return practice
+
 
 #### PREPARING INSTRUCTIONS AND FEEDBACK TEXT #####
 # These specify the instructions given at the start of the experiment (instructiontxt), for the practice trials,
@@ -97,66 +173,349 @@ The main experiment consists of {} blocks of {} trials, so a total of {} trials.
 First, you will do some practice trials where you get feedback until you choose the correct key.
 Press the space bar to continue to the practice trials.""".format(key_instructions, nblocks, n_breaks, ntrials_total)
 practicetxt = 'First, you will do some practice trials for the {} colors, press the space bar to begin'.format(
-    len(practice))
+    len(colours))
 feedback_correct_txt = 'Correct, well done.\n Press the space bar to continue.'
 feedback_incorrect_txt = 'Incorrect.\n Remember to press the key corresponding to the ink colour of the word.\n Press the space bar to try again.'
 endtxt = 'The end.\n\nThank you for your time!\nPress any key to exit the experiment'
 
-#### OUTPUT FILE PREPARATION #####
-# Preparing dictionary to get input from experimenter to create filename for output file
-# Expdate: Create a string version of the current year/month/day hour/minute
-# to ensure each file name will be unique and data will not be overwritten
-data = {}
-data['expname'] = 'Stroop'
-data['expdate'] = datetime.datetime.now().strftime('%H%M_%d%m%Y')
-data['participantid'] = ''
-
-# Creating Graphical User Interface to input Participant ID
-# Use the 'fixed' argument to stop the user changing the 'expname' and 'expdate' parameters, since these should not be changed
-dlg = gui.DlgFromDict(data, title='Input data', fixed=['expname', 'expdate'],
-                      order=['expname', 'expdate', 'participantid'])
-if not dlg.OK:
-    print("User cancelled the experiment")
-    core.quit()
-filename = '{expname}_P{participantid}_{expdate}.csv'.format(**data)
-f = open(filename, 'w')
-f.write('trialnum,colourtext,colourname,condition,response,rt,correct\n')
-
-#### DISPLAY WINDOW PREPARATION #####
-# Open a full screen window with black background and prepare a text stimulus for later use
-win = visual.Window(size=screenresolution, units="pix", color=(-1, -1, -1), fullScr=True, allowGUI=False)
-stim = visual.TextStim(win, "", color=(1.0, 1.0, 1.0), height=instructionheight)
-
-# Display Instructions on Screen
-stim.setText(instructiontxt)
-stim.draw()
-win.flip()
-event.waitKeys(keyList=['space'])
-
-# Display Practice block start text on Screen
-stim.setText(practicetxt)
-stim.draw()
-win.flip()
-event.waitKeys(keyList=['space'])
-
-# Run practice trials
-for pracnum, practicetrial in enumerate(practice):
-    correct = False
-    while correct == False:
+
+def make_breaktxt(blocknum):
+    # Break text shown before block blocknum (starting at 1)
+    # If there are less trials remaining than n_breaks, the block has the amount of trials left
+    trialsleft = ntrials_total - (blocknum - 1) * n_breaks
+    nextblocktrials = min(trialsleft, n_breaks)
+    return "Block {} out of {}.\nYou're about to start a  block of {}  trials.\nHave a short break, then press the space bar when you are ready to continue the experiment".format(
+        blocknum, nblocks, nextblocktrials)
+
+
+def make_filename(data):
+    # Data file name for a session, from the expname, participantid and expdate in data
+    return '{expname}_P{participantid}_{expdate}.csv'.format(**data)
+
+
+def open_logger(filename, fsync=True):
+    # Background logger that writes the data file(s) of data_format for a session with this (.csv) filename
+    return stroop_logger.TrialLogger(
+        csv_filename=filename if data_format in ['csv', 'both'] else None,
+        binary_filename=filename[:-len('.csv')] + stroop_trialformat.extension if data_format in ['binary', 'both'] else None,
+        colours=colours, fsync=fsync)
+
+
+#### HEADLESS SIMULATION #####
+def simulate_response(stimulus, rng):
+    # Simulated participant: returns (response colour, rt) for a stimulus, see the simulated participant settings
+    mu, sigma, tau = simulated_rt[stimulus['condition']]
+    rt = max(rng.gauss(mu, sigma) + rng.expovariate(1 / tau), 0.0)
+    if rng.random() < simulated_accuracy[stimulus['condition']]:
+        response = stimulus['colourname']
+    else:
+        response = rng.choice([colour for colour in colours if colour != stimulus['colourname']])
+    return response, rt
+
+
+def simulate_session(participantid, expdate, outputdir='.', seed=None):
+    """
+    Runs one session without window or dialog, with a simulated participant, and writes its data file(s) to outputdir.
+    The session follows the experiment: shuffled practice trials are repeated until they are answered correctly,
+    then the experimental trials are run in blocks, and rt is the simulated key time minus the stimulus onset time.
+    Returns the name of the .csv data file (also when data_format is 'binary').
+    """
+    rng = random.Random(seed)
+    with timings.stage('sequence'):
+        stimuli = make_stimuli(rng)
+        practice = make_practice(rng)
+    filename = os.path.join(outputdir, make_filename({'expname': 'Stroop', 'participantid': participantid, 'expdate': expdate}))
+    # No fsync for simulated sessions: they can be simulated again, and syncing would dominate the run time
+    logger = open_logger(filename, fsync=False)
+
+    with timings.stage('simulate'):
+        clock = 0.0  # Simulated experiment time in seconds
+        for practicetrial in practice:
+            correct = False
+            while not correct:
+                clock += fixationduration
+                response, rt = simulate_response(practicetrial, rng)
+                clock += rt
+                correct = response == practicetrial['colourname']
+
+        for trialnum, stimulus in enumerate(stimuli):
+            if trialnum % n_breaks == 0:
+                logger.flush()
+            clock += fixationduration
+            starttime = clock
+            response, simulated_rt = simulate_response(stimulus, rng)
+            clock += simulated_rt
+            rt = clock - starttime
+            correct = response == stimulus['colourname']
+            logger.log(trialnum + 1, stimulus['colourtext'], stimulus['colourname'], stimulus['condition'], response, rt, correct)
+    with timings.stage('write'):
+        logger.close()
+    timings.count('sessions')
+    timings.count('trials', len(stimuli))
+    for datafile in logger.filenames:
+        timings.count('bytes_written', os.path.getsize(datafile))
+    return filename
+
+
+def simulate_session_timed(participantid, expdate, outputdir='.', seed=None):
+    # simulate_session in a worker process, also returning the timings of the session for the main process
+    timings.reset()
+    return simulate_session(participantid, expdate, outputdir, seed), timings.report()
+
+
+def simulate_sessions(n_sessions, outputdir='.', workers=n_workers, seed=None, firstid=1):
+    """
+    Simulates n_sessions sessions with participant ids firstid, firstid + 1, ..., in a pool of worker processes.
+    With a seed, every session gets its own seed derived from it, so the same data are produced on every run.
+    Returns the names of the .csv data files.
+    """
+    os.makedirs(outputdir, exist_ok=True)
+    expdate = datetime.datetime.now().strftime('%H%M_%d%m%Y')
+    participantids = list(range(firstid, firstid + n_sessions))
+    seeds = [None if seed is None else seed * 1000003 + participantid for participantid in participantids]
+    arguments = [participantids, [expdate] * n_sessions, [outputdir] * n_sessions, seeds]
+    if workers == 1 or n_sessions == 1:
+        return list(map(simulate_session, *arguments))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(simulate_session_timed, *arguments, chunksize=max(1, n_sessions // (4 * (workers or os.cpu_count())))))
+    for filename, report in results:
+        timings.merge(report)
+    return [filename for filename, report in results]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the Stroop task experiment')
+    parser.add_argument('--headless', action='store_true', help='simulate participants without window or dialog')
+    parser.add_argument('--sessions', type=int, default=1, help='number of sessions to simulate with --headless (default: 1)')
+    parser.add_argument('--workers', type=int, default=n_workers, help='number of processes simulating sessions (default: all CPU cores)')
+    parser.add_argument('--seed', type=int, help='seed for reproducible simulated sessions')
+    parser.add_argument('--first-id', type=int, default=1, help='participant id of the first simulated session (default: 1)')
+    parser.add_argument('--output-dir', default='.', help='directory for the simulated data files (default: current directory)')
+    parser.add_argument('--build-sequence-bank', action='store_true', help='precompute the bank of trial sequences and exit')
+    parser.add_argument('--timings', metavar='FILE', help='save the per-stage timings and counters as JSON to FILE (- prints them)')
+    args = parser.parse_args()
+
+    if args.build_sequence_bank:
+        with timings.stage('sequence_bank'):
+            bank = load_sequence_bank()
+        print('{} trial sequences of {} trials saved in {}'.format(len(bank), ntrials_total, sequence_bank_filename))
+        if args.timings:
+            timings.write(args.timings, 'stroop_task')
+        raise SystemExit
+
+    if args.headless:
+        filenames = simulate_sessions(args.sessions, args.output_dir, args.workers, args.seed, args.first_id)
+        print('Simulated {} sessions in {}'.format(len(filenames), args.output_dir))
+        if args.timings:
+            timings.write(args.timings, 'stroop_task')
+        raise SystemExit
+
+    from psychopy import visual, core, gui, event
+
+    practice = make_practice()
+
+    #### OUTPUT FILE PREPARATION #####
+    # Preparing dictionary to get input from experimenter to create filename for output file
+    # Expdate: Create a string version of the current year/month/day hour/minute
+    # to ensure each file name will be unique and data will not be overwritten
+    data = {}
+    data['expname'] = 'Stroop'
+    data['expdate'] = datetime.datetime.now().strftime('%H%M_%d%m%Y')
+    data['participantid'] = ''
+
+    # Creating Graphical User Interface to input Participant ID
+    # Use the 'fixed' argument to stop the user changing the 'expname' and 'expdate' parameters, since these should not be changed
+    dlg = gui.DlgFromDict(data, title='Input data', fixed=['expname', 'expdate'],
+                          order=['expname', 'expdate', 'participantid'])
+    if not dlg.OK:
+        print("User cancelled the experiment")
+        core.quit()
+    filename = make_filename(data)
+
+    # Assign this participant a trial sequence from the bank (or make a new one)
+    with timings.stage('sequence'):
+        if sequence_bank_size:
+            sequencenum, sequence = stroop_sequences.assign_sequence(load_sequence_bank(), data['participantid'])
+            stimuli = sequence_stimuli(sequence)
+            print('Participant {} is assigned trial sequence {} of {}'.format(data['participantid'], sequencenum, sequence_bank_filename))
+        else:
+            stimuli = make_stimuli()
+    logger = open_logger(filename)
+
+
+    timingfilename = filename[:-len('.csv')] + '_timing.tsv'
+    timing = []  # One row of timing measures per experimental trial (record_timing)
+    timingcolumns = ['trialnum', 'fixationonset', 'stimulusonset', 'fixationduration', 'fixationerror', 'maxframeinterval',
+                     'droppedframes', 'keylatency']
+
+
+    def save_timing():
+        # Write the timing measures of all trials to the timing file and print a summary of the timing quality
+        if not record_timing or not timing:
+            return
+        with open(timingfilename, 'w') as timingfile:
+            timingfile.write('\t'.join(timingcolumns) + '\n')
+            for row in timing:
+                timingfile.write('{:d}\t{:.6f}\t{:.6f}\t{:.6f}\t{:.6f}\t{:.6f}\t{:d}\t{:.6f}\n'.format(*row))
+        fixationerrors = [abs(row[4]) for row in timing]
+        droppedframes = [row[6] for row in timing]
+        keylatencies = [row[7] for row in timing]
+        print('Timing quality over {} trials (frame period {:.2f} ms):'.format(len(timing), 1000 * frameperiod))
+        print('  Fixation duration error: mean {:.2f} ms, max {:.2f} ms'.format(
+            1000 * sum(fixationerrors) / len(timing), 1000 * max(fixationerrors)))
+        print('  Dropped frames: {} in total, in {} trials'.format(sum(droppedframes), sum(n > 0 for n in droppedframes)))
+        print('  Key latency: mean {:.2f} ms, max {:.2f} ms'.format(1000 * sum(keylatencies) / len(timing), 1000 * max(keylatencies)))
+        print('  Saved to {}'.format(timingfilename))
+
+
+    def close_data_files():
+        # Write all remaining trials, sync the data file(s) to disk and close them
+        logger.close()
+        save_timing()
+        timing.clear()
+
+
+    #### DISPLAY WINDOW PREPARATION #####
+    # Open a full screen window with black background and prepare a text stimulus for later use
+    win = visual.Window(size=screenresolution, units="pix", color=(-1, -1, -1), fullScr=True, allowGUI=False)
+    stim = visual.TextStim(win, "", color=(1.0, 1.0, 1.0), height=instructionheight)
+
+    # For record_timing, measure the frame period of the display and let the window keep track of its frame intervals
+    frameperiod = 1 / 60
+    if record_timing:
+        framerate = win.getActualFrameRate()
+        if framerate:
+            frameperiod = 1 / framerate
+        win.refreshThreshold = droppedframe_threshold * frameperiod
+        win.recordFrameIntervals = True
+    fixationframes = max(1, round(fixationduration / frameperiod))  # Frames of the fixation cross with record_timing
+
+    #### PRE-RENDERING STIMULI #####
+    # Create one text stimulus for every screen of the experiment before the first trial
+    # Stimuli are stored by key: the screen name, ('break', blocknum), or (colourtext, colourname) for Stroop stimuli
+    screens = {}
+    with timings.stage('prerender'):
+        if prerender_stimuli:
+            for key, text in [('instruction', instructiontxt), ('practice', practicetxt), ('correct', feedback_correct_txt),
+                              ('incorrect', feedback_incorrect_txt), ('end', endtxt)]:
+                screens[key] = visual.TextStim(win, text, color=(1.0, 1.0, 1.0), height=instructionheight)
+            for blocknum in range(1, nblocks + 1):
+                screens[('break', blocknum)] = visual.TextStim(win, make_breaktxt(blocknum), color=(1.0, 1.0, 1.0), height=instructionheight)
+            screens['fixation'] = visual.TextStim(win, '+', color=(1.0, 1.0, 1.0), height=fixationheight)
+            for trial in stimuli + practice:
+                key = (trial['colourtext'], trial['colourname'])
+                if key not in screens:
+                    screens[key] = visual.TextStim(win, trial['colourtext'], color=trial['colourvalue'], height=stimheight)
+
+
+    def get_screen(key, text, colour=(1, 1, 1), height=instructionheight):
+        # Returns the stimulus to draw for a screen: the pre-rendered one,
+        # or the shared text stimulus with the new text, colour and height if prerender_stimuli is False
+        if prerender_stimuli:
+            return screens[key]
+        stim.setText(text)
+        stim.setColor(colour)
+        stim.setHeight(height)
+        return stim
+
+
+    drawtimes = []  # Time needed to prepare and draw the stimulus of each experimental trial
+
+    # Display Instructions on Screen
+    get_screen('instruction', instructiontxt).draw()
+    win.flip()
+    event.waitKeys(keyList=['space'])
+
+    # Display Practice block start text on Screen
+    get_screen('practice', practicetxt).draw()
+    win.flip()
+    event.waitKeys(keyList=['space'])
+
+    # Run practice trials
+    for pracnum, practicetrial in enumerate(practice):
+        correct = False
+        while correct == False:
+            # Display fixation cross for fixationduration
+            get_screen('fixation', '+', height=fixationheight).draw()
+            win.flip()
+            core.wait(fixationduration)
+
+            # Display stimulus
+            get_screen((practicetrial['colourtext'], practicetrial['colourname']), practicetrial['colourtext'],
+                       practicetrial['colourvalue'], stimheight).draw()
+            starttime = win.flip()
+
+            # Wait until a valid key press is made
+            # This is either one of the keys in the colourkeys list, or the escape key to terminate the experiment
+            # Other keys are ignored
+            waiting = True
+            response = ''
+            while waiting:
+                keyandtime = event.waitKeys(timeStamped=True)
+                try:
+                    # Check if key is one of the response keys, if so, set response to the name of the corresponding colour
+                    response = colourkeys[keyandtime[0][0]]
+                    waiting = False
+                except:
+                    if keyandtime[0][0] == 'escape':
+                        # Check if key is escape, if so, terminate program
+                        print('Experiment was terminated at practice trial {}'.format(pracnum))
+                        win.close()
+                        close_data_files()  # close data file
+                        core.quit()
+                    else:
+                        # Else return to begin of while loop and keep waiting for a valid key press
+                        pass
+            # For the practice trials, feedback is given
+            # If they respond correctly, they continue to the next trial, otherwise the trial is repeated
+            if response == practicetrial['colourname']:
+                # Correct response
+                get_screen('correct', feedback_correct_txt).draw()
+                win.flip()
+                event.waitKeys(keyList=['space'])
+                correct = True  # This ends the current trial and continues to the next trial
+            else:
+                # Incorrect response key, give feedback, then repeat trial
+                get_screen('incorrect', feedback_incorrect_txt).draw()
+                win.flip()
+                event.waitKeys(keyList=['space'])
+
+            # Run experiment
+    rts = []
+    blocknum = 1
+    for trialnum, stimulus in enumerate(stimuli):
+        # Display break screen at the start of main experiment and then after each n_breaks trials
+        if trialnum % n_breaks == 0:
+            # Make sure the trials of the previous block are safely on disk before the break
+            logger.flush()
+            # Show the break text with the information for the next block
+            get_screen(('break', blocknum), make_breaktxt(blocknum)).draw()
+            blocknum += 1
+            win.flip()
+            event.waitKeys(keyList=['space'])
+
         # Display fixation cross for fixationduration
-        stim.setText('+')
-        stim.setColor((1, 1, 1))
-        stim.setHeight(fixationheight)
-        stim.draw()
-        win.flip()
-        core.wait(fixationduration)
-
-        # Display stimulus
-        stim.setText(practicetrial['colourtext'])
-        stim.setColor(practicetrial['colourvalue'])
-        stim.setHeight(stimheight)
-        stim.draw()
+        # With record_timing it is flipped on every frame, so the window records the interval of each frame
+        get_screen('fixation', '+', height=fixationheight).draw()
+        fixationonset = win.flip()
+        if record_timing:
+            # The interval of the fixation flip itself is the time since the previous trial, so it is not counted
+            intervalsbefore = len(win.frameIntervals)
+            for frame in range(fixationframes - 1):
+                get_screen('fixation', '+', height=fixationheight).draw()
+                win.flip()
+        else:
+            core.wait(fixationduration)
+
+        # Display stimulus, and keep track of the time needed to get it drawn before the flip
+        drawstart = core.getTime()
+        get_screen((stimulus['colourtext'], stimulus['colourname']), stimulus['colourtext'], stimulus['colourvalue'],
+                   stimheight).draw()
+        drawtimes.append(core.getTime() - drawstart)
         starttime = win.flip()
+        if record_timing:
+            # Frame intervals of this trial: between the consecutive flips from fixation onset up to the stimulus flip
+            intervals = win.frameIntervals[intervalsbefore:]
 
         # Wait until a valid key press is made
         # This is either one of the keys in the colourkeys list, or the escape key to terminate the experiment
@@ -165,116 +524,49 @@ for pracnum, practicetrial in enumerate(practice):
         response = ''
         while waiting:
             keyandtime = event.waitKeys(timeStamped=True)
+            keyreceived = core.getTime()
             try:
-                # Check if key is one of the response keys, if so, set response to the name of the corresponding colour
+                # Check if key is one of the response keys, if so, set response to the corresponding colour and continue to calculate rt
                 response = colourkeys[keyandtime[0][0]]
                 waiting = False
             except:
                 if keyandtime[0][0] == 'escape':
                     # Check if key is escape, if so, terminate program
-                    print('Experiment was terminated at practice trial {}'.format(pracnum))
-                    win.close()  # close data file
-                    f.close()
-                    waiting = False
+                    print('Experiment was terminated at trial {}'.format(trialnum))
+                    win.close()
+                    close_data_files()  # close data file
+                    core.quit()
                 else:
                     # Else return to begin of while loop and keep waiting for a valid key press
                     pass
-        # For the practice trials, feedback is given
-        # If they respond correctly, they continue to the next trial, otherwise the trial is repeated
-        if response == practicetrial['colourname']:
-            # Correct response
-            stim.setText(feedback_correct_txt)
-            stim.setColor((1, 1, 1))
-            stim.setHeight(instructionheight)
-            stim.draw()
-            win.flip()
-            event.waitKeys(keyList=['space'])
-            correct = True  # This ends the current trial and continues to the next trial
+        rt = keyandtime[0][1] - starttime
+        if response == stimulus['colourname']:
+            correct = True
         else:
-            # Incorrect response key, give feedback, then repeat trial
-            stim.setText(feedback_incorrect_txt)
-            stim.setColor((1, 1, 1))
-            stim.setHeight(instructionheight)
-            stim.draw()
-            win.flip()
-            event.waitKeys(keyList=['space'])
+            correct = False
+        # Queue the results of this trial for the data file(s)
+        logger.log(trialnum + 1, stimulus['colourtext'], stimulus['colourname'], stimulus['condition'], response, rt, correct)
+        if record_timing:
+            timing.append([trialnum + 1, fixationonset, starttime, starttime - fixationonset,
+                           starttime - fixationonset - fixationduration, max(intervals, default=0.0),
+                           sum(interval > win.refreshThreshold for interval in intervals), keyreceived - keyandtime[0][1]])
 
-        # Run experiment
-rts = []
-blocknum = 1
-for trialnum, stimulus in enumerate(stimuli):
-    # Display break screen at the start of main experiment and then after each n_breaks trials
-    if trialnum % n_breaks == 0:
-        # If there are less trials remaining than n_breaks, set nextblocktrials to the amount of trials left
-        if len(stimuli) - trialnum < n_breaks:
-            nextblocktrials = len(stimuli) - trialnum
-        else:
-            nextblocktrials = n_breaks
-        # Update breaktxt with the information for the next block
-        breaktxt = "Block {} out of {}.\nYou're about to start a  block of {}  trials.\nHave a short break, then press the space bar when you are ready to continue the experiment".format(
-            blocknum, nblocks, nextblocktrials)
-        blocknum += 1
-        stim.setText(breaktxt)
-        stim.setColor((1, 1, 1))  # white
-        stim.setHeight(instructionheight)
-        stim.draw()
-        win.flip()
-        event.waitKeys(keyList=['space'])
-
-    # Display fixation cross for fixationduration
-    stim.setText('+')
-    stim.setColor((1, 1, 1))
-    stim.setHeight(fixationheight)
-    stim.draw()
+    with timings.stage('write'):
+        close_data_files()  # close data file
+    timings.count('sessions')
+    timings.count('trials', len(stimuli))
+
+    # Report how long it took to draw the stimuli, to compare prerender_stimuli = True and False
+    if drawtimes:
+        print('Stimulus draw time per trial (pre-rendered: {}): mean {:.3f} ms, max {:.3f} ms over {} trials'.format(
+            prerender_stimuli, 1000 * sum(drawtimes) / len(drawtimes), 1000 * max(drawtimes), len(drawtimes)))
+
+    # End screen
+    get_screen('end', endtxt).draw()
     win.flip()
-    core.wait(fixationduration)
-
-    # Display stimulus
-    stim.setText(stimulus['colourtext'])
-    stim.setColor(stimulus['colourvalue'])
-    stim.setHeight(stimheight)
-    stim.draw()
-    starttime = win.flip()
-
-    # Wait until a valid key press is made
-    # This is either one of the keys in the colourkeys list, or the escape key to terminate the experiment
-    # Other keys are ignored
-    waiting = True
-    response = ''
-    while waiting:
-        keyandtime = event.waitKeys(timeStamped=True)
-        try:
-            # Check if key is one of the response keys, if so, set response to the corresponding colour and continue to calculate rt
-            response = colourkeys[keyandtime[0][0]]
-            waiting = False
-        except:
-            if keyandtime[0][0] == 'escape':
-                # Check if key is escape, if so, terminate program
-                print('Experiment was terminated at trial {}'.format(trialnum))
-                win.close()
-                f.close()  # close data file
-                waiting = False
-            else:
-                # Else return to begin of while loop and keep waiting for a valid key press
-                pass
-    rt = keyandtime[0][1] - starttime
-    if response == stimulus['colourname']:
-        correct = True
-    else:
-        correct = False
-    # Write results of this trial to data file
-    f.write('{:d},{},{},{},{},{:.6f},{}\n'.format(trialnum + 1, stimulus['colourtext'], stimulus['colourname'],
-                                                  stimulus['condition'], response, rt, correct))
-
-f.close()  # close data file
-
-# End screen
-stim.setText(endtxt)
-stim.setColor((1.0, 1.0, 1.0))
-stim.setHeight(instructionheight)
-stim.draw()
-win.flip()
-event.waitKeys()
-
-# close window
-win.close()
+    event.waitKeys()
+
+    # close window
+    win.close()
+    if args.timings:
+        timings.write(args.timings, 'stroop_task')
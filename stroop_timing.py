@@ -0,0 +1,84 @@
+"""
+Per-stage timers and counters for random_word_stimuli, stroop_task and stroop_analyser
+
+Each script adds up the time spent in its named stages (e.g. reading words.txt, grouping word endings, parsing the
+subject files, computing statistics, rendering the figure) and counts what it processed (files, rows, bytes parsed,
+words kept) in the shared timings object of this module. Run any of the scripts with --timings FILE to save these as
+JSON, or --timings - to print them:
+    {"script": "stroop_analyser", "total_seconds": 1.23,
+     "stages": {"parse": {"seconds": 0.81, "calls": 4}, ...}, "counters": {"files": 1000, "rows": 120000, ...}}
+Stages are timed around whole batches, never around single trials or words, so the timers do not slow the scripts down.
+Work done in worker processes is timed there and added to the timings of the main process (see merge), so the seconds
+of such a stage add up the time of all workers. stroop_benchmark.py collects these timings over scaled datasets.
+"""
+import sys
+import json
+import time
+from contextlib import contextmanager
+
+class Timings:
+    """
+    Total seconds and number of calls per named stage, and named counters, since the timings were created or reset.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.start = time.perf_counter()
+        self.stages = {} #stage name -> [seconds, calls], in the order the stages were first entered
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times the code in a with block as (one call of) the named stage.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds, calls=1):
+        stage = self.stages.setdefault(name, [0.0, 0])
+        stage[0] += seconds
+        stage[1] += calls
+
+    def count(self, name, amount=1):
+        """
+        Adds amount to the named counter.
+        """
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def report(self, script=None):
+        """
+        Returns the timings as a dictionary that can be saved as JSON (see the format above).
+        """
+        report = {'script': script, 'total_seconds': time.perf_counter() - self.start,
+                  'stages': {name: {'seconds': seconds, 'calls': calls} for name, (seconds, calls) in self.stages.items()},
+                  'counters': dict(self.counters)}
+        return report
+
+    def merge(self, report):
+        """
+        Adds the stages and counters of a report (e.g. of a worker process) to these timings.
+        """
+        for name, stage in report['stages'].items():
+            self.add_time(name, stage['seconds'], stage['calls'])
+        for name, amount in report['counters'].items():
+            self.count(name, amount)
+
+    def write(self, filename, script=None):
+        """
+        Saves the report as JSON to filename, or prints it when filename is '-'.
+        """
+        report = self.report(script)
+        if filename == '-':
+            json.dump(report, sys.stdout, indent=1)
+            print()
+        else:
+            with open(filename, 'w') as f:
+                json.dump(report, f, indent=1)
+        return report
+
+timings = Timings() #Timings of this process, shared by all modules
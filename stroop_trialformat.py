@@ -0,0 +1,125 @@
+"""
+Compact binary trial format for stroop_task data
+
+Next to (or instead of) the text .csv file, stroop_task can write each trial as a fixed-width binary record,
+which stroop_analyser can read as arrays (see read_trial_batch) and aggregate without any text parsing.
+
+A file starts with a header:
+    magic 'STRB', format version (uint16), header size in bytes (uint16), record size in bytes (uint16),
+    followed by the comma-separated colour names, padded with zero bytes to the header size.
+Each trial is then stored as one little-endian record (see record_dtype) in which colourtext, colourname and response
+are positions in the colour names of the header (-1 for no response), and condition is a position in conditions.
+"""
+import struct
+import numpy as np
+
+magic = b'STRB'
+format_version = 1
+extension = '.strb'
+conditions = ['congruent', 'incongruent']
+mmap_threshold = 1 << 20  # Files larger than this (in bytes) are memory-mapped by read_trials
+
+header_struct = struct.Struct('<4sHHH')
+record_struct = struct.Struct('<Ibbbbd?')
+record_dtype = np.dtype([('trialnum', '<u4'), ('colourtext', 'i1'), ('colourname', 'i1'), ('condition', 'i1'),
+                         ('response', 'i1'), ('rt', '<f8'), ('correct', '?')])
+assert record_dtype.itemsize == record_struct.size
+
+def encode_header(colours):
+    """
+    Returns the header bytes for a file with the given list of colour names, padded to a multiple of 8 bytes.
+    """
+    names = ','.join(colours).encode('utf-8')
+    header_size = header_struct.size + len(names)
+    header_size += -header_size % 8
+    header = header_struct.pack(magic, format_version, header_size, record_struct.size) + names
+    return header.ljust(header_size, b'\0')
+
+def incomplete_header(data):
+    """
+    True when data, the start of a file, ends within the header of a binary trial file, which happens when a session
+    stopped before its first trials were written to disk (the header is written together with them). Such a file has
+    no trials. Also True for empty data.
+    """
+    if len(data) < header_struct.size:
+        return magic.startswith(data[:len(magic)])
+    file_magic, version, header_size, record_size = header_struct.unpack_from(data)
+    return file_magic == magic and len(data) < header_size
+
+def read_header(f):
+    """
+    Reads the header of an open binary trial file. Returns (colours, header_size).
+    Raises ValueError when the file is not a binary trial file of this version, or ends within its header.
+    """
+    name = getattr(f, 'name', 'file')
+    data = f.read(header_struct.size)
+    if len(data) < header_struct.size:
+        raise ValueError('{} ends within its header'.format(name))
+    file_magic, version, header_size, record_size = header_struct.unpack(data)
+    if file_magic != magic:
+        raise ValueError('{} is not a binary Stroop trial file'.format(name))
+    if version != format_version or record_size != record_struct.size:
+        raise ValueError('Unsupported binary Stroop trial file version {}'.format(version))
+    names = f.read(header_size - header_struct.size)
+    if len(names) < header_size - header_struct.size:
+        raise ValueError('{} ends within its header'.format(name))
+    return names.rstrip(b'\0').decode('utf-8').split(','), header_size
+
+class TrialWriter:
+    """
+    Writes trials of one session to a binary trial file, one fixed-width record per trial.
+    """
+    def __init__(self, filename, colours):
+        self.colours = list(colours)
+        self.codes = {colour: code for code, colour in enumerate(self.colours)}
+        self.f = open(filename, 'wb')
+        self.f.write(encode_header(self.colours))
+
+    def write(self, trialnum, colourtext, colourname, condition, response, rt, correct):
+        self.f.write(record_struct.pack(trialnum, self.codes[colourtext], self.codes[colourname], conditions.index(condition),
+                                        self.codes.get(response, -1), rt, correct))
+
+    def close(self):
+        self.f.close()
+
+def read_trials(filename, mmap=None):
+    """
+    Reads a binary trial file. Returns (colours, records), where records is an array of record_dtype.
+    With mmap=True the records are memory-mapped (read-only), with mmap=False they are read into memory, and by default
+    only files larger than mmap_threshold bytes are memory-mapped, since mapping a small file costs more than reading it.
+    A record that was only partly written (e.g. when the session crashed) is ignored.
+    """
+    with open(filename, 'rb') as f:
+        colours, header_size = read_header(f)
+        file_size = f.seek(0, 2)
+        n_records = (file_size - header_size) // record_dtype.itemsize
+        if mmap is None:
+            mmap = file_size > mmap_threshold
+        if n_records == 0:
+            return colours, np.empty(0, dtype=record_dtype)
+        if not mmap:
+            f.seek(header_size)
+            return colours, np.fromfile(f, dtype=record_dtype, count=n_records)
+    return colours, np.memmap(filename, dtype=record_dtype, mode='r', offset=header_size, shape=(n_records,))
+
+def read_trial_batch(filenames):
+    """
+    Reads the records of several binary trial files into one array, converting the bytes of all files at once instead of
+    making one small array per file, which takes longer than reading them. Returns (records, offsets): the records of
+    file n are records[offsets[n]:offsets[n+1]]. Like read_trials, a record that was only partly written is ignored,
+    and a file that ends within its header (see incomplete_header) has no records, like an empty .csv file.
+    """
+    data = []
+    offsets = np.zeros(len(filenames) + 1, dtype=np.int64)
+    for n, filename in enumerate(filenames):
+        with open(filename, 'rb') as f:
+            content = f.read()
+            if incomplete_header(content):
+                offsets[n+1] = offsets[n]
+                continue
+            f.seek(0)
+            colours, header_size = read_header(f)
+        n_records = (len(content) - header_size) // record_dtype.itemsize
+        data.append(memoryview(content)[header_size:header_size + n_records*record_dtype.itemsize])
+        offsets[n+1] = offsets[n] + n_records
+    return np.frombuffer(b''.join(data), dtype=record_dtype), offsets
@@ -0,0 +1,174 @@
+"""
+Watching a data directory for finished subject files, used by stroop_analyser --watch
+
+A subject file counts as finished once its writer is done with it, so files of sessions that are still running are
+ignored until the session ends. stroop_task writes the data files of a running session under a temporary name (see
+stroop_logger.partial_suffix), which does not match the pattern of data files, and renames them when the session ends,
+so its files are only seen once they are finished. The checks below are for files that other programs write or copy
+into the directory:
+- On Linux, the directory is watched with inotify (through ctypes, no extra packages needed): a file is finished when
+  it is closed after writing, or moved into the directory.
+- Elsewhere, or when inotify is not available, the directory is listed every interval seconds, and a file is finished
+  when its size and modification time have not changed for settle seconds.
+Both watchers also report files that were deleted or moved out of the directory.
+"""
+import os
+import time
+import select
+import struct
+import fnmatch
+import ctypes
+import ctypes.util
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+event_struct = struct.Struct('iIII')
+
+
+class PollingWatcher:
+    """
+    Reports finished files matching pattern in directory by listing it every interval seconds. A file is finished when
+    its size and modification time have not changed for settle seconds.
+    Call scan once to get the files that are already finished when the watch starts, then wait for the next ones.
+    """
+    def __init__(self, directory, pattern, settle=30, interval=2):
+        self.directory = directory
+        self.pattern = pattern
+        self.settle = settle
+        self.interval = interval
+        self.seen = {}  # file -> [(size, mtime), time that signature was first seen, signature that was last reported]
+
+    def files(self):
+        # (size, mtime) of the files in the directory that match the pattern
+        files = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if fnmatch.fnmatch(entry.name, self.pattern) and entry.is_file():
+                    stat = entry.stat()
+                    files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        return files
+
+    def scan(self):
+        """
+        Lists the directory once. Returns (finished, removed): the files that are finished and were not reported (in this
+        state) before, and the reported files that are gone.
+        """
+        now = time.monotonic()
+        files = self.files()
+        finished = []
+        for file, signature in files.items():
+            state = self.seen.setdefault(file, [None, now, None])
+            if signature != state[0]:
+                #The file was changed since the last listing: wait for it to settle, counting from its last modification
+                state[0] = signature
+                state[1] = now - max(time.time() - signature[1]/1e9, 0)
+            if signature != state[2] and now - state[1] >= self.settle:
+                state[2] = signature
+                finished.append(file)
+        removed = [file for file in self.seen if file not in files]
+        for file in removed:
+            del self.seen[file]
+        removed = [file for file in removed if file not in finished]
+        return sorted(finished), sorted(removed)
+
+    def wait(self):
+        """
+        Waits until files are finished or removed. Returns (finished, removed).
+        """
+        while True:
+            time.sleep(self.interval)
+            finished, removed = self.scan()
+            if finished or removed:
+                return finished, removed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(PollingWatcher):
+    """
+    Reports finished files matching pattern in directory from inotify events (Linux): a file is finished when it is
+    closed after writing or moved into the directory. Raises OSError when inotify is not available.
+    Files that were already in the directory are reported by scan, or later by wait once they have settled.
+    """
+    def __init__(self, directory, pattern, settle=30, interval=2):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, 'Cannot watch {}'.format(directory))
+        super().__init__(directory, pattern, settle, interval)
+
+    def events(self, timeout=None):
+        # (mask, file) of the inotify events that arrive within timeout seconds (None waits for the first event)
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        data = b''
+        while True:
+            try:
+                data += os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = event_struct.unpack_from(data, offset)
+            offset += event_struct.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if fnmatch.fnmatch(name, self.pattern):
+                events.append((mask, os.path.join(self.directory, name)))
+        return events
+
+    def wait(self):
+        while True:
+            #Files that were in the directory before the watch started are finished once they have settled
+            timeout = self.interval if any(state[2] is None for state in self.seen.values()) else None
+            finished = set()
+            removed = set()
+            for mask, file in self.events(timeout):
+                if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    finished.add(file)
+                    removed.discard(file)
+                else:
+                    removed.add(file)
+                    finished.discard(file)
+            if timeout is not None:
+                settled, gone = self.scan()
+                finished.update(settled)
+                removed.update(gone)
+            for file in finished:
+                try:
+                    stat = os.stat(file)
+                except OSError:
+                    continue
+                self.seen[file] = [(stat.st_size, stat.st_mtime_ns), time.monotonic(), (stat.st_size, stat.st_mtime_ns)]
+            for file in removed:
+                self.seen.pop(file, None)
+            finished = sorted(file for file in finished if file in self.seen)
+            if finished or removed:
+                return finished, sorted(removed)
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_watcher(directory, pattern, settle=30, interval=2):
+    """
+    Returns an InotifyWatcher for pattern in directory, or a PollingWatcher when inotify is not available.
+    """
+    try:
+        return InotifyWatcher(directory, pattern, settle, interval)
+    except (OSError, AttributeError):
+        return PollingWatcher(directory, pattern, settle, interval)
@@ -0,0 +1,33 @@
+"""
+Shared fixtures of the tests: subject files of simulated sessions, written by stroop_task (see simulate_session).
+Run the tests from the repository directory with: python -m pytest tests
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import stroop_task
+
+n_sessions = 12 #Number of simulated subjects in subject_directory
+
+@pytest.fixture(scope='session')
+def subject_directory(tmp_path_factory):
+    """
+    Directory with the data files of n_sessions seeded simulated sessions, each written as .csv and as binary file.
+    """
+    directory = tmp_path_factory.mktemp('subjects')
+    data_format = stroop_task.data_format
+    stroop_task.data_format = 'both'
+    try:
+        stroop_task.simulate_sessions(n_sessions, str(directory), workers=1, seed=2020)
+    finally:
+        stroop_task.data_format = data_format
+    return directory
+
+@pytest.fixture
+def subject_files(subject_directory):
+    """
+    The .csv data files of subject_directory, sorted by name.
+    """
+    return sorted(str(file) for file in subject_directory.glob('*.csv'))
@@ -0,0 +1,219 @@
+"""
+Tests of stroop_analyser: the table must stay the same as that of the original per-line analysis, whichever way the
+subjects are read (typed columns, binary files, streamed logs, merged partial aggregates, the trial store).
+"""
+import os
+import sys
+import glob
+import shutil
+import subprocess
+import numpy as np
+import pytest
+import stroop_analyser
+
+script_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def original_rows(files):
+    # Table rows (first 7 columns) of the subjects and the group mean, computed like the original stroop_analyser:
+    # one file at a time, line by line
+    rows = []
+    means = []
+    for n, file in enumerate(files):
+        congruent_rts = []
+        incongruent_rts = []
+        con_correct = 0
+        incon_correct = 0
+        with open(file, 'r') as f:
+            f.readline()
+            for line in f.readlines():
+                data = line.strip().split(',')
+                if data[3] == 'congruent':
+                    congruent_rts.append(float(data[5]))
+                    if data[6] == 'True':
+                        con_correct += 1
+                elif data[3] == 'incongruent':
+                    incongruent_rts.append(float(data[5]))
+                    if data[6] == 'True':
+                        incon_correct += 1
+        stats = [np.nanmean(congruent_rts), np.nanstd(congruent_rts), 100*con_correct/len(congruent_rts),
+                 np.nanmean(incongruent_rts), np.nanstd(incongruent_rts), 100*incon_correct/len(incongruent_rts)]
+        means.append(stats)
+        rows.append('{},{:.3f},{:.3f},{:.2f},{:3f},{:.3f},{:.2f}'.format(n+1, *stats))
+    means = np.array(means)
+    rows.append('{},{:.3f},{:.3f},{:.2f},{:3f},{:.3f},{:.2f}'.format('Mean', np.nanmean(means[:, 0]), np.nanstd(means[:, 0]), np.nanmean(means[:, 2]),
+                                                                     np.nanmean(means[:, 3]), np.nanstd(means[:, 3]), np.nanmean(means[:, 5])))
+    return rows
+
+def analyser(workdir, *arguments):
+    # Runs stroop_analyser.py in workdir with the given arguments, table only and without cache or bootstrap
+    command = [sys.executable, os.path.join(script_directory, 'stroop_analyser.py'), '--table-only', '--no-cache', '--bootstrap', '0']
+    subprocess.run(command + list(arguments), cwd=str(workdir), check=True, stdout=subprocess.DEVNULL)
+
+def run_analyser(workdir, *arguments):
+    """
+    Runs stroop_analyser.py in workdir with the given arguments (see analyser) and returns the lines of the table it
+    wrote, split into fields.
+    """
+    analyser(workdir, *arguments)
+    tables = glob.glob(os.path.join(str(workdir), 'strooptask_summary_*.csv'))
+    assert len(tables) == 1
+    with open(tables[0], 'r') as f:
+        return [line.rstrip('\n').split(',') for line in f]
+
+def test_table_matches_original_analysis(subject_files, tmp_path):
+    #Include a subject with missing reaction times, which the original analysis left out of the mean and STD
+    data = tmp_path / 'data'
+    data.mkdir()
+    for file in subject_files:
+        shutil.copy(file, str(data))
+    with open(subject_files[0], 'r') as f:
+        lines = f.readlines()
+    for n in range(1, len(lines), 7):
+        fields = lines[n].split(',')
+        fields[5] = 'nan'
+        lines[n] = ','.join(fields)
+    with open(str(data / 'Stroop_P99_1200_01012020.csv'), 'w') as f:
+        f.writelines(lines)
+
+    table = run_analyser(tmp_path, '--directory', str(data))
+    #The subjects are numbered in the (unsorted) order of glob, like the analyser does
+    expected = original_rows(glob.glob(os.path.join(str(data), '*.csv')))
+    assert [','.join(row[:7]) for row in table[1:]] == expected
+
+def test_typed_columns_match_original_analysis(subject_files):
+    summaries = stroop_analyser.analyse_files(subject_files)
+    rows = [stroop_analyser.table_row(n+1, summary[:6], [], []).rstrip('\n') for n, summary in enumerate(summaries)]
+    assert rows == original_rows(subject_files)[:-1]
+
+def test_stream_matches_nanmean_nanstd(subject_files, tmp_path):
+    #Concatenated log of all subjects with interleaved participants and some missing reaction times
+    rng = np.random.default_rng(4)
+    trials = []
+    for file in subject_files:
+        with open(file, 'r') as f:
+            f.readline()
+            trials += [(os.path.basename(file), line.strip().split(',')) for line in f if line.strip()]
+    trials = [trials[n] for n in rng.permutation(len(trials))]
+    for participant, fields in trials[::11]:
+        fields[5] = 'nan'
+    log = tmp_path / 'log.csv'
+    with open(str(log), 'w') as f:
+        f.write('trialnum,colourtext,colourname,condition,response,rt,correct,participant\n')
+        f.writelines(','.join(fields + [participant]) + '\n' for participant, fields in trials)
+
+    #Small chunks, so the running statistics of many chunks are combined
+    stats = stroop_analyser.stream_trial_log(str(log), chunk_lines=37)
+    summaries = dict(zip(stats.participants, stats.summaries()))
+    assert sorted(summaries) == sorted(os.path.basename(file) for file in subject_files)
+    for participant, summary in summaries.items():
+        for prefix, name in [('con', 'congruent'), ('incon', 'incongruent')]:
+            rts = np.array([float(fields[5]) for pid, fields in trials if pid == participant and fields[3] == name])
+            correct = [fields[6] == 'True' for pid, fields in trials if pid == participant and fields[3] == name]
+            assert np.isclose(getattr(summary, prefix+'_mean'), np.nanmean(rts), rtol=1e-12, atol=0)
+            assert np.isclose(getattr(summary, prefix+'_std'), np.nanstd(rts), rtol=1e-9, atol=0)
+            assert getattr(summary, prefix+'_percentage') == 100*sum(correct)/len(correct)
+            assert getattr(summary, prefix+'_count') == np.count_nonzero(~np.isnan(rts))
+
+def test_merged_partials_match_full_run(subject_files, tmp_path):
+    #Two shards of the subjects, analysed separately and merged, give the table of one run over all subjects
+    shards = [tmp_path / 'shard0', tmp_path / 'shard1']
+    for shard in shards:
+        shard.mkdir()
+    for n, file in enumerate(subject_files):
+        shutil.copy(file, str(shards[n % 2]))
+    full = tmp_path / 'full'
+    full.mkdir()
+    table = run_analyser(full, '--directory', os.path.dirname(subject_files[0]))
+
+    merged = tmp_path / 'merged'
+    merged.mkdir()
+    partials = []
+    for n, shard in enumerate(shards):
+        partials.append(str(tmp_path / 'partial{}.json'.format(n)))
+        analyser(shard, '--directory', str(shard), '--emit-partial', partials[-1])
+    merged_table = run_analyser(merged, '--merge', *partials)
+
+    #Subjects are numbered in a different order, so compare the rows without their numbers
+    assert merged_table[0] == table[0]
+    assert sorted(row[1:] for row in merged_table[1:-1]) == sorted(row[1:] for row in table[1:-1])
+    assert merged_table[-1] == table[-1]
+    with open(glob.glob(str(full / 'strooptask_histograms_*.json'))[0], 'r') as f:
+        histograms = f.read()
+    with open(glob.glob(str(merged / 'strooptask_histograms_*.json'))[0], 'r') as f:
+        assert f.read() == histograms
+
+def test_merge_rejects_subject_files_in_two_partials(subject_files, tmp_path):
+    #A subject file copied into two shards would otherwise be counted twice
+    partials = []
+    for n in range(2):
+        shard = tmp_path / 'shard{}'.format(n)
+        shard.mkdir()
+        for file in subject_files[n:n+2]:
+            shutil.copy(file, str(shard))
+        partials.append(str(tmp_path / 'partial{}.json'.format(n)))
+        analyser(shard, '--directory', str(shard), '--emit-partial', partials[-1])
+    with pytest.raises(ValueError, match=os.path.basename(subject_files[1])):
+        stroop_analyser.merge_partials(partials)
+
+def test_empty_directory_gives_nan_mean(tmp_path):
+    #Without subjects, the table has only the header, a NaN Mean row and NaN confidence intervals
+    data = tmp_path / 'data'
+    data.mkdir()
+    table = run_analyser(tmp_path, '--directory', str(data))
+    assert [row[0] for row in table[1:]] == ['Mean']
+    assert all(field == 'nan' for field in table[1][1:])
+
+def test_trimmed_counts_are_integers(subject_files, tmp_path):
+    #Subject rows have whole numbers of trimmed trials, the Mean row their mean
+    table = run_analyser(tmp_path, '--directory', os.path.dirname(subject_files[0]))
+    columns = [n for n, name in enumerate(table[0]) if name.startswith('NTrimmed')]
+    assert columns
+    for row in table[1:-1]:
+        assert all(row[n].isdigit() for n in columns)
+    assert all('.' in table[-1][n] for n in columns)
+
+def test_bootstrap_does_not_depend_on_subject_order():
+    rng = np.random.default_rng(16)
+    values = rng.normal(0.7, 0.1, (30, 3))
+    values[rng.random((30, 3)) < 0.1] = np.nan
+    lower, upper = stroop_analyser.stroop_stats.bootstrap_mean_ci(values, 1000, 95, seed=1)
+    shuffled_lower, shuffled_upper = stroop_analyser.stroop_stats.bootstrap_mean_ci(values[rng.permutation(30)], 1000, 95, seed=1)
+    assert np.array_equal(lower, shuffled_lower) and np.array_equal(upper, shuffled_upper)
+
+@pytest.mark.parametrize('source', [['--db'], ['--stream', 'log.csv'], ['--merge', 'partial.json']])
+def test_watch_rejects_other_sources(source, tmp_path):
+    command = [sys.executable, os.path.join(script_directory, 'stroop_analyser.py'), '--watch'] + source
+    result = subprocess.run(command, cwd=str(tmp_path), stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    assert result.returncode == 2 and '--watch' in result.stderr
+
+@pytest.mark.parametrize('workers', ['0', '-2'])
+def test_workers_must_be_positive(workers, tmp_path):
+    command = [sys.executable, os.path.join(script_directory, 'stroop_analyser.py'), '--workers', workers]
+    result = subprocess.run(command, cwd=str(tmp_path), stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    assert result.returncode == 2 and '--workers' in result.stderr
+
+def test_binary_files_match_csv_files(subject_files):
+    binary_files = [file[:-len('.csv')] + stroop_analyser.stroop_trialformat.extension for file in subject_files]
+    csv_summaries = np.array(stroop_analyser.analyse_files(subject_files), dtype=np.float64)
+    binary_summaries = np.array(stroop_analyser.analyse_files(binary_files), dtype=np.float64)
+    assert np.array_equal(binary_summaries, csv_summaries, equal_nan=True)
+
+def test_subject_summaries_match_nanmean_nanstd():
+    #Trials of 50 subjects in a random order, with missing reaction times and trials of an unknown condition (-1)
+    rng = np.random.default_rng(6)
+    n_subjects = 50
+    subject = rng.integers(0, n_subjects, 5000)
+    condition = rng.integers(-1, len(stroop_analyser.conditions), 5000).astype(np.int8)
+    rt = rng.exponential(0.6, 5000).round(6)
+    rt[rng.random(5000) < 0.05] = np.nan
+    correct = rng.random(5000) < 0.9
+    summaries = stroop_analyser.summarise_subjects(subject, n_subjects, condition, rt, correct)
+    for n, summary in enumerate(summaries):
+        for code, prefix in enumerate(['con', 'incon']):
+            mask = (subject == n) & (condition == code)
+            assert getattr(summary, prefix+'_mean') == np.nanmean(rt[mask])
+            assert getattr(summary, prefix+'_std') == np.nanstd(rt[mask])
+            assert getattr(summary, prefix+'_percentage') == 100*np.count_nonzero(correct[mask])/np.count_nonzero(mask)
+            assert getattr(summary, prefix+'_trials') == np.count_nonzero(mask)
+            assert getattr(summary, prefix+'_count') == np.count_nonzero(mask & ~np.isnan(rt))
+            assert getattr(summary, prefix+'_sum') == np.nansum(rt[mask])
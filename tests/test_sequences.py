@@ -0,0 +1,72 @@
+"""
+Tests of stroop_sequences: generated trial sequences must have the trials of the design and meet every constraint of
+the trial sequence settings.
+"""
+import random
+from collections import Counter
+import pytest
+import stroop_sequences
+import stroop_task
+
+def incongruent_runs(sequence):
+    # Lengths of the runs of incongruent trials of a sequence
+    runs = [0]
+    for word, drawn in sequence:
+        if word != drawn:
+            runs[-1] += 1
+        elif runs[-1]:
+            runs.append(0)
+    return runs
+
+def check_sequence(sequence, colours, n_congruent, n_incongruent, block_size=None, max_incongruent_run=None, avoid_repeats=True):
+    # Asserts that sequence has the trials of the design and meets the constraints of generate_sequence
+    assert Counter(sequence) == Counter({pair: n for pair, n in stroop_sequences.trial_counts(colours, n_congruent, n_incongruent).items() if n})
+    if max_incongruent_run is not None:
+        assert max(incongruent_runs(sequence)) <= max_incongruent_run
+    if avoid_repeats:
+        for previous, pair in zip(sequence, sequence[1:]):
+            assert pair[0] != previous[0] and pair[1] != previous[1]
+    n_trials = len(sequence)
+    n_congruent_trials = sum(word == drawn for word, drawn in sequence)
+    start = 0
+    for size in stroop_sequences.block_sizes(n_trials, block_size):
+        congruent = sum(word == drawn for word, drawn in sequence[start:start + size])
+        assert abs(congruent - n_congruent_trials*size/n_trials) <= 1
+        start += size
+
+@pytest.mark.parametrize('settings', [
+    stroop_task.sequence_settings(),
+    {'colours': ['red', 'blue', 'green', 'yellow'], 'n_congruent': 15, 'n_incongruent': 5, 'block_size': None,
+     'max_incongruent_run': 2, 'avoid_repeats': True},
+    {'colours': ['red', 'blue', 'green', 'yellow'], 'n_congruent': 6, 'n_incongruent': 2, 'block_size': 10,
+     'max_incongruent_run': 1, 'avoid_repeats': True},
+    {'colours': ['red', 'blue', 'green', 'yellow', 'purple'], 'n_congruent': 3, 'n_incongruent': 1, 'block_size': 9,
+     'max_incongruent_run': 3, 'avoid_repeats': True},
+    {'colours': ['red', 'blue', 'green'], 'n_congruent': 4, 'n_incongruent': 2, 'block_size': 7,
+     'max_incongruent_run': None, 'avoid_repeats': False},
+])
+def test_sequences_meet_constraints(settings):
+    for seed in range(20):
+        check_sequence(stroop_sequences.generate_sequence(rng=random.Random(seed), **settings), **settings)
+
+def test_condition_order_is_uniform():
+    #All 10 orders of 3 congruent and 2 incongruent trials have at most 2 incongruent trials in a row, 6 have at most 1
+    rng = random.Random(17)
+    orders = Counter(tuple(stroop_sequences.condition_order(3, 2, 1, rng)) for n in range(6000))
+    assert len(orders) == 6
+    assert all(abs(n - 1000) < 150 for n in orders.values())
+
+def test_impossible_run_limit_raises():
+    with pytest.raises(ValueError):
+        stroop_sequences.condition_order(1, 5, 2)
+
+def test_bank_is_seeded_and_cached(tmp_path):
+    settings = {'colours': ['red', 'blue', 'green', 'yellow'], 'n_congruent': 6, 'n_incongruent': 2, 'block_size': 7,
+                'max_incongruent_run': 2, 'avoid_repeats': True}
+    filename = str(tmp_path / 'bank.json')
+    bank = stroop_sequences.load_bank(filename, 5, 3, **settings)
+    assert bank == stroop_sequences.build_bank(5, 3, **settings)
+    assert stroop_sequences.load_bank(filename, 5, 3, **settings) == bank
+    for sequence in bank:
+        check_sequence(sequence, **settings)
+    assert stroop_sequences.assign_sequence(bank, '2') == (1, bank[1])
@@ -0,0 +1,43 @@
+"""
+Tests of stroop_stats: the vectorized statistics must give the same values as the NumPy functions per group.
+"""
+import warnings
+import numpy as np
+import stroop_stats
+
+def random_groups(rng, n_groups):
+    # Reaction times in a random number of groups, some without values, with missing values and ties
+    n_values = rng.integers(0, 40*n_groups + 1)
+    values = rng.exponential(0.5, n_values).round(rng.integers(1, 4))
+    values[rng.random(n_values) < 0.1] = np.nan
+    return values, rng.integers(0, n_groups, n_values)
+
+def test_row_statistics_match_numpy():
+    rng = np.random.default_rng(16)
+    for _ in range(200):
+        padded = stroop_stats.pad_ragged(*random_groups(rng, int(rng.integers(1, 10))), n_groups=9)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning) #rows without values
+            median = np.nanmedian(padded, axis=1)
+            percentiles = np.nanpercentile(padded, [0, 12.5, 25, 50, 75, 100], axis=1)
+        assert np.array_equal(stroop_stats.row_medians(padded), median, equal_nan=True)
+        assert np.array_equal(stroop_stats.row_percentiles(padded, [0, 12.5, 25, 50, 75, 100]), percentiles, equal_nan=True)
+
+def test_group_sums_match_nansum():
+    rng = np.random.default_rng(6)
+    for _ in range(200):
+        values, group = random_groups(rng, 9)
+        sums = stroop_stats.group_sums(values, group, 9)
+        assert np.array_equal(sums, [np.nansum(values[group == n]) for n in range(9)])
+
+def test_bootstrap_does_not_depend_on_batch_size(monkeypatch):
+    #The batch size only limits the memory use: smaller batches draw the same resamples, only the rounding of the
+    #matrix products of the resampled means may differ
+    rng = np.random.default_rng(13)
+    values = rng.normal(0.7, 0.1, (200, 4))
+    values[rng.random((200, 4)) < 0.1] = np.nan
+    lower, upper = stroop_stats.bootstrap_mean_ci(values, 2000, 95, seed=1)
+    assert np.all(lower < np.nanmean(values, axis=0)) and np.all(np.nanmean(values, axis=0) < upper)
+    monkeypatch.setattr(stroop_stats, 'bootstrap_batch_elements', 1000)
+    batched_lower, batched_upper = stroop_stats.bootstrap_mean_ci(values, 2000, 95, seed=1)
+    assert np.allclose(lower, batched_lower, rtol=1e-12, atol=0) and np.allclose(upper, batched_upper, rtol=1e-12, atol=0)
@@ -0,0 +1,55 @@
+"""
+Tests of stroop_store: ingesting data directories into the trial store, and analysing the store with stroop_analyser.
+"""
+import os
+import shutil
+import numpy as np
+import stroop_store
+import stroop_analyser
+
+def copy_subjects(subject_files, directory, extension='.csv'):
+    # Copies the data files of the given extension of the subjects to directory, which is created
+    directory.mkdir()
+    for file in subject_files:
+        shutil.copy(file[:-len('.csv')] + extension, str(directory))
+    return directory
+
+def test_ingest_skips_invalid_files(subject_files, tmp_path):
+    data = copy_subjects(subject_files, tmp_path / 'data')
+    with open(str(data / 'strooptask_summary_01012020.csv'), 'w') as f:
+        f.write('ParticipantID,RTCongruent,STDCongruent\n1,0.6,0.1\n')
+    #The binary file of a session that stopped before its first trials were written
+    open(str(data / 'Stroop_P99_1200_01012020.strb'), 'wb').close()
+    connection = stroop_store.connect(str(tmp_path / 'store.sqlite'))
+    added, n_trials, skipped, invalid = stroop_store.ingest(connection, [str(data)])
+    assert added == len(subject_files) and skipped == 0
+    assert sorted(os.path.basename(file) for file, error in invalid) == ['Stroop_P99_1200_01012020.strb', 'strooptask_summary_01012020.csv']
+    assert connection.execute('SELECT COUNT(*) FROM sessions').fetchone()[0] == len(subject_files)
+    #Ingesting again skips the data files, and reports the other file again
+    assert stroop_store.ingest(connection, [str(data)])[:3] == (0, 0, len(subject_files))
+    connection.close()
+
+def test_same_names_in_other_directories_are_kept(subject_files, tmp_path):
+    first = copy_subjects(subject_files, tmp_path / 'first')
+    second = copy_subjects(subject_files, tmp_path / 'second', stroop_analyser.stroop_trialformat.extension)
+    connection = stroop_store.connect(str(tmp_path / 'store.sqlite'))
+    added, n_trials, skipped, invalid = stroop_store.ingest(connection, [str(first), str(second)])
+    assert (added, skipped, invalid) == (2*len(subject_files), 0, [])
+    #A session written in both formats in one directory is still stored once
+    shutil.copy(subject_files[0], str(second))
+    assert stroop_store.ingest(connection, [str(second)])[:3] == (0, 0, len(subject_files))
+    assert connection.execute('SELECT COUNT(*) FROM sessions').fetchone()[0] == 2*len(subject_files)
+    connection.close()
+
+def test_store_matches_files_and_empty_selection(subject_files, tmp_path):
+    database = str(tmp_path / 'store.sqlite')
+    connection = stroop_store.connect(database)
+    stroop_store.ingest(connection, [os.path.dirname(subject_files[0])])
+    connection.close()
+    files, summaries = stroop_analyser.database_summaries(database)
+    expected = dict(zip((os.path.basename(file)[:-len('.csv')] for file in subject_files), stroop_analyser.analyse_files(subject_files)))
+    assert len(summaries) == len(expected)
+    #SQLite sums the reaction times in another order, so the means and STDs may differ in the last digits
+    for file, summary in zip(files, summaries):
+        assert np.allclose(summary[:6], expected[os.path.splitext(file)[0]][:6], rtol=1e-12, atol=0)
+    assert stroop_analyser.database_summaries(database, date_from='2030-01-01') == ([], [])
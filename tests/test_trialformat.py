@@ -0,0 +1,93 @@
+"""
+Tests of the trial logger (stroop_logger) and the binary trial format (stroop_trialformat), on complete sessions and
+on files of sessions that crashed.
+"""
+import math
+import atexit
+import shutil
+import pytest
+import stroop_trialformat
+import stroop_logger
+import stroop_analyser
+
+def binary_file(subject_files, n=0):
+    # The binary trial file of subject n
+    return subject_files[n][:-len('.csv')] + stroop_trialformat.extension
+
+@pytest.mark.parametrize('size', [0, 5, stroop_trialformat.header_struct.size + 2])
+def test_incomplete_header(subject_files, tmp_path, size):
+    #The file of a session that stopped before its first trials (and the buffered header) were written to disk
+    with open(binary_file(subject_files), 'rb') as f:
+        header = f.read(size)
+    file = str(tmp_path / ('Stroop_P1_1200_01012020' + stroop_trialformat.extension))
+    with open(file, 'wb') as f:
+        f.write(header)
+    with open(file, 'rb') as f:
+        assert stroop_trialformat.incomplete_header(f.read())
+        f.seek(0)
+        with pytest.raises(ValueError):
+            stroop_trialformat.read_header(f)
+    with pytest.raises(ValueError):
+        stroop_trialformat.read_trials(file)
+
+    #It has no trials for the analyser, like an empty .csv file, and recovering it empties it
+    records, offsets = stroop_trialformat.read_trial_batch([binary_file(subject_files), file])
+    assert offsets[2] == offsets[1] == len(records)
+    summaries = stroop_analyser.analyse_files([file, binary_file(subject_files)])
+    assert math.isnan(summaries[0].con_mean) and summaries[0].con_trials == 0
+    assert summaries[1] == stroop_analyser.analyse_files([binary_file(subject_files)])[0]
+    assert stroop_logger.recover_session(file) == 0
+    with open(file, 'rb') as f:
+        assert f.read() == b''
+
+def test_other_files_are_not_incomplete_headers(subject_files):
+    with open(subject_files[0], 'rb') as f:
+        assert not stroop_trialformat.incomplete_header(f.read())
+    with open(binary_file(subject_files), 'rb') as f:
+        assert not stroop_trialformat.incomplete_header(f.read())
+
+def test_recover_removes_partial_trial(subject_files, tmp_path):
+    file = str(tmp_path / 'session.strb')
+    shutil.copy(binary_file(subject_files), file)
+    n_trials = len(stroop_trialformat.read_trials(file)[1])
+    with open(file, 'ab') as f:
+        f.write(b'\1'*(stroop_trialformat.record_dtype.itemsize - 3))
+    assert stroop_logger.recover_session(file) == n_trials
+    assert len(stroop_trialformat.read_trials(file)[1]) == n_trials
+
+def test_logger_writes_both_formats_and_refuses_trials_after_close(tmp_path):
+    colours = ['red', 'blue']
+    csv_file = str(tmp_path / 'session.csv')
+    binary = str(tmp_path / 'session.strb')
+    logger = stroop_logger.TrialLogger(csv_file, binary, colours, fsync=False)
+    logger.log(1, 'red', 'red', 'congruent', 'red', 0.5123456, True)
+    logger.log(2, 'red', 'blue', 'incongruent', '', 0.75, False)
+    logger.flush()
+    #Until the session ends, the files only exist under their temporary names
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['session.csv.part', 'session.strb.part']
+    logger.close()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['session.csv', 'session.strb']
+    with pytest.raises(ValueError):
+        logger.log(3, 'blue', 'blue', 'congruent', 'blue', 0.6, True)
+    with open(csv_file, 'r') as f:
+        assert f.read() == stroop_logger.csv_header + '1,red,red,congruent,red,0.512346,True\n2,red,blue,incongruent,,0.750000,False\n'
+    assert stroop_trialformat.read_trials(binary)[1].tolist() == [(1, 0, 0, 0, 0, 0.512346, True), (2, 0, 1, 1, -1, 0.75, False)]
+
+def test_recover_renames_partial_files(subject_files, tmp_path):
+    #The files of a crashed session keep their temporary names until they are recovered
+    csv_file = str(tmp_path / 'session.csv')
+    binary = str(tmp_path / 'session.strb')
+    logger = stroop_logger.TrialLogger(csv_file, binary, ['red', 'blue'], fsync=False)
+    for trialnum in range(1, 4):
+        logger.log(trialnum, 'red', 'blue', 'incongruent', 'blue', 0.5, True)
+    logger.flush()
+    #The process dies while the fourth trial is written, without closing the logger
+    atexit.unregister(logger.close)
+    logger.csv.write('4,red,re')
+    logger.csv.flush()
+    logger.binary.f.write(b'\4\0')
+    logger.binary.f.flush()
+    assert stroop_logger.recover_session(csv_file + stroop_logger.partial_suffix) == 3
+    assert stroop_logger.recover_session(binary + stroop_logger.partial_suffix) == 3
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['session.csv', 'session.strb']
+    assert len(stroop_trialformat.read_trials(binary)[1]) == 3
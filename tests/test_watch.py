@@ -0,0 +1,18 @@
+"""
+Tests of stroop_watch: the data files of a running session must not be reported as finished.
+"""
+import stroop_watch
+import stroop_logger
+
+def test_running_session_is_not_finished(tmp_path):
+    #Even without waiting for files to settle, the files of a session are only reported once its logger is closed
+    csv_file = str(tmp_path / 'Stroop_P1_1200_01012020.csv')
+    logger = stroop_logger.TrialLogger(csv_file, fsync=False)
+    watcher = stroop_watch.PollingWatcher(str(tmp_path), '*.csv', settle=0)
+    assert watcher.scan() == ([], [])
+    logger.log(1, 'red', 'red', 'congruent', 'red', 0.5, True)
+    logger.flush()
+    assert watcher.scan() == ([], [])
+    logger.close()
+    assert watcher.scan() == ([csv_file], [])
+    assert watcher.scan() == ([], [])
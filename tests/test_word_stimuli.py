@@ -0,0 +1,41 @@
+"""
+Tests of random_word_stimuli on a small word file.
+"""
+import pytest
+import random_word_stimuli
+
+words = ['bake', 'cake', 'lake', 'make', 'rake', 'take', 'bold', 'cold', 'fold', 'gold', 'hold', 'mold', 'told',
+         'dust', 'must', 'rust', "it's", 'Lake', 'ant', 'house']
+
+@pytest.fixture
+def word_index(tmp_path):
+    word_file = tmp_path / 'words.txt'
+    word_file.write_text('\n'.join(words) + '\n')
+    return random_word_stimuli.WordIndex(str(word_file))
+
+@pytest.mark.parametrize('replace', [True, False])
+def test_stimulus_lists(word_index, replace):
+    endings, lists = random_word_stimuli.generate_stimulus_lists(5, 4, 2, 5, ["'"], seed=1, replace=replace, index=word_index)
+    assert sorted(endings) == ['ke', 'ld']
+    assert lists.shape == (5, 2)
+    for column, ending in enumerate(endings):
+        assert all(word.endswith(ending) for word in lists[:, column])
+        if not replace:
+            assert len(set(lists[:, column])) == 5
+
+@pytest.mark.parametrize('replace', [True, False])
+def test_stimulus_lists_without_groups(word_index, replace):
+    #No word ending has enough words: every list is empty
+    endings, lists = random_word_stimuli.generate_stimulus_lists(3, 4, 2, 100, ["'"], seed=1, replace=replace, index=word_index)
+    assert endings == []
+    assert lists.shape == (3, 0)
+
+@pytest.mark.parametrize('allowed', [None, 'abcdeklmorst', ''])
+def test_index_matches_filter_words(word_index, allowed):
+    words, groups = random_word_stimuli.filter_words(word_index.filename, range(3, 6), (1, 2, 3), ["'", 'ol'], allowed)
+    for length in range(3, 6):
+        #The index keeps the words sorted by their reversed spelling
+        assert sorted(word_index.words(length, ["'", 'ol'], allowed)) == words[length]
+        for ending_length in (1, 2, 3):
+            index_groups = word_index.groups(length, ending_length, 1, ["'", 'ol'], allowed)
+            assert {ending: sorted(group) for ending, group in index_groups.items()} == groups[(length, ending_length)]